@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Runs --requests group usage reports at the same time in one event loop, as
+# a dashboard would, against the fake Slurm commands in benchmarks/fakeslurm
+# with each command sleeping --delay seconds. Compares calling the blocking
+# query_group_usage from a coroutine with the asyncio API in query/aio.py,
+# printing the wall time and the longest stall of a 10 ms ticker running in
+# the same loop. Requires Python 3.7 or later.
+#
+# Usage: python3 benchmarks/bench_aio.py [--requests N] [--workers N]
+#            [--delay SECONDS] [--jobs N]
+import os
+import time
+import asyncio
+import argparse
+
+from datetime import datetime
+
+from smonitor.query import aio
+from smonitor.query.usage import query_group_usage
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_SLURM_DIR = os.path.join(BENCHMARK_DIR, 'fakeslurm')
+
+BEGIN_DATE = datetime(2019, 3, 1)
+END_DATE = datetime(2019, 6, 1)
+GROUPS_BY = ['account']
+GROUPS_BY_FIELDS = ['su_usage', 'count']
+
+async def blocking_report():
+    return list(query_group_usage(BEGIN_DATE, END_DATE, GROUPS_BY, GROUPS_BY_FIELDS, freq='month'))
+
+async def async_report(pool):
+    return [row async for row in aio.query_group_usage(BEGIN_DATE, END_DATE, GROUPS_BY, GROUPS_BY_FIELDS, freq='month', pool=pool)]
+
+async def run(reports):
+    # Returns the wall time of the reports and the longest gap between ticks.
+    stall = [0.0]
+
+    async def ticker():
+        last = time.time()
+        while True:
+            await asyncio.sleep(0.01)
+            now = time.time()
+            stall[0] = max(stall[0], now - last - 0.01)
+            last = now
+
+    ticks = asyncio.ensure_future(ticker())
+    t = time.time()
+    await asyncio.gather(*reports)
+    elapsed = time.time() - t
+    # Lets the ticker see the last stall.
+    await asyncio.sleep(0.02)
+    ticks.cancel()
+    return elapsed, stall[0]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=8, help="commands run at the same time by the asyncio API")
+    parser.add_argument('--delay', type=float, default=0.5, help="seconds each fake Slurm command sleeps")
+    parser.add_argument('--jobs', type=int, default=2000)
+    args = parser.parse_args()
+
+    os.environ['PATH'] = FAKE_SLURM_DIR + os.pathsep + os.environ.get('PATH', '')
+    os.environ['FAKE_SLURM_DELAY'] = str(args.delay)
+    os.environ['FAKE_SLURM_JOBS'] = str(args.jobs)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    pool = aio.AsyncCommandPool(workers=args.workers)
+    for name, reports in [
+            ('blocking', lambda: [blocking_report() for _ in range(args.requests)]),
+            ('asyncio', lambda: [async_report(pool) for _ in range(args.requests)])]:
+        elapsed, stall = loop.run_until_complete(run(reports()))
+        print('{:>9}: {} reports in {:6.2f} s, longest event loop stall {:6.3f} s'.format(name, args.requests, elapsed, stall))
+
+if __name__ == '__main__':
+    main()
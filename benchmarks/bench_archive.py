@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Compares a group usage report computed from a job archive (`smonitor
+# import`/`export`) with the same report parsing sacct text output, on a
+# synthetic workload served by the fake sacct in benchmarks/fakeslurm. Prints
+# the time to open the archive, the time of each report and the peak
+# resident memory of the process after each step.
+#
+# Usage: python benchmarks/bench_archive.py [--jobs N] [--freq FREQ]
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import resource
+import subprocess
+
+from datetime import datetime
+
+from workload import generate_jobs, format_sacct
+
+from smonitor.store.archive import JobArchive
+from smonitor.query.usage import query_group_usage
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARK_DIR)
+FAKE_SLURM_DIR = os.path.join(BENCHMARK_DIR, 'fakeslurm')
+
+BEGIN_DATE = datetime(2019, 3, 1)
+END_DATE = datetime(2020, 3, 1)
+GROUPS_BY = ['account', 'user']
+GROUPS_BY_FIELDS = ['su_usage', 'core_hour', 'elapsed_raw', 'count']
+
+def write_workload(path, jobs):
+    if os.path.exists(path):
+        return
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        for line in format_sacct(generate_jobs(jobs, BEGIN_DATE, END_DATE)):
+            f.write(line + '\n')
+    os.rename(tmp_path, path)
+
+def max_rss():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=200000)
+    parser.add_argument('--freq', default='month')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'smonitor-bench'))
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.workdir):
+        os.makedirs(args.workdir)
+
+    workload_path = os.path.join(args.workdir, 'sacct-{}-50-500-0.txt'.format(args.jobs))
+    archive_path = os.path.join(args.workdir, 'jobs-{}.archive'.format(args.jobs))
+    write_workload(workload_path, args.jobs)
+    # The archive is written by another process so its memory is not counted.
+    if not os.path.exists(archive_path):
+        subprocess.check_call([sys.executable, '-m', 'smonitor', 'import', '--input', workload_path, '--archive', archive_path], cwd=ROOT)
+
+    os.environ['PATH'] = FAKE_SLURM_DIR + os.pathsep + os.environ.get('PATH', '')
+    os.environ['FAKE_SLURM_WORKLOAD'] = workload_path
+
+    print('{} jobs, sacct output {:.1f} MB, archive {:.1f} MB'.format(args.jobs, os.path.getsize(workload_path) / 1e6, os.path.getsize(archive_path) / 1e6))
+
+    t = time.time()
+    archive = JobArchive(archive_path)
+    print('{:>16}: {:8.3f} s, max RSS {:7.1f} MB'.format('open archive', time.time() - t, max_rss()))
+
+    t = time.time()
+    archived = list(query_group_usage(BEGIN_DATE, END_DATE, GROUPS_BY, GROUPS_BY_FIELDS, freq=args.freq, archive=archive))
+    print('{:>16}: {:8.3f} s, max RSS {:7.1f} MB'.format('archive report', time.time() - t, max_rss()))
+
+    t = time.time()
+    parsed = list(query_group_usage(BEGIN_DATE, END_DATE, GROUPS_BY, GROUPS_BY_FIELDS, freq=args.freq))
+    print('{:>16}: {:8.3f} s, max RSS {:7.1f} MB'.format('sacct report', time.time() - t, max_rss()))
+
+    if archived != parsed:
+        raise SystemExit('archive report differs from sacct report')
+
+if __name__ == '__main__':
+    main()
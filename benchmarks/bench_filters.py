@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Times group usage reports with job filters passed to sacct (see
+# query/filters.py) against the unfiltered report, whose jobs every filter
+# checked in Python would have to parse, on a synthetic workload served by
+# the fake sacct in benchmarks/fakeslurm. Each filtered report is checked
+# against filtering the parsed jobs of the unfiltered query in Python.
+#
+# Usage: python benchmarks/bench_filters.py [--jobs N] [--freq FREQ]
+from __future__ import print_function
+
+import os
+import time
+import argparse
+import tempfile
+
+from datetime import datetime
+
+from workload import generate_jobs, format_sacct
+
+from smonitor.query.filters import JobFilter
+from smonitor.query.usage import query_usage, query_group_usage
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_SLURM_DIR = os.path.join(BENCHMARK_DIR, 'fakeslurm')
+
+BEGIN_DATE = datetime(2019, 3, 1)
+END_DATE = datetime(2020, 3, 1)
+GROUPS_BY = ['account']
+GROUPS_BY_FIELDS = ['su_usage', 'count']
+
+FILTERS = [
+    ('one user', {'users': ['user00042']}),
+    ('ten users', {'users': ['user{:05d}'.format(n) for n in range(10)]}),
+    ('timeouts', {'states': ['TO']}),
+    ('nodes', {'nodelist': ['co-[0000-0009]']}),
+]
+
+def write_workload(path, jobs):
+    if os.path.exists(path):
+        return
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        for line in format_sacct(generate_jobs(jobs, BEGIN_DATE, END_DATE)):
+            f.write(line + '\n')
+    os.rename(tmp_path, path)
+
+def job_ids(filters, freq):
+    # JobIDRaw of every reported job, by span.
+    return [[job['job_id_raw'] for job in output['results']] for output in query_usage(BEGIN_DATE, END_DATE, fields=['job_id_raw', 'user', 'state', 'node_list'], freq=freq, filters=filters)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=200000)
+    parser.add_argument('--freq', default='month')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'smonitor-bench'))
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.workdir):
+        os.makedirs(args.workdir)
+
+    workload_path = os.path.join(args.workdir, 'sacct-{}-50-500-0.txt'.format(args.jobs))
+    write_workload(workload_path, args.jobs)
+    os.environ['PATH'] = FAKE_SLURM_DIR + os.pathsep + os.environ.get('PATH', '')
+    os.environ['FAKE_SLURM_WORKLOAD'] = workload_path
+
+    t = time.time()
+    list(query_group_usage(BEGIN_DATE, END_DATE, GROUPS_BY, GROUPS_BY_FIELDS, freq=args.freq))
+    print('{:>12}: {:8.3f} s'.format('unfiltered', time.time() - t))
+
+    # Jobs of the unfiltered query, filtered in Python.
+    jobs = [output['results'] for output in query_usage(BEGIN_DATE, END_DATE, fields=['job_id_raw', 'user', 'state', 'node_list'], freq=args.freq)]
+
+    for name, filters in FILTERS:
+        t = time.time()
+        list(query_group_usage(BEGIN_DATE, END_DATE, GROUPS_BY, GROUPS_BY_FIELDS, freq=args.freq, filters=filters))
+        elapsed = time.time() - t
+
+        job_filter = JobFilter(filters)
+        expected = [[job['job_id_raw'] for job in results if job_filter.matches(job)] for results in jobs]
+        status = 'ok' if job_ids(filters, args.freq) == expected else 'DIFFERS'
+        print('{:>12}: {:8.3f} s, {:7d} jobs  {}'.format(name, elapsed, sum(len(ids) for ids in expected), status))
+
+if __name__ == '__main__':
+    main()
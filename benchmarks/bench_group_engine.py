@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Compares the python and numpy group-by engines of query_group_usage on a
+# year of synthetic jobs grouped by account,user.
+#
+# Usage: python benchmarks/bench_group_engine.py [--jobs N] [--freq FREQ]
+from __future__ import print_function
+
+import time
+import argparse
+
+from datetime import datetime
+
+from workload import generate_jobs, format_sacct
+
+from smonitor.utils.time import date_range
+from smonitor.utils.string import to_snake_case
+from smonitor.slurm.parser import SlurmParser
+from smonitor.query import usage, vectorized
+
+bucket_jobs = getattr(usage, '__bucket_jobs')
+aggregate_groups_python = getattr(usage, '__aggregate_groups')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=200000)
+    parser.add_argument('--freq', default='month')
+    parser.add_argument('--groups_by', default='account,user')
+    parser.add_argument('--groups_by_fields', default='su_usage,core_hour,elapsed_raw,count')
+    args = parser.parse_args()
+
+    groups_by = args.groups_by.split(',')
+    groups_by_fields = args.groups_by_fields.split(',')
+    begin_date, end_date = datetime(2019, 3, 1), datetime(2020, 3, 1)
+
+    lines = format_sacct(generate_jobs(args.jobs, begin_date, end_date, seed=2))
+    spans, job_table, buckets = bucket_jobs(
+        SlurmParser.iter_output(lines, convert_key=to_snake_case),
+        date_range(begin_date, end_date, freq=args.freq),
+        running_spans=[0]
+    )
+    print('{} jobs, {} {} spans, groups_by {}'.format(len(job_table), len(spans), args.freq, args.groups_by))
+
+    t = time.time()
+    python_results = [aggregate_groups_python(job_table.rows(b), groups_by, groups_by_fields) for b in buckets]
+    print('{:>7}: {:8.3f} s'.format('python', time.time() - t))
+
+    if not vectorized.is_available():
+        print('  numpy: not installed')
+        return
+
+    t = time.time()
+    numpy_results = vectorized.aggregate_groups(job_table, buckets, groups_by, groups_by_fields)
+    print('{:>7}: {:8.3f} s'.format('numpy', time.time() - t))
+
+    assert python_results == numpy_results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Compares peak memory of keeping parsed and preprocessed sacct jobs as one
+# dict per job against a JobTable. Each mode runs in its own process.
+#
+# Usage: python benchmarks/bench_job_table.py [--jobs N]
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import resource
+import subprocess
+
+from workload import generate_jobs, format_sacct
+
+from smonitor.utils.string import to_snake_case
+from smonitor.slurm.parser import SlurmParser
+from smonitor.slurm.table import JobTable
+from smonitor.query import usage
+
+preprocess_job = getattr(usage, '__preprocess_job')
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def run(mode, count):
+    lines = format_sacct(generate_jobs(count, seed=1))
+    records = (preprocess_job(job) for job in SlurmParser.iter_output(lines, convert_key=to_snake_case))
+
+    baseline = max_rss_mb()
+    t = time.time()
+
+    if mode == 'dict':
+        jobs = list(records)
+    else:
+        jobs = JobTable()
+        jobs.extend(records)
+
+    elapsed = time.time() - t
+    print('{:>6}: {:8.1f} MB peak, {:6.2f} s, {} jobs'.format(mode, max_rss_mb() - baseline, elapsed, len(jobs)))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=100000)
+    parser.add_argument('--mode', choices=['dict', 'table'], default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.jobs)
+        return
+
+    for mode in ['dict', 'table']:
+        subprocess.check_call([sys.executable, os.path.abspath(__file__), '--jobs', str(args.jobs), '--mode', mode])
+
+if __name__ == '__main__':
+    main()
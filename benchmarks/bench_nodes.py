@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Times building the cluster CPU bitmap of `smonitor nodes` from parsed
+# `scontrol show job -d` records and computing its occupancy summaries, for a
+# synthetic cluster of --nodes nodes.
+#
+# Usage: python benchmarks/bench_nodes.py [--nodes N] [--repeat N]
+from __future__ import print_function
+
+import time
+import argparse
+
+from workload import generate_cluster, format_scontrol_jobs
+
+from smonitor.config import NODE_SPECIFICATIONS
+from smonitor.query import nodes as query_nodes
+from smonitor.slurm.node import ClusterBitmap, expand_hostlist
+from smonitor.slurm.parser import SlurmParser
+
+def build(node_list, jobs):
+    bitmap = ClusterBitmap(NODE_SPECIFICATIONS)
+    for node in node_list:
+        bitmap.add_node(node['name'], state=node['state'])
+    for job in jobs:
+        if job.get('Nodes') is None:
+            continue
+        hostlists = job['Nodes'] if isinstance(job['Nodes'], list) else [job['Nodes']]
+        cpu_ids = job['CPU_IDs'] if isinstance(job['CPU_IDs'], list) else [job['CPU_IDs']]
+        for hostlist, ids in zip(hostlists, cpu_ids):
+            for name in expand_hostlist(str(hostlist)):
+                bitmap.set_cpus(name, ids)
+    return bitmap
+
+def best_of(repeat, func, *args):
+    times = []
+    for _ in range(repeat):
+        t = time.time()
+        result = func(*args)
+        times.append(time.time() - t)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    node_list, jobs = generate_cluster(args.nodes)
+    text = '\n'.join(format_scontrol_jobs(jobs, details=True))
+
+    elapsed, records = best_of(1, SlurmParser.parse_job_info, text)
+    print('{:>10}: {:8.1f} ms, {} jobs'.format('parse', elapsed * 1000, len(records)))
+
+    elapsed, bitmap = best_of(args.repeat, build, node_list, records)
+    print('{:>10}: {:8.1f} ms, {} nodes'.format('build', elapsed * 1000, len(bitmap)))
+
+    elapsed, _ = best_of(args.repeat, bitmap.summary, query_nodes.is_available)
+    print('{:>10}: {:8.1f} ms'.format('summary', elapsed * 1000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Times query_usage and query_group_usage parsing the output of a single
+# sacct command in 1 and more worker processes (--workers), on a synthetic
+# workload served by the fake sacct in benchmarks/fakeslurm. Outputs of
+# every worker count must equal the sequential output.
+#
+# Usage: python benchmarks/bench_parallel.py [--jobs N] [--workers 1,2,4]
+#            [--freq FREQ]
+from __future__ import print_function
+
+import os
+import time
+import argparse
+import tempfile
+
+from datetime import datetime
+
+from workload import generate_jobs, format_sacct
+
+from smonitor.query.usage import query_usage, query_group_usage
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_SLURM_DIR = os.path.join(BENCHMARK_DIR, 'fakeslurm')
+
+BEGIN_DATE = datetime(2019, 3, 1)
+END_DATE = datetime(2020, 3, 1)
+GROUPS_BY = ['account', 'user']
+GROUPS_BY_FIELDS = ['su_usage', 'core_hour', 'elapsed_raw', 'count']
+USAGE_FIELDS = ['job_id_raw', 'account', 'user', 'end', 'su_usage']
+
+def write_workload(path, jobs):
+    if os.path.exists(path):
+        return
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        for line in format_sacct(generate_jobs(jobs, BEGIN_DATE, END_DATE)):
+            f.write(line + '\n')
+    os.rename(tmp_path, path)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=200000)
+    parser.add_argument('--workers', default='1,2,4', help="comma separated worker counts to time")
+    parser.add_argument('--freq', default='month')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'smonitor-bench'))
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.workdir):
+        os.makedirs(args.workdir)
+
+    workload_path = os.path.join(args.workdir, 'sacct-{}-50-500-0.txt'.format(args.jobs))
+    write_workload(workload_path, args.jobs)
+    os.environ['PATH'] = FAKE_SLURM_DIR + os.pathsep + os.environ.get('PATH', '')
+    os.environ['FAKE_SLURM_WORKLOAD'] = workload_path
+
+    print('{} jobs, {} CPUs'.format(args.jobs, os.sysconf('SC_NPROCESSORS_ONLN') if hasattr(os, 'sysconf') else '?'))
+    expected = {}
+    for workers in [int(w) for w in args.workers.split(',')]:
+        for name, query in [
+                ('group_usage', lambda: list(query_group_usage(BEGIN_DATE, END_DATE, GROUPS_BY, GROUPS_BY_FIELDS, freq=args.freq, workers=workers))),
+                ('usage', lambda: list(query_usage(BEGIN_DATE, END_DATE, fields=USAGE_FIELDS, freq=args.freq, workers=workers)))]:
+            t = time.time()
+            output = query()
+            elapsed = time.time() - t
+
+            expected.setdefault(name, output)
+            status = 'ok' if expected[name] == output else 'DIFFERS'
+            print('{:>12} workers={:<3}: {:8.3f} s, {:9.0f} jobs/s  {}'.format(name, workers, elapsed, args.jobs / elapsed, status))
+
+if __name__ == '__main__':
+    main()
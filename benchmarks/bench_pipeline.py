@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Times every stage of the usage pipeline on a synthetic workload served by
+# the fake Slurm commands in benchmarks/fakeslurm: sacct, parse,
+# preprocessing, span bucketing, grouping, flattening, output in each format,
+# and whole CLI runs. Results are written as JSON so runs can be compared
+# between commits.
+#
+# Usage: python benchmarks/bench_pipeline.py [--jobs N] [--accounts N]
+#            [--users N] [--freq FREQ] [--output FILE] [--compare FILE]
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from datetime import datetime
+
+from workload import generate_jobs, format_sacct
+
+from smonitor.utils.io import generate_output
+from smonitor.utils.data import flattern_nested_dict
+from smonitor.utils.time import date_range
+from smonitor.utils.string import to_snake_case
+from smonitor.slurm.parser import SlurmParser
+from smonitor.slurm.sacct import stream_sacct
+from smonitor.query import usage, vectorized
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARK_DIR)
+FAKE_SLURM_DIR = os.path.join(BENCHMARK_DIR, 'fakeslurm')
+
+preprocess_job = getattr(usage, '__preprocess_job')
+bucket_jobs = getattr(usage, '__bucket_jobs')
+aggregate_groups_python = getattr(usage, '__aggregate_groups')
+
+BEGIN_DATE = datetime(2019, 3, 1)
+END_DATE = datetime(2020, 3, 1)
+GROUPS_BY = ['account', 'user']
+GROUPS_BY_FIELDS = ['su_usage', 'core_hour', 'elapsed_raw', 'count']
+USAGE_FIELDS = ['job_id_raw', 'account', 'user', 'end', 'su_usage']
+
+class Timer(object):
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, func, *args):
+        # Runs func(*args) and records its wall time. Failing stages are
+        # recorded with their error so the remaining stages still run.
+        t = time.time()
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.stages[name] = {'error': '{}: {}'.format(type(e).__name__, e)}
+            print('{:>24}: failed, {}'.format(name, self.stages[name]['error']))
+            return None
+
+        self.stages[name] = {'seconds': time.time() - t}
+        print('{:>24}: {:9.3f} s'.format(name, self.stages[name]['seconds']))
+        return result
+
+def write_workload(path, args):
+    # Generated workloads are kept and reused by later runs with the same
+    # parameters, generating millions of jobs takes a while.
+    if os.path.exists(path):
+        return
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        for line in format_sacct(generate_jobs(args.jobs, BEGIN_DATE, END_DATE, accounts=args.accounts, users=args.users, seed=args.seed)):
+            f.write(line + '\n')
+    os.rename(tmp_path, path)
+
+def read_lines(path):
+    with open(path) as f:
+        return [line.rstrip('\n') for line in f]
+
+def parse(lines):
+    return list(SlurmParser.iter_output(lines, convert_key=to_snake_case))
+
+def preprocess(jobs):
+    return [preprocess_job(job) for job in jobs]
+
+def group_outputs(spans, job_table, buckets, aggregate):
+    results = aggregate(job_table, buckets)
+    return [{
+        'start_date': d.start.strftime('%Y-%m-%dT%H:%M:%S'),
+        'end_date': d.end.strftime('%Y-%m-%dT%H:%M:%S'),
+        'result': results[n],
+        'fields': GROUPS_BY
+    } for n, d in enumerate(spans)]
+
+def usage_outputs(spans, job_table, buckets):
+    return [{
+        'start_date': d.start.strftime('%Y-%m-%dT%H:%M:%S'),
+        'end_date': d.end.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': [{f: job[f] for f in USAGE_FIELDS} for job in job_table.rows(bucket)]
+    } for d, bucket in zip(spans, buckets)]
+
+def flatten(outputs):
+    flatten_output = []
+    for o in outputs:
+        flatten_output += flattern_nested_dict(o)
+    return flatten_output
+
+def write_output(data, output_format, path):
+    # table output always goes to STDOUT, so STDOUT is redirected to path.
+    stdout = sys.stdout
+    with open(path, 'w') as f:
+        sys.stdout = f
+        try:
+            generate_output(data, output_format, path if output_format != 'table' else None)
+        finally:
+            sys.stdout = stdout
+
+def run_cli(args, path):
+    with open(path, 'w') as f:
+        subprocess.check_call([sys.executable, '-m', 'smonitor'] + args, cwd=ROOT, stdout=f)
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    print('')
+    print('compared with {} ({})'.format(baseline_path, baseline.get('commit')))
+    for name in sorted(results['stages']):
+        current = results['stages'][name].get('seconds')
+        previous = baseline['stages'].get(name, {}).get('seconds')
+        if current is None or previous is None:
+            continue
+        print('{:>24}: {:9.3f} s -> {:9.3f} s ({:+.1f}%)'.format(name, previous, current, (current - previous) / previous * 100 if previous else 0))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=100000, help="number of jobs in the workload, e.g. 10000 to 5000000")
+    parser.add_argument('--accounts', type=int, default=50)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--freq', default='day')
+    parser.add_argument('--formats', default='json,csv,table', help="comma separated output formats to time")
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'smonitor-bench'), help="directory for workloads and outputs")
+    parser.add_argument('--output', default=None, help="result file. Default: WORKDIR/results-COMMIT-JOBS.json")
+    parser.add_argument('--compare', default=None, help="result file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.workdir):
+        os.makedirs(args.workdir)
+
+    workload_path = os.path.join(args.workdir, 'sacct-{}-{}-{}-{}.txt'.format(args.jobs, args.accounts, args.users, args.seed))
+
+    os.environ['PATH'] = FAKE_SLURM_DIR + os.pathsep + os.environ.get('PATH', '')
+    os.environ['FAKE_SLURM_WORKLOAD'] = workload_path
+
+    timer = Timer()
+    timer.run('generate_workload', write_workload, workload_path, args)
+
+    lines = read_lines(workload_path)
+    timer.run('sacct', lambda: sum(1 for _ in stream_sacct(BEGIN_DATE, END_DATE)))
+    jobs = timer.run('parse', parse, lines)
+    del lines
+    # Jobs are preprocessed in place, so bucketing does not repeat it.
+    timer.run('preprocess', preprocess, jobs)
+
+    bucketed = timer.run('bucket', bucket_jobs, jobs, date_range(BEGIN_DATE, END_DATE, freq=args.freq), [0])
+    del jobs
+    if bucketed is None:
+        sys.exit('bucketing failed, later stages depend on it')
+    spans, job_table, buckets = bucketed
+
+    groups = timer.run('group_python', group_outputs, spans, job_table, buckets,
+        lambda job_table, buckets: [aggregate_groups_python(job_table.rows(bucket), GROUPS_BY, GROUPS_BY_FIELDS) for bucket in buckets])
+    if vectorized.is_available():
+        timer.run('group_numpy', group_outputs, spans, job_table, buckets,
+            lambda job_table, buckets: vectorized.aggregate_groups(job_table, buckets, GROUPS_BY, GROUPS_BY_FIELDS))
+
+    usages = usage_outputs(spans, job_table, buckets)
+    timer.run('flatten_group', flatten, groups or [])
+    flatten_usages = timer.run('flatten_usage', flatten, usages)
+
+    for output_format in args.formats.split(','):
+        data = usages if output_format == 'json' else flatten_usages
+        timer.run('output_' + output_format, write_output, data, output_format, os.path.join(args.workdir, 'output.' + output_format))
+
+    period = ['--start', BEGIN_DATE.strftime('%Y-%m-%d'), '--end', END_DATE.strftime('%Y-%m-%d'), '--freq', args.freq, '--no-daemon']
+    output_path = os.path.join(args.workdir, 'cli.out')
+    timer.run('cli_group_usage', run_cli, ['usage', '--groups_by', ','.join(GROUPS_BY), '--groups_by_fields', ','.join(GROUPS_BY_FIELDS), '--format', 'json'] + period, output_path)
+    timer.run('cli_usage', run_cli, ['usage', '--fields', ','.join(USAGE_FIELDS), '--format', 'json'] + period, output_path)
+    timer.run('cli_utilization', run_cli, ['utilization', '--format', 'json'] + period, output_path)
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {
+            'jobs': args.jobs,
+            'accounts': args.accounts,
+            'users': args.users,
+            'seed': args.seed,
+            'freq': args.freq,
+        },
+        'stages': timer.stages,
+    }
+
+    output = args.output if args.output else os.path.join(args.workdir, 'results-{}-{}.json'.format(results['commit'], args.jobs))
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+    print('results written to {}'.format(output))
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
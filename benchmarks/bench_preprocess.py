@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Compares the per-row TRES, duration and timestamp parsing previously done
+# in __preprocess_job (split, regex and strptime on every job) against the
+# cached TRES decoder and the fixed-format parsers, on synthetic sacct jobs,
+# and times the whole __preprocess_job.
+#
+# Usage: python benchmarks/bench_preprocess.py [--jobs N]
+from __future__ import print_function
+
+import re
+import time
+import argparse
+
+from datetime import datetime, timedelta
+
+from workload import generate_jobs, format_sacct
+
+from smonitor.query import usage
+from smonitor.slurm import tres
+from smonitor.slurm.parser import SlurmParser
+from smonitor.utils.string import to_snake_case
+from smonitor.utils.time import parse_timestamp, parse_duration
+
+preprocess_job = getattr(usage, '__preprocess_job')
+
+datetime_regex = re.compile(r'((?P<day>\d+)-)?(?P<hr>\d+):(?P<min>\d+):(?P<sec>\d+)')
+
+def conv(val):
+    try:
+        val = float(val)
+        if val.is_integer():
+            return int(val)
+        return val
+    except ValueError:
+        return val
+
+def parse_tres_per_row(val):
+    return {k:conv(v) for k,v in (x.split('=') for x in val.strip().split(','))}
+
+def parse_duration_per_row(val):
+    try:
+        datetime_match = datetime_regex.match(val)
+        return timedelta(
+            days = int(datetime_match.group('day')) if datetime_match.group('day') else 0,
+            hours = int(datetime_match.group('hr')),
+            minutes = int(datetime_match.group('min')),
+            seconds = int(datetime_match.group('sec'))
+        ).total_seconds()
+    except AttributeError:
+        return timedelta(0).total_seconds()
+
+def parse_timestamp_per_row(val):
+    try:
+        return datetime.strptime(val, '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return None
+
+def run(name, func, values):
+    t = time.time()
+    results = [func(v) for v in values]
+    elapsed = time.time() - t
+    print('{:>24}: {:7.3f} s, {:6.2f} us/row'.format(name, elapsed, elapsed / len(values) * 1e6))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=500000)
+    args = parser.parse_args()
+
+    jobs = list(generate_jobs(args.jobs, seed=3))
+    print('{} jobs, {} distinct AllocTRES strings'.format(len(jobs), len(set(job['AllocTRES'] for job in jobs))))
+
+    for field, per_row, fast in [
+        ('AllocTRES', parse_tres_per_row, tres.parse_tres),
+        ('Reserved', parse_duration_per_row, parse_duration),
+        ('End', parse_timestamp_per_row, parse_timestamp),
+    ]:
+        values = [job[field] for job in jobs]
+        tres._tres_cache.clear()
+
+        expected = run('{} per-row'.format(field), per_row, values)
+        results = run('{} fast'.format(field), fast, values)
+        assert results == expected, '{} results differ'.format(field)
+
+    records = list(SlurmParser.iter_output(format_sacct(jobs), convert_key=to_snake_case))
+    tres._tres_cache.clear()
+    run('__preprocess_job', preprocess_job, records)
+
+if __name__ == '__main__':
+    main()
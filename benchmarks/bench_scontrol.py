@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Compares the throughput of SlurmParser.parse_job_info on multi-line
+# `scontrol -d show job` output with the single-pass --oneliner parser, for a
+# synthetic cluster of --nodes nodes and --pending queued jobs. The oneliner
+# parser is timed alone, reading the fields used by `smonitor nodes`, and
+# reading every field.
+#
+# Usage: python benchmarks/bench_scontrol.py [--nodes N] [--pending N] [--repeat N]
+from __future__ import print_function
+
+import time
+import argparse
+
+from workload import generate_cluster, format_scontrol_jobs
+
+from smonitor.slurm.parser import SlurmParser
+
+def best_of(repeat, func, *args):
+    times = []
+    for _ in range(repeat):
+        t = time.time()
+        result = func(*args)
+        times.append(time.time() - t)
+    return min(times), result
+
+def parse_multiline(lines):
+    return SlurmParser.parse_job_info(lines)
+
+def parse_oneliner(lines):
+    return SlurmParser.parse_job_info(lines, oneliner=True)
+
+def parse_oneliner_nodes(lines):
+    records = SlurmParser.parse_job_info(lines, oneliner=True)
+    for job in records:
+        job.get('JobState'), job.get('Nodes'), job.get('CPU_IDs')
+    return records
+
+def parse_oneliner_all(lines):
+    records = SlurmParser.parse_job_info(lines, oneliner=True)
+    for job in records:
+        job.materialize()
+    return records
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=5000)
+    parser.add_argument('--pending', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    _, jobs = generate_cluster(args.nodes, pending=args.pending)
+    multiline = '\n'.join(format_scontrol_jobs(jobs, details=True)).splitlines()
+    oneliner = list(format_scontrol_jobs(jobs, details=True, oneliner=True))
+    size = sum(len(line) + 1 for line in oneliner)
+
+    expected = parse_multiline(multiline)
+    if parse_oneliner_all(oneliner) != expected:
+        raise SystemExit('oneliner records differ from multi-line records')
+
+    print('{} jobs, {:.1f} MB'.format(len(jobs), size / 1e6))
+    for name, func, lines in [
+            ('multi-line', parse_multiline, multiline),
+            ('oneliner', parse_oneliner, oneliner),
+            ('+nodes', parse_oneliner_nodes, oneliner),
+            ('+all', parse_oneliner_all, oneliner)]:
+        elapsed, records = best_of(args.repeat, func, lines)
+        print('{:>10}: {:8.1f} ms, {:9.0f} jobs/s, {:6.1f} MB/s'.format(name, elapsed * 1000, len(records) / elapsed, size / 1e6 / elapsed))
+
+if __name__ == '__main__':
+    main()
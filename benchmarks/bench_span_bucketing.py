@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Compares assigning jobs to report spans with one pass per span (the
+# previous query_usage/query_group_usage loop) against a single pass with
+# SpanIndex, for a day-frequency report over the whole service lifetime.
+#
+# Usage: python benchmarks/bench_span_bucketing.py [--jobs N] [--end YYYY-MM-DD]
+from __future__ import print_function
+
+import os
+import sys
+import time
+import random
+import argparse
+
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smonitor.config import SERVICE_BEGIN_DATE
+from smonitor.utils.time import date_range, SpanIndex
+
+def generate_end_times(count, begin_date, end_date, seed=0):
+    rng = random.Random(seed)
+    length = (end_date - begin_date).total_seconds()
+    return [begin_date + timedelta(seconds=rng.random()*length) for _ in range(count)]
+
+def bucket_per_span(spans, end_times):
+    buckets = []
+    for d in spans:
+        buckets.append([e for e in end_times if d.start <= e < d.end])
+    return buckets
+
+def bucket_single_pass(spans, end_times):
+    span_index = SpanIndex(spans)
+    buckets = [[] for _ in span_index.spans]
+    for e in end_times:
+        n = span_index.find(e)
+        if n is not None:
+            buckets[n].append(e)
+    return buckets
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=50000)
+    parser.add_argument('--end', default=None, help="Report end date. Default: today")
+    args = parser.parse_args()
+
+    begin_date = datetime.strptime(SERVICE_BEGIN_DATE, '%Y-%m-%d')
+    end_date = datetime.strptime(args.end, '%Y-%m-%d') if args.end else datetime.now()
+
+    spans = list(date_range(begin_date, end_date, freq='day'))
+    end_times = generate_end_times(args.jobs, begin_date, end_date)
+
+    print('{} jobs, {} day spans ({} - {})'.format(len(end_times), len(spans), begin_date.date(), end_date.date()))
+
+    results = {}
+    for name, func in [('per-span', bucket_per_span), ('single-pass', bucket_single_pass)]:
+        t = time.time()
+        results[name] = func(spans, end_times)
+        print('{:>12}: {:8.3f} s'.format(name, time.time() - t))
+
+    assert results['per-span'] == results['single-pass']
+
+if __name__ == '__main__':
+    main()
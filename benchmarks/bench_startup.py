@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Measures CLI startup: wall time from process start to the first byte of
+# output for a few commands, and on Python 3.7+ the import time of the
+# smonitor package as reported by `python -X importtime`.
+#
+# Usage: python benchmarks/bench_startup.py [--repeat N] [--top N]
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = [
+    ('python -c pass', ['-c', 'pass']),
+    ('smonitor --help', ['-m', 'smonitor', '--help']),
+    ('smonitor -V', ['-m', 'smonitor', '-V']),
+]
+
+def time_to_first_output(args):
+    t = time.time()
+    process = subprocess.Popen([sys.executable] + args, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    process.stdout.read(1)
+    elapsed = time.time() - t
+    process.communicate()
+    return elapsed
+
+def import_times():
+    # Returns (module, self_us, cumulative_us) for every module imported by
+    # `import smonitor`.
+    output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', 'import smonitor'], cwd=ROOT, stderr=subprocess.STDOUT, universal_newlines=True)
+
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        modules.append((module.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10, help="number of slowest imports to list")
+    args = parser.parse_args()
+
+    for name, command in COMMANDS:
+        times = sorted(time_to_first_output(command) for _ in range(args.repeat))
+        print('{:>16}: {:7.1f} ms median, {:7.1f} ms min'.format(name, times[len(times) // 2] * 1000, times[0] * 1000))
+
+    if sys.version_info < (3, 7):
+        print('-X importtime requires Python 3.7+, skipped')
+        return
+
+    modules = import_times()
+    total = [m for m in modules if m[0] == 'smonitor'][0][2]
+    print('{:>16}: {:7.1f} ms'.format('import smonitor', total / 1000.0))
+    for module, self_us, cumulative_us in sorted(modules, key=lambda m: m[2], reverse=True)[1:args.top + 1]:
+        print('{:>40}: {:7.1f} ms cumulative, {:7.1f} ms self'.format(module, cumulative_us / 1000.0, self_us / 1000.0))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Checks that the --store group report of the README, which ends now, is
+# answered from the daily rollups of the job store (see store/rollup.py),
+# and that the rollups report the same groups, in the same order, as the
+# jobs of the store, on the fake Slurm commands.
+#
+# Usage: python benchmarks/check_rollup.py [--jobs N]
+from __future__ import print_function
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+from datetime import datetime
+
+import smonitor
+
+from smonitor.store.jobs import JobStore
+from smonitor.store.rollup import DailyRollup
+from smonitor.query.usage import query_group_usage
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_SLURM_DIR = os.path.join(BENCHMARK_DIR, 'fakeslurm')
+
+# The --store example of README.md, without --format and --store paths.
+README_ARGS = ['usage', '--groups_by', 'account', '--groups_by_field', 'su_usage,count', '--freq', 'year', '--start', '2019-01-01']
+GROUPS_BY = ['account']
+GROUPS_BY_FIELDS = ['su_usage', 'count']
+
+def group_keys(result, depth):
+    # Group key values of every group, in the order of the result.
+    if depth == 0:
+        return []
+    return [(key, group_keys(value, depth - 1)) for key, value in result.items()]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=5000)
+    args = parser.parse_args()
+
+    os.environ['PATH'] = FAKE_SLURM_DIR + os.pathsep + os.environ.get('PATH', '')
+    os.environ['FAKE_SLURM_JOBS'] = str(args.jobs)
+
+    # Counts the reads of the rollups.
+    reads = []
+    rows = DailyRollup.rows
+    def counted_rows(self, *a, **k):
+        reads.append(a)
+        return rows(self, *a, **k)
+    DailyRollup.rows = counted_rows
+
+    workdir = tempfile.mkdtemp()
+    try:
+        store = os.path.join(workdir, 'jobs.sqlite')
+        output = os.path.join(workdir, 'usage.json')
+
+        sys.argv = ['smonitor'] + README_ARGS + ['--format', 'json', '--store', store, '--output', output]
+        smonitor.main()
+        if not reads:
+            sys.exit('README --store example was not answered from the daily rollups')
+
+        with open(output) as f:
+            cli_results = json.load(f)
+
+        # The period of the README example, up to the end it reported.
+        begin_date = datetime.strptime(cli_results[0]['start_date'], '%Y-%m-%dT%H:%M:%S')
+        end_date = datetime.strptime(cli_results[-1]['end_date'], '%Y-%m-%dT%H:%M:%S')
+
+        del reads[:]
+        rollup_results = list(query_group_usage(begin_date, end_date, GROUPS_BY, GROUPS_BY_FIELDS, freq='year', store=store))
+        if not reads:
+            sys.exit('group report up to {} was not answered from the daily rollups'.format(end_date))
+
+        # A JobStore instance is read job by job.
+        del reads[:]
+        job_store = JobStore(store)
+        try:
+            job_results = list(query_group_usage(begin_date, end_date, GROUPS_BY, GROUPS_BY_FIELDS, freq='year', store=job_store))
+        finally:
+            job_store.close()
+        assert not reads, 'jobs of a JobStore instance were read from the daily rollups'
+    finally:
+        DailyRollup.rows = rows
+        shutil.rmtree(workdir)
+
+    if json.loads(json.dumps(rollup_results)) != cli_results:
+        sys.exit('README --store example differs from the group report up to {}'.format(end_date))
+    if rollup_results != job_results:
+        sys.exit('daily rollups differ from the jobs of the store')
+
+    # Dicts only keep their insertion order from Python 3.7.
+    if sys.version_info >= (3, 7):
+        for a, b in zip(rollup_results, job_results):
+            if group_keys(a['result'], len(GROUPS_BY)) != group_keys(b['result'], len(GROUPS_BY)):
+                sys.exit('{} - {}: daily rollups list groups in another order than the jobs of the store'.format(a['start_date'], a['end_date']))
+
+    print('{} spans up to {} match, {} groups'.format(len(job_results), end_date, sum(len(r['result']) for r in job_results)))
+
+if __name__ == '__main__':
+    main()
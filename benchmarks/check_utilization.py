@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Cross-checks utilization computed from sacct job intervals (--source
+# sacct) against sreport on the fake Slurm commands, with the fake sreport
+# adding up the CPU time of every workload job on its own
+# (FAKE_SLURM_SREPORT=jobs), and times both engines.
+#
+# Usage: python benchmarks/check_utilization.py [--jobs N] [--start YYYY-MM-DD]
+#            [--end YYYY-MM-DD] [--freq FREQ]
+from __future__ import print_function
+
+import os
+import sys
+import time
+import argparse
+
+from datetime import datetime
+
+from workload import node_counts
+
+from smonitor.config import NODE_SPECIFICATIONS
+from smonitor.query.utilization import query_utilization, query_job_utilization
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKE_SLURM_DIR = os.path.join(BENCHMARK_DIR, 'fakeslurm')
+
+def timed(name, func, *args, **kwargs):
+    t = time.time()
+    results = list(func(*args, **kwargs))
+    print('{:>24}: {:8.3f} s, {} spans'.format(name, time.time() - t, len(results)))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=5000)
+    parser.add_argument('--nodes', type=int, default=200)
+    parser.add_argument('--start', default='2019-06-01')
+    parser.add_argument('--end', default='2019-07-01')
+    parser.add_argument('--freq', default='day')
+    parser.add_argument('-j', '--workers', type=int, default=4, help="concurrent sreport commands")
+    args = parser.parse_args()
+
+    os.environ['PATH'] = FAKE_SLURM_DIR + os.pathsep + os.environ.get('PATH', '')
+    os.environ['FAKE_SLURM_JOBS'] = str(args.jobs)
+    os.environ['FAKE_SLURM_NODES'] = str(args.nodes)
+    os.environ['FAKE_SLURM_SREPORT'] = 'jobs'
+
+    begin_date = datetime.strptime(args.start, '%Y-%m-%d')
+    end_date = datetime.strptime(args.end, '%Y-%m-%d')
+    now = datetime.now()
+
+    sreport = timed('sreport ' + args.freq, query_utilization, begin_date, end_date, freq=args.freq, jobs=args.workers)
+    sweep = timed('sacct sweep ' + args.freq, query_job_utilization, begin_date, end_date, freq=args.freq, now=now)
+    timed('sacct sweep hour', query_job_utilization, begin_date, end_date, freq='hour', now=now)
+
+    cpus = sum(NODE_SPECIFICATIONS[t].cpus * count for t, count in node_counts(args.nodes))
+    cpus_sweep = timed('sacct sweep, given cpus', query_job_utilization, begin_date, end_date, freq=args.freq, cpus=cpus, now=now)
+    assert cpus_sweep == sweep, 'capacity from scontrol differs from the node counts of the workload'
+
+    # Both sides round to whole units, so spans may differ by one unit.
+    mismatches = 0
+    for a, b in zip(sreport, sweep):
+        if abs(a['Allocated'] - b['Allocated']) > 1 or a['Reported'] != b['Reported']:
+            mismatches += 1
+            print('{} - {}: sreport {}/{}, sweep {}/{}'.format(a['StartDate'], a['EndDate'], a['Allocated'], a['Reported'], b['Allocated'], b['Reported']))
+
+    if len(sreport) != len(sweep) or mismatches:
+        sys.exit('{} of {} spans differ'.format(mismatches, len(sreport)))
+    print('{} spans match, utilization {:.3f} to {:.3f}'.format(len(sweep), min(r['Utilization'] for r in sweep), max(r['Utilization'] for r in sweep)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Shared option parsing and workload settings of the fake Slurm commands.
+#
+# The commands read their workload from environment variables:
+#
+#   FAKE_SLURM_WORKLOAD   file with `sacct -P` output of every SACCT_FIELDS
+#                         column, e.g. written by bench_pipeline.py. When not
+#                         set, sacct generates FAKE_SLURM_JOBS jobs.
+#   FAKE_SLURM_JOBS       number of generated jobs. Default: 10000
+#   FAKE_SLURM_ACCOUNTS   number of accounts. Default: 50
+#   FAKE_SLURM_USERS      number of users. Default: 500
+#   FAKE_SLURM_SEED       random seed. Default: 0
+#   FAKE_SLURM_NODES      number of nodes seen by scontrol. Default: 200
+#   FAKE_SLURM_PENDING    number of pending jobs seen by scontrol and squeue.
+#                         Default: 0
+#   FAKE_SLURM_PERIOD     seconds after which scontrol and squeue show a
+#                         changed snapshot, with a different ~5% of the jobs
+#                         finished and of the nodes draining, to exercise
+#                         `smonitor watch`. Default: 0, never changes
+#   FAKE_SLURM_SREPORT    'jobs' to report the CPU time allocated to the
+#                         sacct workload as sreport Allocated, for checking
+#                         utilization computed from jobs. Default: '', a
+#                         made up Allocated
+#   FAKE_SLURM_CLUSTERS   comma separated names of the clusters that can be
+#                         queried with -M, the first one being the local
+#                         cluster. Each cluster has its own workload and
+#                         nodes, generated with FAKE_SLURM_SEED plus its
+#                         index; FAKE_SLURM_WORKLOAD only replaces the
+#                         workload of the local cluster. Default: tara
+#   FAKE_SLURM_DELAY      seconds each command sleeps, to mimic slurmdbd
+#                         latency. Default: 0
+#   FAKE_SLURM_LOG        append every command line to this file
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from workload import generate_jobs, format_sacct, generate_cluster
+
+# Fixed "now" of the workload so every run sees the same jobs.
+WORKLOAD_BEGIN_DATE = datetime(2019, 2, 21)
+WORKLOAD_END_DATE = datetime(2020, 3, 1)
+
+def setting(name, default):
+    return type(default)(os.environ.get('FAKE_SLURM_' + name, default))
+
+def start_command(name):
+    log = os.environ.get('FAKE_SLURM_LOG')
+    if log:
+        with open(log, 'a') as f:
+            f.write(' '.join([name] + sys.argv[1:]) + '\n')
+
+    time.sleep(setting('DELAY', 0.0))
+
+def parse_options(args, flags_with_value=()):
+    # Returns ({option: value}, [positional arguments]) for options written
+    # as --name=value, name=value or a flag from flags_with_value followed by
+    # its value.
+    options = {}
+    positional = []
+
+    n = 0
+    while n < len(args):
+        arg = args[n]
+        if arg in flags_with_value:
+            options[arg] = args[n + 1]
+            n += 1
+        elif arg.startswith('--') and '=' in arg:
+            key, value = arg[2:].split('=', 1)
+            options[key] = value
+        elif '=' in arg:
+            key, value = arg.split('=', 1)
+            options[key.lower()] = value
+        else:
+            positional.append(arg)
+        n += 1
+
+    return options, positional
+
+def cluster_names():
+    return setting('CLUSTERS', 'tara').split(',')
+
+def cluster_index(name=None):
+    # Index of cluster `name` in FAKE_SLURM_CLUSTERS, 0 for the local cluster.
+    if name is None:
+        return 0
+    if name not in cluster_names():
+        sys.exit('{}: error: cluster {} not found'.format(os.path.basename(sys.argv[0]), name))
+    return cluster_names().index(name)
+
+def workload_lines(name=None):
+    # `sacct -P` lines of every job of cluster `name`, the header first.
+    n = cluster_index(name)
+    path = os.environ.get('FAKE_SLURM_WORKLOAD')
+    if path and n == 0:
+        with open(path) as f:
+            for line in f:
+                yield line.rstrip('\n')
+        return
+
+    jobs = generate_jobs(
+        setting('JOBS', 10000),
+        WORKLOAD_BEGIN_DATE,
+        WORKLOAD_END_DATE,
+        accounts=setting('ACCOUNTS', 50),
+        users=setting('USERS', 500),
+        seed=setting('SEED', 0) + n,
+        cluster=cluster_names()[n]
+    )
+    for line in format_sacct(jobs):
+        yield line
+
+def cluster(name=None):
+    nodes, jobs = generate_cluster(setting('NODES', 200), pending=setting('PENDING', 0), seed=setting('SEED', 0) + cluster_index(name), now=WORKLOAD_END_DATE)
+
+    period = setting('PERIOD', 0.0)
+    if period:
+        tick = int(time.time() // period)
+        jobs = [job for job in jobs if (job['job_id'] * 7 + tick) % 20]
+        for n, node in enumerate(nodes):
+            if (n * 7 + tick) % 20 == 0:
+                node['state'] = 'DRAIN'
+
+    return nodes, jobs
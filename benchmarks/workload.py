@@ -0,0 +1,369 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Synthetic sacct, sreport and scontrol output for benchmarks and the fake
+# Slurm commands in benchmarks/fakeslurm.
+from __future__ import print_function
+
+import os
+import re
+import sys
+import zlib
+import random
+
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smonitor.config import SERVICE_BEGIN_DATE, NODE_SPECIFICATIONS
+from smonitor.slurm.sacct import SACCT_FIELDS, SACCT_DATETIME_FORMAT
+
+PARTITIONS = [('devel', 40), ('compute', 40), ('memory', 192), ('gpu', 40)]
+STATES = ['COMPLETED']*12 + ['FAILED', 'TIMEOUT', 'CANCELLED by 1234', 'OUT_OF_MEMORY']
+
+# Node type used by each partition, see config.NODE_SPECIFICATIONS.
+PARTITION_NODE_TYPES = {'devel': 'tara-c', 'compute': 'tara-c', 'memory': 'tara-m', 'gpu': 'tara-g'}
+
+# Share of the nodes of a cluster for each node type.
+NODE_TYPE_SHARES = [('tara-c', 0.8), ('tara-m', 0.1), ('tara-g', 0.1)]
+
+squeue_format_regex = re.compile(r'%(\.?\d*)([A-Za-z])')
+
+SREPORT_UNITS = {'sec': ('Seconds', 60), 'min': ('Minutes', 1), 'hour': ('Hours', 1/60.0)}
+
+def format_duration(seconds):
+    days, seconds = divmod(int(seconds), 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days:
+        return '{}-{:02d}:{:02d}:{:02d}'.format(days, hours, minutes, seconds)
+    return '{:02d}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+def format_tres(cpus, mem, nodes, gpus=0):
+    tres = 'billing={},cpu={},mem={}M,node={}'.format(cpus, cpus, mem, nodes)
+    if gpus:
+        tres = tres + ',gres/gpu={}'.format(gpus)
+    return tres
+
+def generate_jobs(count, begin_date=None, end_date=None, accounts=50, users=500, seed=0, now=None, cluster='tara'):
+    """Yields `count` sacct records (dicts of SACCT_FIELDS to strings) ending
+    between begin_date and end_date, in JobIDRaw order.
+
+    Jobs with a start or end time after `now` are reported as PENDING or
+    RUNNING.
+    """
+    rng = random.Random(seed)
+    begin_date = begin_date if begin_date else datetime.strptime(SERVICE_BEGIN_DATE, '%Y-%m-%d')
+    end_date = end_date if end_date else datetime.now()
+    now = now if now else end_date
+    length = (end_date - begin_date).total_seconds()
+
+    submits = sorted(rng.random()*length for _ in range(count))
+
+    for n, submit_offset in enumerate(submits):
+        submit = begin_date + timedelta(seconds=submit_offset)
+        start = submit + timedelta(seconds=int(rng.expovariate(1/600.0)))
+        elapsed = int(rng.expovariate(1/7200.0)) + 1
+        end = start + timedelta(seconds=elapsed)
+
+        partition, cpus_per_node = rng.choice(PARTITIONS)
+        nodes = rng.choice([1]*8 + [2, 4])
+        cpus = nodes * rng.choice([1, 4, cpus_per_node])
+        mem = cpus * 4600
+        gpus = 2*nodes if partition == 'gpu' else 0
+
+        account = 'proj{:04d}'.format(rng.randint(0, accounts-1))
+        user = 'user{:05d}'.format(rng.randint(0, users-1))
+        state = rng.choice(STATES)
+
+        if start > now:
+            state = 'PENDING'
+            elapsed = 0
+        elif end > now:
+            state = 'RUNNING'
+            elapsed = int((now - start).total_seconds())
+
+        job_id = str(100000 + n)
+
+        record = {f:'' for f in SACCT_FIELDS}
+        record.update({
+            'Account': account,
+            'AllocCPUS': str(cpus),
+            'AllocNodes': str(nodes),
+            'AllocTRES': format_tres(cpus, mem, nodes, gpus),
+            'Cluster': cluster,
+            'CPUTime': format_duration(elapsed*cpus),
+            'CPUTimeRAW': str(elapsed*cpus),
+            'DerivedExitCode': '0:0',
+            'Elapsed': format_duration(elapsed),
+            'ElapsedRaw': str(elapsed),
+            'Eligible': submit.strftime(SACCT_DATETIME_FORMAT),
+            'End': end.strftime(SACCT_DATETIME_FORMAT) if state not in ['PENDING', 'RUNNING'] else 'Unknown',
+            'ExitCode': '0:0',
+            'GID': str(2000 + int(account[4:])),
+            'Group': account,
+            'JobID': job_id,
+            'JobIDRaw': job_id,
+            'JobName': 'job{}'.format(rng.randint(0, 200)),
+            'NCPUS': str(cpus),
+            'NNodes': str(nodes),
+            'NodeList': '{}-{:04d}'.format(partition[:2], rng.randint(0, 400)),
+            'Partition': partition,
+            'Priority': str(rng.randint(1000, 20000)),
+            'QOS': 'normal',
+            'QOSRAW': '1',
+            'ReqCPUFreq': 'Unknown',
+            'ReqCPUS': str(cpus),
+            'ReqMem': '{}Mc'.format(4600),
+            'ReqNodes': str(nodes),
+            'ReqTRES': format_tres(cpus, mem, nodes, gpus),
+            'Reserved': format_duration((start - submit).total_seconds()),
+            'ResvCPU': format_duration((start - submit).total_seconds()*cpus),
+            'ResvCPURAW': str(int((start - submit).total_seconds())*cpus),
+            'Start': start.strftime(SACCT_DATETIME_FORMAT) if state != 'PENDING' else 'Unknown',
+            'State': state,
+            'Submit': submit.strftime(SACCT_DATETIME_FORMAT),
+            'Suspended': '00:00:00',
+            'Timelimit': '5-00:00:00',
+            'TimelimitRaw': '7200',
+            'UID': str(10000 + int(user[4:])),
+            'User': user,
+            'WCKey': '',
+            'WorkDir': '/home/{}/run{}'.format(user, rng.randint(0, 50)),
+        })
+        yield record
+
+def format_sacct(jobs, fields=SACCT_FIELDS):
+    # Yields `sacct -P` output lines for the given records.
+    yield '|'.join(fields)
+    for job in jobs:
+        yield '|'.join(job[f] for f in fields)
+
+def format_sreport(begin_date, end_date, time_unit='min', cpus=4400, cluster='tara', allocated_seconds=None):
+    # Returns `sreport -P cluster utilization` output for a cluster of `cpus`
+    # CPUs, including the banner. Allocated time is allocated_seconds CPU
+    # seconds, or derived from the period so repeated calls return the same
+    # numbers.
+    unit_name, per_minute = SREPORT_UNITS[time_unit]
+    reported = int(cpus * (end_date - begin_date).total_seconds() / 60 * per_minute)
+    if allocated_seconds is None:
+        allocated = int(reported * (zlib.crc32('{}{}'.format(begin_date, end_date).encode()) % 1000) / 1000.0)
+    else:
+        allocated = int(round(allocated_seconds / 60 * per_minute))
+
+    return '\n'.join([
+        '-'*80,
+        'Cluster Utilization {} - {}'.format(begin_date.strftime(SACCT_DATETIME_FORMAT), (end_date - timedelta(seconds=1)).strftime(SACCT_DATETIME_FORMAT)),
+        'Usage reported in CPU {}'.format(unit_name),
+        '-'*80,
+        'Cluster|Allocated|Down|PLND Down|Idle|Reserved|Reported',
+        '{}|{}|0|0|{}|0|{}'.format(cluster, allocated, reported - allocated, reported),
+    ]) + '\n'
+
+def job_cpu_seconds(lines, begin_date, end_date, now):
+    # Allocated CPU seconds between begin_date and end_date of the jobs in
+    # `sacct -P` output lines, adding up every job on its own.
+    lines = iter(lines)
+    headers = next(lines).split('|')
+    start_column, end_column, cpus_column = [headers.index(f) for f in ['Start', 'End', 'AllocCPUS']]
+
+    total = 0.0
+    for line in lines:
+        record = line.split('|')
+        if record[start_column] == 'Unknown':
+            continue
+        start = max(datetime.strptime(record[start_column], SACCT_DATETIME_FORMAT), begin_date)
+        end = min(datetime.strptime(record[end_column], SACCT_DATETIME_FORMAT) if record[end_column] != 'Unknown' else now, end_date)
+        if end > start:
+            total += (end - start).total_seconds() * int(record[cpus_column])
+    return total
+
+def format_hostlist(names):
+    # Compresses node names of one node type, e.g. ['tara-c-001', 'tara-c-002']
+    # to 'tara-c-[001-002]'.
+    if len(names) == 1:
+        return names[0]
+
+    prefix = names[0].rsplit('-', 1)[0]
+    numbers = sorted(int(name.rsplit('-', 1)[1]) for name in names)
+    return '{}-[{}]'.format(prefix, format_ranges(numbers, width=3))
+
+def format_ranges(numbers, width=0):
+    # [0, 1, 2, 3, 8] -> '0-3,8'
+    ranges = []
+    for n in sorted(numbers):
+        if ranges and ranges[-1][1] == n - 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+
+    return ','.join('{:0{w}d}'.format(a, w=width) if a == b else '{:0{w}d}-{:0{w}d}'.format(a, b, w=width) for a, b in ranges)
+
+def node_counts(nodes):
+    # Returns [(node type, number of nodes)] for a cluster of `nodes` nodes.
+    return [(node_type, max(1, int(nodes * share))) for node_type, share in NODE_TYPE_SHARES]
+
+def generate_cluster(nodes=200, pending=0, seed=0, now=None):
+    """Returns (nodes, jobs) describing a cluster snapshot for scontrol.
+
+    nodes is a list of dicts with 'name', 'type', 'partition', 'state' and
+    'cpu_alloc'. jobs is a list of dicts with the job fields and 'allocation',
+    a list of (node name, CPU IDs) pairs. Running jobs are packed onto nodes
+    in random blocks so CPU_IDs lists are fragmented like on a busy cluster.
+    `pending` extra jobs wait in the queue.
+    """
+    rng = random.Random(seed)
+    now = now if now else datetime(2020, 3, 1)
+
+    node_list = []
+    for node_type, count in node_counts(nodes):
+        spec = NODE_SPECIFICATIONS[node_type]
+        partition = [p for p, t in sorted(PARTITION_NODE_TYPES.items()) if t == node_type][0]
+        for n in range(count):
+            node_list.append({'name': '{}-{:03d}'.format(node_type, n + 1), 'type': node_type, 'partition': partition, 'cpus': spec.cpus})
+
+    jobs = []
+    open_jobs = []
+    for node in node_list:
+        state = rng.choice(['ALLOCATED']*6 + ['MIXED']*3 + ['IDLE']*2 + ['DOWN*', 'DRAIN'])
+        cpu = 0
+        while state not in ['IDLE', 'DOWN*', 'DRAIN'] and cpu < node['cpus']:
+            block = min(rng.choice([1, 2, 4, 8, 10, 20]), node['cpus'] - cpu)
+            if state == 'MIXED' and rng.random() < 0.3:
+                cpu += block
+                continue
+
+            # Continue an open multi-block job on this node or start a new one.
+            if open_jobs and rng.random() < 0.3:
+                job = rng.choice(open_jobs)
+            else:
+                job = {'partition': node['partition'], 'allocation': []}
+                jobs.append(job)
+                open_jobs = (open_jobs + [job])[-4:]
+
+            if job['allocation'] and job['allocation'][-1][0] == node['name']:
+                job['allocation'][-1][1].extend(range(cpu, cpu + block))
+            else:
+                job['allocation'].append((node['name'], list(range(cpu, cpu + block))))
+            cpu += block
+
+        node['state'] = state
+        node['cpu_alloc'] = []
+
+    jobs += [{'partition': rng.choice(sorted(PARTITION_NODE_TYPES)), 'allocation': []} for _ in range(pending)]
+
+    nodes_by_name = {node['name']: node for node in node_list}
+    for n, job in enumerate(jobs):
+        running = bool(job['allocation'])
+        cpus = sum(len(cpu_ids) for _, cpu_ids in job['allocation']) if running else rng.choice([1, 4, 40, 80])
+        start = now - timedelta(seconds=rng.randint(60, 4*86400))
+        submit = start - timedelta(seconds=int(rng.expovariate(1/600.0)))
+
+        for name, cpu_ids in job['allocation']:
+            nodes_by_name[name]['cpu_alloc'].extend(cpu_ids)
+
+        job.update({
+            'job_id': 500000 + n,
+            'name': 'job{}'.format(rng.randint(0, 200)),
+            'user': 'user{:05d}'.format(rng.randint(0, 499)),
+            'account': 'proj{:04d}'.format(rng.randint(0, 49)),
+            'state': 'RUNNING' if running else 'PENDING',
+            'reason': 'None' if running else rng.choice(['Priority', 'Resources', 'QOSMaxCpuPerUserLimit']),
+            'cpus': cpus,
+            'submit': submit,
+            'start': start if running else None,
+        })
+
+    return node_list, jobs
+
+def job_node_list(job):
+    # Hostlist of the nodes allocated to a generate_cluster job.
+    node_names = [name for name, _ in job['allocation']]
+    return ','.join(format_hostlist([n for n in node_names if n.startswith(t + '-')]) for t, _ in NODE_TYPE_SHARES if any(n.startswith(t + '-') for n in node_names))
+
+def format_squeue(jobs, output_format, now=None):
+    # Yields `squeue -h -o FORMAT` lines for the %i %P %j %u %a %T %S %M %D %C
+    # %R and %N specifiers. Field widths, e.g. %.18i, are ignored.
+    now = now if now else datetime(2020, 3, 1)
+    for job in jobs:
+        running = job['state'] == 'RUNNING'
+        values = {
+            'i': str(job['job_id']),
+            'P': job['partition'],
+            'j': job['name'],
+            'u': job['user'],
+            'a': job['account'],
+            'T': job['state'],
+            'S': job['start'].strftime(SACCT_DATETIME_FORMAT) if running else 'N/A',
+            'M': format_duration((now - job['start']).total_seconds()) if running else '0:00',
+            'D': str(max(1, len(job['allocation']))),
+            'C': str(job['cpus']),
+            'R': job_node_list(job) if running else '({})'.format(job['reason']),
+            'N': job_node_list(job),
+        }
+        yield squeue_format_regex.sub(lambda m: values.get(m.group(2), ''), output_format)
+
+def format_scontrol_jobs(jobs, details=False, oneliner=False, now=None):
+    # Yields `scontrol show job [-d] [-o]` records, one string per job.
+    now = now if now else datetime(2020, 3, 1)
+    for job in jobs:
+        running = job['state'] == 'RUNNING'
+        node_names = [name for name, _ in job['allocation']]
+        node_list = job_node_list(job)
+
+        lines = [
+            'JobId={} JobName={}'.format(job['job_id'], job['name']),
+            'UserId={0}({1}) GroupId={2}({3}) MCS_label=N/A'.format(job['user'], 10000 + int(job['user'][4:]), job['account'], 2000 + int(job['account'][4:])),
+            'Priority={} Nice=0 Account={} QOS=normal'.format(1000 + job['job_id'] % 19000, job['account']),
+            'JobState={} Reason={} Dependency=(null)'.format(job['state'], job['reason']),
+            'Requeue=1 Restarts=0 BatchFlag=1 Reboot=0 ExitCode=0:0',
+            'RunTime={} TimeLimit=5-00:00:00 TimeMin=N/A'.format(format_duration((now - job['start']).total_seconds()) if running else '00:00:00'),
+            'SubmitTime={} EligibleTime={}'.format(job['submit'].strftime(SACCT_DATETIME_FORMAT), job['submit'].strftime(SACCT_DATETIME_FORMAT)),
+            'StartTime={} EndTime={} Deadline=N/A'.format(
+                job['start'].strftime(SACCT_DATETIME_FORMAT) if running else 'Unknown',
+                (job['start'] + timedelta(days=5)).strftime(SACCT_DATETIME_FORMAT) if running else 'Unknown'),
+            'Partition={} AllocNode:Sid=tara-frontend-01:{}'.format(job['partition'], job['job_id'] % 30000),
+            'ReqNodeList=(null) ExcNodeList=(null)',
+            'NodeList={}'.format(node_list if running else '(null)'),
+            'BatchHost={}'.format(node_names[0] if running else '(null)'),
+            'NumNodes={} NumCPUs={} NumTasks={} CPUs/Task=1 ReqB:S:C:T=0:0:*:*'.format(max(1, len(node_names)), job['cpus'], job['cpus']),
+            'TRES=cpu={},mem={}M,node={},billing={}'.format(job['cpus'], job['cpus']*4600, max(1, len(node_names)), job['cpus']),
+            'Socks/Node=* NtasksPerN:B:S:C=0:0:*:* CoreSpec=*',
+        ]
+        if details and running:
+            for name, cpu_ids in job['allocation']:
+                lines.append('  Nodes={} CPU_IDs={} Mem={} GRES_IDX='.format(name, format_ranges(cpu_ids), len(cpu_ids)*4600))
+        lines += [
+            'MinCPUsNode=1 MinMemoryCPU=4600M MinTmpDiskNode=0',
+            'Features=(null) DelayBoot=00:00:00',
+            'Command=/home/{0}/run.sh'.format(job['user']),
+            'WorkDir=/home/{0}'.format(job['user']),
+            'StdOut=/home/{0}/slurm-{1}.out'.format(job['user'], job['job_id']),
+        ]
+
+        if oneliner:
+            yield ' '.join(line.strip() for line in lines)
+        else:
+            yield '\n'.join([lines[0]] + ['   ' + line for line in lines[1:]]) + '\n'
+
+def format_scontrol_nodes(nodes, oneliner=False):
+    # Yields `scontrol show node [-o]` records, one string per node.
+    for node in nodes:
+        spec = NODE_SPECIFICATIONS[node['type']]
+        lines = [
+            'NodeName={} Arch=x86_64 CoresPerSocket={}'.format(node['name'], spec.cpus_per_socket),
+            'CPUAlloc={} CPUTot={} CPULoad={:.2f}'.format(len(node['cpu_alloc']), spec.cpus, len(node['cpu_alloc']) * 0.97),
+            'AvailableFeatures={0} ActiveFeatures={0}'.format(node['type']),
+            'Gres={}'.format('gpu:2' if node['type'] == 'tara-g' else '(null)'),
+            'NodeAddr={0} NodeHostName={0} Version=18.08'.format(node['name']),
+            'OS=Linux 3.10.0-957.el7.x86_64 #1 SMP Thu Nov 8 23:39:32 UTC 2018',
+            'RealMemory={} AllocMem={} FreeMem=N/A Sockets={} Boards=1'.format(spec.cpus*4600, len(node['cpu_alloc'])*4600, spec.sockets),
+            'State={} ThreadsPerCore=1 TmpDisk=0 Weight=1 Owner=N/A MCS_label=N/A'.format(node['state']),
+            'Partitions={}'.format(node['partition']),
+            'CfgTRES=cpu={},mem={}M,billing={}'.format(spec.cpus, spec.cpus*4600, spec.cpus),
+            'AllocTRES={}'.format('cpu={}'.format(len(node['cpu_alloc'])) if node['cpu_alloc'] else ''),
+        ]
+
+        if oneliner:
+            yield ' '.join(line.strip() for line in lines)
+        else:
+            yield '\n'.join([lines[0]] + ['   ' + line for line in lines[1:]]) + '\n'
@@ -1,3 +1,7 @@
+import os
+
+from datetime import timedelta
+
 from .slurm.node import NodeSpecification
 
 __version__ = '0.1.0dev1'
@@ -11,3 +15,47 @@ NODE_SPECIFICATIONS = {
     'tara-m':NodeSpecification(8, 24),
     'tara-g':NodeSpecification(2, 20)
 }
+
+# Node specifications of the other clusters sharing slurmdbd, queried with
+# --clusters, by cluster name. Clusters not listed use NODE_SPECIFICATIONS.
+CLUSTER_NODE_SPECIFICATIONS = {}
+
+DATA_DIR = os.path.join(os.path.expanduser('~'), '.smonitor')
+
+# Local job store used by `usage --store`. Each sync re-reads jobs that ended
+# up to JOB_STORE_SYNC_OVERLAP before the newest stored end time to cover
+# records that reached slurmdbd late.
+JOB_STORE_PATH = os.path.join(DATA_DIR, 'jobs.sqlite')
+JOB_STORE_SYNC_OVERLAP = timedelta(hours=1)
+
+# Columnar job archive written by `smonitor export` and `smonitor import` and
+# read by `usage --archive`.
+JOB_ARCHIVE_PATH = os.path.join(DATA_DIR, 'jobs.archive')
+
+# Persistent cache of sreport output used by `utilization`. Output fetched at
+# least SREPORT_CACHE_DELAY after its span ended is reused, as slurmdbd rolls
+# up usage some time after the fact. The least recently used entries are
+# evicted beyond SREPORT_CACHE_SIZE. Both also apply to the in-memory cache
+# of the smonitor daemon.
+SREPORT_CACHE_PATH = os.path.join(DATA_DIR, 'sreport.sqlite')
+SREPORT_CACHE_DELAY = timedelta(hours=1)
+SREPORT_CACHE_SIZE = 100000
+
+# Unix domain socket of the smonitor daemon (`smonitor serve`) and how often
+# the daemon refreshes its jobs and open sreport spans, in seconds.
+SERVER_SOCKET_PATH = os.path.join(DATA_DIR, 'smonitor.sock')
+SERVER_REFRESH_INTERVAL = 300
+
+# Slurm commands run at the same time by all queries of the asyncio API
+# (smonitor.query.aio) in a process, and seconds before one is killed. None
+# waits for commands without a limit.
+ASYNC_COMMAND_WORKERS = 8
+ASYNC_COMMAND_TIMEOUT = None
+
+# `sinfo --version` output shown by `smonitor -V`, cached until sinfo changes.
+SLURM_VERSION_CACHE_PATH = os.path.join(DATA_DIR, 'slurm_version')
+
+# `smonitor watch` polls every WATCH_INTERVAL seconds, doubling the interval
+# up to WATCH_MAX_INTERVAL while nothing changes.
+WATCH_INTERVAL = 10
+WATCH_MAX_INTERVAL = 120
@@ -0,0 +1,153 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# asyncio variants of query_usage, query_group_usage and query_utilization
+# for applications embedding smonitor, e.g. web dashboards. Requires Python
+# 3.7 or later; the rest of smonitor never imports this module.
+#
+#   async for row in aio.query_group_usage(begin, end, ['account'], ['su_usage']):
+#       ...
+#
+# Slurm commands run as asyncio subprocesses through an AsyncCommandPool, by
+# default one shared by every query of the process, so a slow sacct does not
+# block the event loop and the number of commands hitting slurmdbd stays
+# bounded. Parsing and aggregation reuse the blocking implementation and run
+# in an executor. Cancelling a query, or closing its generator, kills its
+# running commands.
+import os
+import time
+import asyncio
+import subprocess
+
+from datetime import datetime
+
+from ..config import ASYNC_COMMAND_WORKERS, ASYNC_COMMAND_TIMEOUT
+from ..utils.profile import profiler
+from ..slurm.sacct import sacct_command
+from ..slurm.sreport import sreport_command
+from . import usage, utilization
+from .filters import plan_job_filters
+
+class AsyncCommandPool(object):
+    """Runs commands as asyncio subprocesses, at most `workers` at a time.
+
+    A command running longer than `timeout` seconds is killed and raises
+    subprocess.TimeoutExpired. The pool can be shared between queries and
+    event loops.
+    """
+
+    def __init__(self, workers=ASYNC_COMMAND_WORKERS, timeout=ASYNC_COMMAND_TIMEOUT):
+        if workers < 1:
+            raise ValueError('workers must be at least 1')
+
+        self.workers = workers
+        self.timeout = timeout
+        self._loop = None
+        self._semaphore = None
+
+    def __semaphore(self):
+        # asyncio primitives belong to the loop they were first used in.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._semaphore
+
+    async def check_output(self, command):
+        async with self.__semaphore():
+            start = time.time()
+            process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE)
+            try:
+                output, _ = await asyncio.wait_for(process.communicate(), self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise subprocess.TimeoutExpired(command, self.timeout)
+            except BaseException:
+                # Cancelled, e.g. the consumer of the query went away. The
+                # killed command is reaped before the error propagates.
+                if process.returncode is None:
+                    process.kill()
+                    await asyncio.shield(process.wait())
+                raise
+
+        output = output.decode('utf-8', 'replace')
+        if profiler.enabled:
+            profiler.add(os.path.basename(command[0]), calls=1, bytes=len(output))
+            profiler.record_command(command, start, time.time() - start, len(output), lines=output.count('\n'), returncode=process.returncode)
+
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command, output)
+
+        return output
+
+_default_pool = None
+
+def default_pool():
+    # Pool used by queries without a `pool`, shared by the whole process.
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = AsyncCommandPool()
+    return _default_pool
+
+async def __rows(executor, query, *args, **kwargs):
+    # Runs a blocking query generator to completion in executor.
+    return await asyncio.get_running_loop().run_in_executor(executor, lambda: list(query(*args, **kwargs)))
+
+async def query_usage(begin_date, end_date, account_list=None, fields=None, freq=None, filters=None, pool=None, executor=None):
+    # Like usage.query_usage. executor: runs the parsing, by default the
+    # default executor of the loop.
+    pool = pool if pool else default_pool()
+    sacct_filters, _ = plan_job_filters(filters)
+    command = sacct_command(begin_date, end_date, fields=usage.plan_sacct_fields(fields=fields), account_list=account_list, filters=sacct_filters)
+    sacct_output = (await pool.check_output(command)).splitlines()
+
+    for row in await __rows(executor, usage.query_usage, begin_date, end_date, account_list=account_list, fields=fields, freq=freq, sacct_output=sacct_output, filters=filters):
+        yield row
+
+async def query_group_usage(begin_date, end_date, groups_by, groups_by_fields, account_list=None, freq=None, engine='python', filters=None, pool=None, executor=None):
+    # Like usage.query_group_usage. executor: see query_usage.
+    pool = pool if pool else default_pool()
+    sacct_filters, _ = plan_job_filters(filters)
+    command = sacct_command(begin_date, end_date, fields=usage.plan_sacct_fields(groups_by=groups_by, groups_by_fields=groups_by_fields), account_list=account_list, noconvert=True, filters=sacct_filters)
+    sacct_output = (await pool.check_output(command)).splitlines()
+
+    for row in await __rows(executor, usage.query_group_usage, begin_date, end_date, groups_by, groups_by_fields, account_list=account_list, freq=freq, engine=engine, sacct_output=sacct_output, filters=filters):
+        yield row
+
+async def query_utilization(begin_date, end_date, freq='day', time_unit='min', cache=None, clusters=None, pool=None):
+    # Like utilization.query_utilization. The sreport commands of all spans
+    # are started at once and limited by the pool; rows are yielded in span
+    # order as they arrive.
+    if freq and freq not in ['day', 'week', 'month', 'year']:
+        raise ValueError('Invalid freq value')
+
+    if time_unit not in ['sec', 'min', 'hour']:
+        raise ValueError('Invalid time_unit value')
+
+    pool = pool if pool else default_pool()
+    clusters = clusters if clusters else [None]
+
+    async def sreport(d, cluster):
+        sreport_output = cache.get(d, time_unit, cluster) if cache is not None else None
+        if sreport_output is None:
+            fetched = datetime.now()
+            sreport_output = await pool.check_output(sreport_command(d.start, d.end, time_unit, cluster=cluster))
+            if cache is not None:
+                cache.set(d, time_unit, sreport_output, fetched=fetched, cluster=cluster)
+        return sreport_output
+
+    spans = [(d, cluster) for d in utilization.utilization_spans(begin_date, end_date, freq) for cluster in clusters]
+    tasks = [asyncio.ensure_future(sreport(d, cluster)) for d, cluster in spans]
+    try:
+        for (d, _), task in zip(spans, tasks):
+            row = utilization.sreport_utilization(d, await task, time_unit)
+            if row is not None:
+                yield row
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # Retrieved so failures of spans that were not reached are
+                # not logged as unhandled.
+                task.exception()
@@ -0,0 +1,131 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Job filters of usage queries, e.g. {'users': ['alice'], 'states':
+# ['COMPLETED']}. plan_job_filters decides which filters sacct applies, see
+# SACCT_FILTER_OPTIONS in slurm/sacct.py, and which are checked on the
+# parsed jobs.
+from __future__ import print_function
+
+from ..slurm.node import expand_hostlist
+
+# Filters in the order they are applied, with the job field each one reads.
+JOB_FILTERS = ['users', 'partitions', 'states', 'qos', 'nodelist']
+JOB_FILTER_FIELDS = {
+    'users': 'user',
+    'partitions': 'partition',
+    'states': 'state',
+    'qos': 'qos',
+    'nodelist': 'node_list',
+}
+
+# Job states as written by sacct, by the abbreviations sacct also accepts.
+JOB_STATES = {
+    'BF': 'BOOT_FAIL',
+    'CA': 'CANCELLED',
+    'CD': 'COMPLETED',
+    'DL': 'DEADLINE',
+    'F': 'FAILED',
+    'NF': 'NODE_FAIL',
+    'OOM': 'OUT_OF_MEMORY',
+    'PD': 'PENDING',
+    'PR': 'PREEMPTED',
+    'R': 'RUNNING',
+    'RQ': 'REQUEUED',
+    'RS': 'RESIZING',
+    'RV': 'REVOKED',
+    'S': 'SUSPENDED',
+    'TO': 'TIMEOUT',
+}
+
+# Filters sacct applies exactly. `sacct -s` selects jobs that were in a state
+# at any time of the period, e.g. -s RUNNING also returns jobs that completed
+# later, so the final state of the jobs it returns is checked again.
+EXACT_SACCT_FILTERS = ['users', 'partitions', 'qos', 'nodelist']
+
+def _job_state(state):
+    state = state.upper()
+    if state in JOB_STATES:
+        return JOB_STATES[state]
+    if state not in JOB_STATES.values():
+        raise ValueError('Invalid job state {}'.format(state))
+    return state
+
+class JobFilter(object):
+    """Selects jobs by user, partition, final state, QOS and the nodes they
+    ran on. filters maps names of JOB_FILTERS to lists of accepted values; a
+    job is selected when it matches every filter. States may be abbreviated
+    as with `sacct -s` and nodelist is a list of Slurm hostlists.
+    """
+
+    def __init__(self, filters=None):
+        self.filters = {}
+        for name, values in (filters or {}).items():
+            if name not in JOB_FILTERS:
+                raise ValueError('Invalid job filter {}'.format(name))
+            if not values:
+                continue
+            if name == 'states':
+                values = [_job_state(v) for v in values]
+            self.filters[name] = list(values)
+
+        # Node names of the nodelist filter, and of the node lists of jobs.
+        self._nodes = set(n for hostlist in self.filters.get('nodelist', []) for n in expand_hostlist(hostlist))
+        self._hostlists = {}
+
+    def __len__(self):
+        return len(self.filters)
+
+    def __getstate__(self):
+        # Expanded node lists of jobs are not sent to worker processes.
+        state = dict(self.__dict__)
+        state['_hostlists'] = {}
+        return state
+
+    def __runs_on(self, hostlist):
+        matched = self._hostlists.get(hostlist)
+        if matched is None:
+            matched = self._hostlists[hostlist] = not self._nodes.isdisjoint(expand_hostlist(hostlist))
+        return matched
+
+    def value_matches(self, name, val):
+        # Whether the value of the job field of filter `name` is accepted.
+        values = self.filters[name]
+        if name == 'partitions':
+            # Pending jobs submitted to several partitions list all of them.
+            return any(p in values for p in str(val).split(','))
+        if name == 'states':
+            # e.g. 'CANCELLED by 1234'
+            return str(val).split(' ')[0] in values
+        if name == 'nodelist':
+            return self.__runs_on(str(val))
+        return val in values
+
+    def predicates(self):
+        # Yields (job field, value predicate) of every filter.
+        for name in JOB_FILTERS:
+            if name in self.filters:
+                yield JOB_FILTER_FIELDS[name], (lambda val, name=name: self.value_matches(name, val))
+
+    def matches(self, job):
+        for field, match in self.predicates():
+            if not match(job[field]):
+                return False
+        return True
+
+    def apply(self, jobs):
+        return (job for job in jobs if self.matches(job))
+
+def plan_job_filters(filters, pushdown=True):
+    # Returns the filters sacct applies, as {name: values} for sacct_command,
+    # and a JobFilter of the predicates left to check on the parsed jobs, or
+    # None. Without pushdown, e.g. for jobs read from a job store, every
+    # filter is checked on the jobs.
+    job_filter = filters if isinstance(filters, JobFilter) else JobFilter(filters)
+    if not job_filter:
+        return {}, None
+    if not pushdown:
+        return {}, job_filter
+
+    sacct_filters = dict(job_filter.filters)
+    residual = dict((name, values) for name, values in job_filter.filters.items() if name not in EXACT_SACCT_FILTERS)
+    return sacct_filters, JobFilter(residual) if residual else None
@@ -0,0 +1,95 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+from collections import OrderedDict
+
+from ..config import NODE_SPECIFICATIONS, CLUSTER_NODE_SPECIFICATIONS
+from ..slurm.node import NodeSpecification, ClusterBitmap, expand_hostlist
+from ..slurm.scontrol import query_scontrol
+from ..utils.process import CommandPool
+from ..utils.profile import stage
+
+# Node states that can run jobs. Flags such as DRAIN and a trailing '*' for
+# non-responding nodes make a node unavailable.
+AVAILABLE_NODE_STATES = ['IDLE', 'MIXED', 'ALLOCATED', 'COMPLETING']
+
+def is_available(state):
+    if not state or '*' in state or '~' in state:
+        return False
+    base_state = state.split('+')
+    return base_state[0] in AVAILABLE_NODE_STATES and not any(flag.startswith('DRAIN') for flag in base_state[1:])
+
+def __as_list(val):
+    return val if isinstance(val, list) else [val]
+
+def cluster_specifications(cluster=None):
+    # Returns the node specifications of cluster, see
+    # CLUSTER_NODE_SPECIFICATIONS.
+    return CLUSTER_NODE_SPECIFICATIONS.get(cluster, NODE_SPECIFICATIONS) if cluster else NODE_SPECIFICATIONS
+
+def __add_nodes(bitmap, cluster=None):
+    # Adds every node of `scontrol show node` to bitmap.
+    for node in query_scontrol('node', oneliner=True, cluster=cluster):
+        sockets = node.get('Sockets')
+        cpus = node.get('CPUTot')
+        spec = NodeSpecification(sockets, cpus // sockets) if sockets and cpus else None
+        bitmap.add_node(str(node['NodeName']), spec=spec, state=node.get('State'))
+
+def cluster_cpus(specifications=None, cluster=None):
+    # Returns the number of CPUs of the cluster, the nodes of `scontrol show
+    # node` sized by their node specification.
+    bitmap = ClusterBitmap(specifications if specifications else cluster_specifications(cluster))
+    __add_nodes(bitmap, cluster=cluster)
+    return sum(spec.cpus for spec in bitmap.specs)
+
+def build_bitmap(specifications=None, cluster=None):
+    # Builds the CPU bitmap of every node from `scontrol show node` and the
+    # CPU_IDs of running jobs in `scontrol show job -d`. Jobs in other states,
+    # e.g. COMPLETING or SUSPENDED, may still list nodes but are not counted.
+    bitmap = ClusterBitmap(specifications if specifications else cluster_specifications(cluster))
+    __add_nodes(bitmap, cluster=cluster)
+
+    jobs = query_scontrol('job', details=True, oneliner=True, cluster=cluster)
+    with stage('bitmap'):
+        for job in jobs:
+            if job.get('JobState') != 'RUNNING' or job.get('Nodes') is None:
+                continue
+            for hostlist, cpu_ids in zip(__as_list(job['Nodes']), __as_list(job.get('CPU_IDs'))):
+                for name in expand_hostlist(str(hostlist)):
+                    bitmap.set_cpus(name, cpu_ids)
+
+    return bitmap
+
+def __node_results(bitmap, per_node):
+    with stage('bitmap'):
+        if not per_node:
+            return bitmap.summary(available=is_available)
+
+        results = []
+        for n, name in enumerate(bitmap.names):
+            alloc = sum(bitmap.socket_usage(n))
+            results.append(OrderedDict([
+                ('node', name),
+                ('node_type', bitmap.node_types[n]),
+                ('state', bitmap.states[n]),
+                ('alloc_cpus', alloc),
+                ('free_cpus', bitmap.specs[n].cpus - alloc),
+                ('socket_alloc_cpus', ','.join(str(x) for x in bitmap.socket_usage(n))),
+                ('bitmap', bitmap.node_information(name).bitmask_str())
+            ]))
+        return results
+
+def query_nodes(per_node=False, specifications=None, clusters=None):
+    # Yields CPU occupancy and fragmentation per node type, or with per_node
+    # the allocated CPUs of each node and socket. With clusters, the clusters
+    # are queried concurrently and each row starts with its cluster.
+    if not clusters:
+        for result in __node_results(build_bitmap(specifications), per_node):
+            yield result
+        return
+
+    command_pool = CommandPool(len(clusters))
+    for cluster, bitmap in command_pool.imap(lambda cluster: build_bitmap(specifications, cluster=cluster), clusters):
+        for result in __node_results(bitmap, per_node):
+            yield OrderedDict([('cluster', cluster)] + list(result.items()))
@@ -4,217 +4,316 @@ from __future__ import print_function
 
 import subprocess
 import math
-import re
+
+from array import array
 
 from pprint import pprint
+from copy import deepcopy
 from collections import namedtuple, OrderedDict
 from datetime import timedelta, datetime
 
-from ..utils.time import date_range
+from ..utils.time import date_range, SpanIndex, parse_timestamp, parse_duration
 from ..utils.string import to_snake_case
 from ..slurm.parser import SlurmParser
-
-SACCT_FIELDS=[
-    'Account',
-    'AdminComment',
-    'AllocCPUS',
-    'AllocGRES',
-    'AllocNodes',
-    'AllocTRES',
-    'AssocID',
-    'AveCPU',
-    'AveCPUFreq',
-    'AveDiskRead',
-    'AveDiskWrite',
-    'AvePages',
-    'AveRSS',
-    'AveVMSize',
-    'BlockID',
-    'Cluster',
-    'Comment',
-    'ConsumedEnergy',
-    'ConsumedEnergyRaw',
-    'CPUTime',
-    'CPUTimeRAW',
-    'DerivedExitCode',
-    'Elapsed',
-    'ElapsedRaw',
-    'Eligible',
-    'End',
-    'ExitCode',
-    'GID',
-    'Group',
-    'JobID',
-    'JobIDRaw',
-    'JobName',
-    'Layout',
-    'MaxDiskRead',
-    'MaxDiskReadNode',
-    'MaxDiskReadTask',
-    'MaxDiskWrite',
-    'MaxDiskWriteNode',
-    'MaxDiskWriteTask',
-    'MaxPages',
-    'MaxPagesNode',
-    'MaxPagesTask',
-    'MaxRSS',
-    'MaxRSSNode',
-    'MaxRSSTask',
-    'MaxVMSize',
-    'MaxVMSizeNode',
-    'MaxVMSizeTask',
-    'McsLabel',
-    'MinCPU',
-    'MinCPUNode',
-    'MinCPUTask',
-    'NCPUS',
-    'NNodes',
-    'NodeList',
-    'NTasks',
-    'Priority',
-    'Partition',
-    'QOS',
-    'QOSRAW',
-    'ReqCPUFreq',
-    'ReqCPUFreqMin',
-    'ReqCPUFreqMax',
-    'ReqCPUFreqGov',
-    'ReqCPUS',
-    'ReqGRES',
-    'ReqMem',
-    'ReqNodes',
-    'ReqTRES',
-    'Reservation',
-    'ReservationId',
-    'Reserved',
-    'ResvCPU',
-    'ResvCPURAW',
-    'Start',
-    'State',
-    'Submit',
-    'Suspended',
-    'SystemCPU',
-    'SystemComment',
-    'Timelimit',
-    'TimelimitRaw',
-    'TotalCPU',
-    'TRESUsageInAve',
-    'TRESUsageInMax',
-    'TRESUsageInMaxNode',
-    'TRESUsageInMaxTask',
-    'TRESUsageInMin',
-    'TRESUsageInMinNode',
-    'TRESUsageInMinTask',
-    'TRESUsageInTot',
-    'TRESUsageOutAve',
-    'TRESUsageOutMax',
-    'TRESUsageOutMaxNode',
-    'TRESUsageOutMaxTask',
-    'TRESUsageOutMin',
-    'TRESUsageOutMinNode',
-    'TRESUsageOutMinTask',
-    'TRESUsageOutTot',
-    'UID',
-    'User',
-    'UserCPU',
-    'WCKey',
-    'WCKeyID',
-    'WorkDir'
-]
+from ..utils.profile import stage, add, profile_iter
+from ..utils.process import CommandPool, process_map
+from ..slurm.table import JobTable
+from ..slurm.tres import parse_tres, tres_seconds
+from ..slurm.sacct import SACCT_FIELDS, sacct_command, stream_sacct, query_sharded_sacct
+from ..store.jobs import JobSource, JobStore
+from .filters import plan_job_filters
 
 SACCT_PARAMS = map(to_snake_case, SACCT_FIELDS) 
 
-datetime_regex = re.compile(r'((?P<day>\d+)-)?(?P<hr>\d+):(?P<min>\d+):(?P<sec>\d+)')
-
-def __conv(val):
-    if type(val) is str:
-        try:
-            val = float(val)
-            if val.is_integer():
-                return int(val)
-            else:
-                return val
-        except ValueError:
-            return val
-    return val
+# sacct fields needed by __preprocess_job and the span filter for every job
+PREPROCESS_FIELDS = ['End', 'State']
+
+# Chunks of sacct output per worker process with --workers. More chunks than
+# workers even out chunks that take longer to process.
+PARALLEL_CHUNKS_PER_WORKER = 4
+
+# sacct fields needed to compute each derived field in __preprocess_job
+DERIVED_FIELDS = {
+    'elasped_mins': ['AllocTRES', 'ElapsedRaw'],
+    'core_hour': ['AllocTRES', 'ElapsedRaw'],
+    'su_usage': ['AllocTRES', 'ElapsedRaw'],
+}
+
+# Group sums of these derived fields are accumulated as exact integer TRES
+# seconds, see tres_seconds, and divided once per group, so they do not
+# depend on the order jobs are summed in, e.g. with workers or rollups.
+EXACT_SUM_FIELDS = {
+    'elasped_mins': (None, 60),
+    'su_usage': ('billing', 60),
+    'core_hour': ('cpu', 3600),
+}
 
 def __preprocess_job(job):
     
     if job.get('__processed', None):
         return job
 
-    if job['req_tres']:
-        job['req_tres'] = {k:__conv(v) for k,v in (x.split('=') for x in job['req_tres'].strip().split(','))}
-    else:
-        job['req_tres'] = None
+    # Fields not requested from sacct (see plan_sacct_fields) are left out.
+    # TRES dicts are shared between jobs with the same TRES string.
+    if 'req_tres' in job:
+        job['req_tres'] = parse_tres(job['req_tres'])
 
     job['elasped_mins'] = 0
     job['core_hour'] = 0
     job['su_usage'] = 0
     
-    try:
-        datetime_match = datetime_regex.match(job['reserved'])
-        job['reserved'] = timedelta(
-            days = int(datetime_match.group('day')) if datetime_match.group('day') else 0,
-            hours = int(datetime_match.group('hr')),
-            minutes = int(datetime_match.group('min')),
-            seconds = int(datetime_match.group('sec'))
-        ).total_seconds()
-    except AttributeError:
-        job['reserved'] = timedelta(0).total_seconds()
+    if 'reserved' in job:
+        job['reserved'] = parse_duration(job['reserved'])
 
     if not isinstance(job['end'], datetime):
-        try:
-            job['end'] = datetime.strptime(job['end'], '%Y-%m-%dT%H:%M:%S')
-        except ValueError:
-            job['end'] = None
+        job['end'] = parse_timestamp(job['end'])
 
-    if job['alloc_tres']:
-        job['alloc_tres'] = {k:__conv(v) for k,v in (x.split('=') for x in job['alloc_tres'].strip().split(','))}
-        job['elasped_mins'] = int(job['elapsed_raw']) / 60.0
-        job['core_hour'] = int(job['elapsed_raw']) / 3600.0 * job['alloc_tres'].get('cpu', 0)
-        job['su_usage'] = job['alloc_tres'].get('billing', 0) * job['elasped_mins']
+    if job.get('alloc_tres', None):
+        job['alloc_tres'] = parse_tres(job['alloc_tres'])
+        job['elasped_mins'] = tres_seconds(job, None) / 60.0
+        job['core_hour'] = tres_seconds(job, 'cpu') / 3600.0
+        job['su_usage'] = tres_seconds(job, 'billing') / 60.0
 
     job['__processed'] = True
 
     return job
 
-def query_usage(begin_date, end_date, account_list=None, fields=None, freq=None):
-    optional_options = ''
-    if account_list:
-        optional_options = optional_options + '-A {}'.format(','.join(account_list))
-    
-    sacct_command = 'sacct -P -aX --format={} --start={} --end={} {}'.format(
-        ','.join(SACCT_FIELDS), 
-        begin_date.strftime('%Y-%m-%dT%H:%M:%S'), 
-        end_date.strftime('%Y-%m-%dT%H:%M:%S'),
-        optional_options
-    ).strip()
-    
-    sacct_output = subprocess.check_output(sacct_command.split(' '), universal_newlines=True)
-    sacct_results = SlurmParser.parse_output(sacct_output, convert_key=to_snake_case)
+def plan_sacct_fields(fields=None, groups_by=None, groups_by_fields=None):
+    # Returns the minimal list of sacct fields needed to answer a query. All
+    # fields are needed when the query outputs whole job records.
+    if not fields and not groups_by_fields:
+        return SACCT_FIELDS
+
+    sacct_params = {to_snake_case(f):f for f in SACCT_FIELDS}
+    required = set(PREPROCESS_FIELDS)
+
+    for param in (fields or []) + (groups_by or []) + (groups_by_fields or []):
+        if param in sacct_params:
+            required.add(sacct_params[param])
+        required.update(DERIVED_FIELDS.get(param, []))
+
+    # __preprocess_job derives usage from ElapsedRaw whenever AllocTRES is set
+    if 'AllocTRES' in required:
+        required.add('ElapsedRaw')
+
+    return [f for f in SACCT_FIELDS if f in required]
+
+def __query_jobs(begin_date, end_date, account_list=None, fields=SACCT_FIELDS, noconvert=False, store=None, shard=None, jobs=1, clusters=None, sacct_output=None, filters=None):
+    # filters: job filters, see plan_job_filters. The filters sacct can
+    # express are passed to sacct, the others are checked on the parsed jobs.
+    # Jobs of a job store are checked against every filter.
+    sacct_filters, job_filter = plan_job_filters(filters, pushdown=not store)
+    sacct_results = __read_jobs(begin_date, end_date, account_list=account_list, fields=fields, noconvert=noconvert, store=store, shard=shard, jobs=jobs, clusters=clusters, sacct_output=sacct_output, sacct_filters=sacct_filters)
+    return job_filter.apply(sacct_results) if job_filter else sacct_results
+
+def __read_jobs(begin_date, end_date, account_list=None, fields=SACCT_FIELDS, noconvert=False, store=None, shard=None, jobs=1, clusters=None, sacct_output=None, sacct_filters=None):
+    # store: path to a local job store. When given, the store is synced with
+    # sacct and jobs are read from it instead of querying the whole period.
+    # A JobSource instance, e.g. the daemon's JobCache, is read without sync.
+    # shard: split the period into shards of this frequency and run up to
+    # `jobs` sacct commands concurrently.
+    # clusters: query the jobs of these clusters, all clusters concurrently,
+    # instead of the default cluster. Jobs have a 'cluster' field.
+    # sacct_output: lines of `sacct -P` output already read, e.g. by the
+    # asyncio API in query/aio.py, parsed instead of running sacct. The
+    # output is expected to be filtered by sacct_filters.
+    if sacct_output is not None:
+        return profile_iter('parse', SlurmParser.iter_output(sacct_output, convert_key=to_snake_case))
+
+    if clusters and store:
+        raise ValueError('clusters are not supported with a job store')
+
+    if isinstance(store, JobSource):
+        return profile_iter('store', store.jobs(begin_date, end_date, account_list=account_list))
+
+    if store:
+        job_store = JobStore(store)
+        try:
+            job_store.sync()
+            return list(profile_iter('store', job_store.jobs(begin_date, end_date, account_list=account_list)))
+        finally:
+            job_store.close()
+
+    if shard or clusters:
+        workers = jobs * len(clusters) if clusters else jobs
+        return query_sharded_sacct(begin_date, end_date, shard=shard, workers=workers, fields=fields, account_list=account_list, noconvert=noconvert, clusters=clusters, filters=sacct_filters)
+
+    return stream_sacct(begin_date, end_date, fields=fields, account_list=account_list, noconvert=noconvert, filters=sacct_filters)
+
+def __bucket_jobs(sacct_results, spans, running_spans=None):
+    # Assigns every job to the span containing its end time in a single pass.
+    # Running jobs without an end time are put in the spans listed in
+    # running_spans. Jobs are kept in a JobTable and each bucket holds row
+    # indices in sacct order.
+    span_index = SpanIndex(spans)
+    buckets = [array('l') for _ in span_index.spans]
+    job_table = JobTable()
+    if not buckets:
+        return span_index.spans, job_table, buckets
+
+    running_spans = running_spans if running_spans is not None else range(len(buckets))
+
+    with stage('bucket'):
+        for job in profile_iter('preprocess', (__preprocess_job(job) for job in sacct_results)):
+            if not job['end']:
+                if job['state'] == "RUNNING":
+                    row = job_table.append(job)
+                    for n in running_spans:
+                        buckets[n].append(row)
+                continue
+
+            n = span_index.find(job['end'])
+            if n is not None:
+                buckets[n].append(job_table.append(job))
+
+    add('bucket', rows=len(job_table))
+
+    return span_index.spans, job_table, buckets
+
+def __bucket_archive(archive, spans, end_date, account_list=None, running_spans=None, filters=None):
+    # Like __bucket_jobs for the jobs of a JobArchive. The rows of each span
+    # are found with the end time index of the archive, so only the columns
+    # the query reads are loaded. Buckets hold rows of the archive table.
+    # Accounts and filters are matched once per distinct value of a field.
+    # Running jobs are the ones that started before end_date, like the jobs
+    # sacct and JobStore.jobs return for the period.
+    span_index = SpanIndex(spans)
+    running_spans = running_spans if running_spans is not None else range(len(span_index.spans))
+    _, job_filter = plan_job_filters(filters, pushdown=False)
+
+    predicates = [('account', lambda val: val in account_list)] if account_list else []
+    predicates += list(job_filter.predicates()) if job_filter else []
+    codes = []
+    for field, match in predicates:
+        accepted = archive.category_codes(field, match)
+        codes.append((archive.table.column(field).values, accepted))
+
+    buckets = []
+    with stage('bucket'):
+        running = archive.running_rows(end_date)
+        for n, d in enumerate(span_index.spans):
+            rows = archive.rows(d.start, d.end)
+            if n in running_spans and running:
+                rows = array('l', sorted(rows + running))
+            for values, accepted in codes:
+                rows = array('l', [r for r in rows if values[r] in accepted])
+            buckets.append(rows)
+
+    add('bucket', rows=sum(len(bucket) for bucket in buckets))
+
+    return span_index.spans, archive.table, buckets
+
+def __open_archive(archive):
+    # archive: path of a job archive or a JobArchive instance.
+    from ..store.archive import JobArchive
+    return archive if isinstance(archive, JobArchive) else JobArchive(archive)
+
+def export_jobs(path, begin_date, end_date, account_list=None, store=None, shard=None, jobs=1, clusters=None, sacct_output=None):
+    # Writes every job of [begin_date, end_date), preprocessed, to a job
+    # archive at path, see write_archive. Jobs are read as for a usage
+    # query, or parsed from sacct_output, lines of `sacct -P` output, whose
+    # period defaults to the end times of its jobs. Returns the number of jobs.
+    from ..store.archive import write_archive
+
+    sacct_results = __query_jobs(begin_date, end_date, account_list=account_list, noconvert=True, store=store, shard=shard, jobs=jobs, clusters=clusters, sacct_output=sacct_output)
+    if sacct_output is not None and account_list:
+        sacct_results = (job for job in sacct_results if job['account'] in account_list)
+
+    job_table = JobTable()
+    with stage('preprocess'):
+        job_table.extend(__preprocess_job(job) for job in sacct_results)
+    add('preprocess', rows=len(job_table))
+
+    if begin_date is None or end_date is None:
+        ends = [e for e in (job_table.column('end') if len(job_table) else []) if e is not None]
+        begin_date = begin_date if begin_date else min(ends) if ends else datetime.now()
+        end_date = end_date if end_date else max(ends) + timedelta(seconds=1) if ends else begin_date
+
+    with stage('archive'):
+        write_archive(path, job_table, begin_date, end_date)
+
+    return len(job_table)
+
+def __split_output(output, chunks):
+    # Splits sacct output into its header line and up to `chunks` pieces of
+    # about the same size, at line boundaries.
+    begin = output.find('\n') + 1
+    if begin == 0:
+        return output, []
+    header = output[:begin - 1]
+
+    size = (len(output) - begin) // chunks + 1
+    pieces = []
+    while begin < len(output):
+        end = output.find('\n', begin + size)
+        end = len(output) if end < 0 else end + 1
+        pieces.append(output[begin:end])
+        begin = end
+    return header, pieces
+
+def __parallel_chunk(task):
+    # Runs in a worker process: parses, preprocesses and buckets one chunk of
+    # sacct output. Returns the JobTable and its buckets, whose arrays pickle
+    # compactly, or with groups_by only the group results of every bucket.
+    headers, chunk, spans, running_spans, job_filter, groups_by, groups_by_fields, engine = task
+    sacct_results = SlurmParser.iter_output(chunk.splitlines(), headers=headers)
+    if job_filter:
+        sacct_results = job_filter.apply(sacct_results)
+    _, job_table, buckets = __bucket_jobs(sacct_results, spans, running_spans=running_spans)
+    if not groups_by:
+        return job_table, buckets
+    return __aggregate_buckets(job_table, buckets, groups_by, groups_by_fields, engine=engine)
+
+def __parallel_bucket_jobs(begin_date, end_date, spans, workers, account_list=None, fields=SACCT_FIELDS, noconvert=False, running_spans=None, groups_by=None, groups_by_fields=None, engine='python', filters=None):
+    # Reads the output of a single sacct command and splits it into chunks
+    # processed by `workers` processes, see __parallel_chunk. Returns the
+    # spans and the result of every chunk, in output order.
+    spans = list(spans)
+    sacct_filters, job_filter = plan_job_filters(filters)
+    output = CommandPool().check_output(sacct_command(begin_date, end_date, fields=fields, account_list=account_list, noconvert=noconvert, filters=sacct_filters))
+    header, chunks = __split_output(output, workers * PARALLEL_CHUNKS_PER_WORKER)
+    headers = [to_snake_case(h.strip()) for h in header.split('|')]
+
+    tasks = [(headers, chunk, spans, running_spans, job_filter, groups_by, groups_by_fields, engine) for chunk in chunks]
+    with stage('parallel'):
+        results = process_map(__parallel_chunk, tasks, workers=workers)
+    add('parallel', bytes=len(output))
+
+    return spans, results
+
+def query_usage(begin_date, end_date, account_list=None, fields=None, freq=None, store=None, shard=None, jobs=1, clusters=None, workers=1, archive=None, sacct_output=None, filters=None):
+    # workers: parse and preprocess sacct output in this many processes. Only
+    # used when jobs are read with a single sacct command. archive: read jobs
+    # from a job archive written by export_jobs instead of Slurm. Jobs of a
+    # store or archive hold --noconvert values, unlike those read from sacct.
+    # sacct_output: see __query_jobs, with the fields of plan_sacct_fields.
+    # filters: only report jobs selected by these job filters, e.g.
+    # {'users': ['alice'], 'states': ['COMPLETED']}, see JobFilter.
+    sacct_fields = plan_sacct_fields(fields=fields)
+
+    if archive:
+        spans, job_table, buckets = __bucket_archive(__open_archive(archive), date_range(begin_date, end_date, freq=freq), end_date, account_list=account_list, filters=filters)
+        tables = [(job_table, buckets)]
+    elif workers > 1 and not (store or shard or clusters) and sacct_output is None:
+        spans, tables = __parallel_bucket_jobs(begin_date, end_date, date_range(begin_date, end_date, freq=freq), workers, account_list=account_list, fields=sacct_fields, filters=filters)
+    else:
+        sacct_results = __query_jobs(begin_date, end_date, account_list=account_list, fields=sacct_fields, store=store, shard=shard, jobs=jobs, clusters=clusters, sacct_output=sacct_output, filters=filters)
+        spans, job_table, buckets = __bucket_jobs(sacct_results, date_range(begin_date, end_date, freq=freq))
+        tables = [(job_table, buckets)]
 
-    for d in date_range(begin_date, end_date, freq=freq):
+    for n, d in enumerate(spans):
         output = {}
 
         output['start_date'] = d.start.strftime('%Y-%m-%dT%H:%M:%S')
         output['end_date'] = d.end.strftime('%Y-%m-%dT%H:%M:%S')
         output['results'] = []
 
-        for job in sacct_results:
-
-            job = __preprocess_job(job)
-
-            if (not job['end']) and (job['state'] != "RUNNING"):
-                continue
-
-            if (job['end']) and (not(d.start <= job['end'] < d.end)):
-                continue
-
-            if fields:
-                output['results'].append({ f: job[f] for f in fields })
-            else:
-                output['results'].append(job)
+        for job_table, buckets in tables:
+            for job in job_table.rows(buckets[n]):
+                if fields:
+                    output['results'].append({ f: job[f] for f in fields })
+                else:
+                    output['results'].append(job.to_dict())
         
         yield output
 
@@ -228,68 +327,222 @@ def __update_dict(src, val):
         else:
             src[key] = src[key] + val[key]
             
-def query_group_usage(begin_date, end_date, groups_by, groups_by_fields, account_list=None, freq=None):
-    optional_options = ''
-    if account_list:
-        optional_options = optional_options + '-A {}'.format(','.join(account_list))
-
-    sacct_command = 'sacct -P -aX --noconvert --format={} --start={} --end={} {}'.format(
-        ','.join(SACCT_FIELDS), 
-        begin_date.strftime('%Y-%m-%dT%H:%M:%S'), 
-        end_date.strftime('%Y-%m-%dT%H:%M:%S'),
-        optional_options
-    ).strip()
-
-    sacct_output = subprocess.check_output(sacct_command.split(' '), universal_newlines=True)
-    sacct_results = SlurmParser.parse_output(sacct_output, convert_key=to_snake_case)
-
-    for d in date_range(begin_date, end_date, freq=freq):
+def __group_value(job, field):
+    # Value of a job summed by group reports, see EXACT_SUM_FIELDS.
+    if field in EXACT_SUM_FIELDS:
+        return tres_seconds(job, EXACT_SUM_FIELDS[field][0])
+    return job[field]
+
+def __divide_exact_sums(result, depth):
+    # Converts the exact sums of a group result with depth groups_by levels
+    # to the units of their fields.
+    for val in result.values():
+        if depth > 1:
+            __divide_exact_sums(val, depth - 1)
+            continue
+        for field, (_, seconds) in EXACT_SUM_FIELDS.items():
+            if field in val:
+                val[field] = val[field] / float(seconds)
+
+def __aggregate_groups(jobs, groups_by, groups_by_fields):
+    result = {}
+
+    for job in jobs:
+        data = { field: __group_value(job, field) for field in groups_by_fields if field != 'count' }
         
+        output_ptr = result
+        for key in groups_by:
+            if job[key] in output_ptr:
+                output_ptr = output_ptr[job[key]]
+            else:
+                output_ptr[job[key]] = {}
+                output_ptr = output_ptr[job[key]]
+
+        if output_ptr:
+            for key in data:
+                if isinstance(output_ptr[key], dict):
+                    __update_dict(output_ptr[key], data[key])
+                else:
+                    output_ptr[key] = output_ptr[key] + data[key]
+
+            if 'count' in groups_by_fields:
+                output_ptr['count'] = output_ptr['count'] + 1
+        else:
+            # Dict values such as TRES are shared between JobTable rows and
+            # are summed in place, so the first one is copied.
+            output_ptr.update({k:(deepcopy(v) if isinstance(v, dict) else v) for k,v in data.items()})
+            
+            if 'count' in groups_by_fields:
+                output_ptr['count'] = 1
+
+    return result
+
+def __day(date):
+    return datetime(date.year, date.month, date.day)
+
+def __is_day(date):
+    return date == __day(date)
+
+def __use_rollups(begin_date, end_date, groups_by, groups_by_fields, store, now):
+    # Daily rollups answer reports from a job store path over whole days,
+    # or up to a time of today, e.g. the end of reports without --end,
+    # grouped by and summing fields kept in the rollups.
+    from ..store.rollup import ROLLUP_DIMENSIONS, ROLLUP_METRICS
+    return (
+        store and not isinstance(store, JobSource) and
+        groups_by and all(f in ROLLUP_DIMENSIONS for f in groups_by) and
+        all(f in ROLLUP_METRICS for f in groups_by_fields) and
+        __is_day(begin_date) and (__is_day(end_date) or end_date >= __day(now))
+    )
+
+def query_group_usage(begin_date, end_date, groups_by, groups_by_fields, account_list=None, freq=None, store=None, shard=None, jobs=1, engine='python', clusters=None, workers=1, archive=None, sacct_output=None, filters=None):
+    # engine: 'python' aggregates job by job, 'numpy' aggregates every span in
+    # one vectorized pass and requires numpy. Reports from a job store are
+    # rolled up from daily totals when possible, see DailyRollup. With
+    # clusters, 'cluster' can be used in groups_by. workers: see query_usage;
+    # each process aggregates its jobs and the group results are merged.
+    # archive, sacct_output, filters: see query_usage; sacct_output is read
+    # with --noconvert. Daily rollups are not used with filters.
+    now = datetime.now()
+    if not clusters and not archive and sacct_output is None and not filters and __use_rollups(begin_date, end_date, groups_by, groups_by_fields, store, now):
+        return __query_rollup_group_usage(begin_date, end_date, groups_by, groups_by_fields, account_list=account_list, freq=freq, store=store, now=now)
+
+    return __query_job_group_usage(begin_date, end_date, groups_by, groups_by_fields, account_list=account_list, freq=freq, store=store, shard=shard, jobs=jobs, engine=engine, clusters=clusters, workers=workers, archive=archive, sacct_output=sacct_output, filters=filters)
+
+def __add_group_values(output_ptr, values):
+    if output_ptr:
+        for key in values:
+            output_ptr[key] = output_ptr[key] + values[key]
+    else:
+        output_ptr.update(values)
+
+def __query_rollup_group_usage(begin_date, end_date, groups_by, groups_by_fields, account_list=None, freq=None, store=None, now=None):
+    from ..config import SERVICE_BEGIN_DATE
+    from ..store.rollup import DailyRollup, ROLLUP_METRICS
+
+    job_store = JobStore(store)
+    try:
+        job_store.sync(now=now)
+        rollup = DailyRollup(job_store)
+        with stage('rollup'):
+            rollup.refresh(__preprocess_job, datetime.strptime(SERVICE_BEGIN_DATE, '%Y-%m-%d'), now=now)
+
+        span_index = SpanIndex(date_range(begin_date, end_date, freq=freq))
+        results = [{} for _ in span_index.spans]
+
+        # (first JobIDRaw, group key values, group values) of every span,
+        # added in JobIDRaw order so that groups are listed in the order of
+        # their first job, as in reports read from the job store.
+        span_groups = [[] for _ in span_index.spans]
+        with stage('aggregate'):
+            for day, keys, metrics, first_job in profile_iter('rollup', rollup.rows(begin_date, end_date, groups_by, account_list=account_list)):
+                n = span_index.find(day)
+                if n is not None:
+                    span_groups[n].append((first_job, keys, {f: metrics[ROLLUP_METRICS.index(f)] for f in groups_by_fields}))
+
+            # Running jobs are only counted once, in the first span.
+            for job in job_store.unfinished_jobs(end_date, account_list=account_list) if results else []:
+                job = __preprocess_job(job)
+                if job['state'] != 'RUNNING':
+                    continue
+                span_groups[0].append((int(job['job_id_raw']), [job[key] for key in groups_by], {f: (__group_value(job, f) if f != 'count' else 1) for f in groups_by_fields}))
+
+            for result, groups in zip(results, span_groups):
+                for _, keys, values in sorted(groups, key=lambda group: group[0]):
+                    output_ptr = result
+                    for key in keys:
+                        output_ptr = output_ptr.setdefault(key, {})
+                    __add_group_values(output_ptr, values)
+    finally:
+        job_store.close()
+
+    for d, result in zip(span_index.spans, results):
+        __divide_exact_sums(result, len(groups_by))
+
         output = {}
 
         output['start_date'] = d.start.strftime('%Y-%m-%dT%H:%M:%S')
         output['end_date'] = d.end.strftime('%Y-%m-%dT%H:%M:%S')
-        output['result'] = {}
+        output['result'] = result
         output['fields'] = groups_by
 
-        for job in sacct_results:
-            if job.get('__counted', None):
-                continue
-
-            job = __preprocess_job(job)
-            
-            if (not job['end']) and (job['state'] != "RUNNING"):
-                continue
+        if 'su_usage' in groups_by_fields:
+            __update_su(output)
 
-            if (job['end']) and (not(d.start <= job['end'] < d.end)):
-                continue
+        yield output
 
-            data = { field: job[field] for field in groups_by_fields }
-            
-            output_ptr = output['result']
-            for key in groups_by:
-                if job[key] in output_ptr:
-                    output_ptr = output_ptr[job[key]]
+def __aggregate_buckets(job_table, buckets, groups_by, groups_by_fields, engine='python'):
+    # Returns the group results of every bucket of job_table rows, with the
+    # exact sums of EXACT_SUM_FIELDS, see __divide_exact_sums.
+    if engine == 'numpy':
+        # numpy is only imported when the numpy engine is used.
+        from .vectorized import aggregate_groups
+        try:
+            with stage('aggregate'):
+                results = aggregate_groups(job_table, buckets, groups_by, groups_by_fields, exact_sums=dict((f, tres) for f, (tres, _) in EXACT_SUM_FIELDS.items()))
+            add('aggregate', rows=sum(len(bucket) for bucket in buckets))
+            return results
+        except TypeError:
+            # Non-numeric groups_by_fields, e.g. TRES dicts, are only
+            # supported by the python engine.
+            pass
+
+    results = []
+    for bucket in buckets:
+        with stage('aggregate'):
+            results.append(__aggregate_groups(job_table.rows(bucket), groups_by, groups_by_fields))
+        add('aggregate', rows=len(bucket))
+    return results
+
+def __merge_groups(result, partial, depth):
+    # Adds the group results of a later chunk of jobs to result. depth is the
+    # number of groups_by levels. Groups keep the order they were first seen.
+    # Results hold the exact sums of EXACT_SUM_FIELDS, so the worker count
+    # does not change them.
+    for key, val in partial.items():
+        if key not in result:
+            result[key] = val
+        elif depth > 1:
+            __merge_groups(result[key], val, depth - 1)
+        else:
+            for field in val:
+                if isinstance(val[field], dict):
+                    __update_dict(result[key][field], val[field])
                 else:
-                    output_ptr[job[key]] = {}
-                    output_ptr = output_ptr[job[key]]
-
-            if output_ptr:
-                for key in data:
-                    if isinstance(output_ptr[key], dict):
-                        __update_dict(output_ptr[key], data[key])
-                    else:
-                        output_ptr[key] = output_ptr[key] + data[key]
-
-                    if 'count' in groups_by_fields:
-                        output_ptr['count'] = output_ptr['count'] + 1
-            else:
-                output_ptr.update(data)
-                
-                if 'count' in groups_by_fields:
-                    output_ptr['count'] = 1
+                    result[key][field] = result[key][field] + val[field]
+
+def __query_job_group_usage(begin_date, end_date, groups_by, groups_by_fields, account_list=None, freq=None, store=None, shard=None, jobs=1, engine='python', clusters=None, workers=1, archive=None, sacct_output=None, filters=None):
+    sacct_fields = plan_sacct_fields(groups_by=groups_by, groups_by_fields=groups_by_fields)
+
+    # Running jobs are only counted once, in the first span.
+    if archive:
+        spans, job_table, buckets = __bucket_archive(__open_archive(archive), date_range(begin_date, end_date, freq=freq), end_date, account_list=account_list, running_spans=[0], filters=filters)
+        results = __aggregate_buckets(job_table, buckets, groups_by, groups_by_fields, engine=engine)
+    elif workers > 1 and not (store or shard or clusters) and sacct_output is None:
+        spans, partials = __parallel_bucket_jobs(
+            begin_date, end_date, date_range(begin_date, end_date, freq=freq), workers,
+            account_list=account_list, fields=sacct_fields, noconvert=True, running_spans=[0],
+            groups_by=groups_by, groups_by_fields=groups_by_fields, engine=engine, filters=filters)
+
+        results = [{} for _ in spans]
+        with stage('merge'):
+            for partial in partials:
+                for result, partial_result in zip(results, partial):
+                    __merge_groups(result, partial_result, len(groups_by))
+    else:
+        sacct_results = __query_jobs(begin_date, end_date, account_list=account_list, fields=sacct_fields, noconvert=True, store=store, shard=shard, jobs=jobs, clusters=clusters, sacct_output=sacct_output, filters=filters)
+        spans, job_table, buckets = __bucket_jobs(sacct_results, date_range(begin_date, end_date, freq=freq), running_spans=[0])
+        results = __aggregate_buckets(job_table, buckets, groups_by, groups_by_fields, engine=engine)
 
-            job['__counted'] = True
+    for n, d in enumerate(spans):
+        __divide_exact_sums(results[n], len(groups_by))
+
+        output = {}
+
+        output['start_date'] = d.start.strftime('%Y-%m-%dT%H:%M:%S')
+        output['end_date'] = d.end.strftime('%Y-%m-%dT%H:%M:%S')
+        output['result'] = results[n]
+        output['fields'] = groups_by
 
         if 'su_usage' in groups_by_fields:
             __update_su(output)
@@ -4,10 +4,46 @@ from __future__ import print_function
 
 import subprocess
 
-from ..utils.time import date_range
+from datetime import datetime
+
+from ..utils.time import date_range, parse_timestamp
+from ..utils.process import CommandPool
+from ..utils.string import to_snake_case
 from ..slurm.parser import SlurmParser
+from ..slurm.sreport import sreport_command
+from ..slurm.sacct import sacct_command, stream_sacct
+from ..utils.profile import stage, add
+
+def utilization_spans(begin_date, end_date, freq):
+    # date_range without empty spans, e.g. the last one when end_date is on
+    # a week or month boundary, which have no capacity to report.
+    return [d for d in date_range(begin_date, end_date, freq=freq) if d.end > d.start]
+
+def sreport_utilization(d, sreport_output, time_unit):
+    # Returns the utilization row of span d from its sreport output, or None
+    # if sreport reported nothing.
+    with stage('parse'):
+        sreport_results = SlurmParser.parse_output(sreport_output)
+    add('parse', rows=len(sreport_results))
+
+    if len(sreport_results) == 0:
+        return None
+
+    utilization = sreport_results[0]
+    utilization['StartDate'] = d.start.strftime('%Y-%m-%d')
+    utilization['EndDate'] = d.end.strftime('%Y-%m-%d')
+    utilization['Utilization'] = utilization['Allocated'] / float(utilization['Reported'])
+    utilization['Unit'] = time_unit
+    return utilization
 
-def query_utilization(begin_date, end_date, freq='day', time_unit='min'):
+def query_utilization(begin_date, end_date, freq='day', time_unit='min', jobs=1, cache=None, clusters=None):
+    # jobs: maximum number of sreport commands running at the same time, per
+    # cluster.
+    # cache: sreport output cache with get(span, time_unit, cluster) and
+    # set(span, time_unit, output, fetched=..., cluster=cluster), e.g.
+    # MemorySreportCache or DiskSreportCache.
+    # clusters: report each of these clusters, one row per span and cluster,
+    # instead of the default cluster.
 
     if freq and freq not in ['day', 'week', 'month', 'year']:
         raise ValueError('Invalid freq value')
@@ -15,16 +51,129 @@ def query_utilization(begin_date, end_date, freq='day', time_unit='min'):
     if time_unit not in ['sec', 'min', 'hour']:
         raise ValueError('Invalid time_unit value')
 
-    for d in date_range(begin_date, end_date, freq=freq):
-        sreport_command = 'sreport -P -t {} cluster utilization start={} end={}'.format(time_unit ,d.start.strftime('%Y-%m-%d'), d.end.strftime('%Y-%m-%d'))
-        sreport_output = subprocess.check_output(sreport_command.split(' '), universal_newlines=True)
-        sreport_results = SlurmParser.parse_output(sreport_output)
+    clusters = clusters if clusters else [None]
+    command_pool = CommandPool(jobs * len(clusters))
+
+    def sreport(item):
+        d, cluster = item
+        sreport_output = cache.get(d, time_unit, cluster) if cache is not None else None
+        if sreport_output is None:
+            fetched = datetime.now()
+            sreport_output = command_pool.check_output(sreport_command(d.start, d.end, time_unit, cluster=cluster))
+            if cache is not None:
+                cache.set(d, time_unit, sreport_output, fetched=fetched, cluster=cluster)
+        return sreport_utilization(d, sreport_output, time_unit)
+
+    spans = [(d, cluster) for d in utilization_spans(begin_date, end_date, freq) for cluster in clusters]
+    for _, utilization in command_pool.imap(sreport, spans):
+        if utilization is not None:
+            yield utilization
+
+# Seconds in each time unit of utilization reports.
+TIME_UNIT_SECONDS = {'sec': 1, 'min': 60, 'hour': 3600}
+
+# sacct fields needed for the allocated CPU time of a job.
+JOB_UTILIZATION_FIELDS = ['JobIDRaw', 'Cluster', 'AllocCPUS', 'Start', 'End']
+
+def allocated_cpu_seconds(intervals, spans):
+    # Returns the allocated CPU-seconds of each span for job intervals
+    # (start, end, cpus), with times in seconds. Spans must be sorted and
+    # non-overlapping. Starts and ends are swept in time order once while
+    # keeping the number of allocated CPUs, and the CPUs allocated between
+    # two events are added to the spans overlapping that interval.
+    events = []
+    for start, end, cpus in intervals:
+        if end > start and cpus:
+            events.append((start, cpus))
+            events.append((end, -cpus))
+    events.sort()
+
+    results = [0.0]*len(spans)
+    s = 0
+    level = 0
+    last_time = None
+    for time, delta in events:
+        if level and time > last_time:
+            while s < len(spans) and spans[s][1] <= last_time:
+                s += 1
+            k = s
+            while k < len(spans) and spans[k][0] < time:
+                overlap = min(time, spans[k][1]) - max(last_time, spans[k][0])
+                if overlap > 0:
+                    results[k] += level * overlap
+                k += 1
+        level += delta
+        last_time = time
+    return results
+
+def __seconds(date):
+    return (date - datetime(1970, 1, 1)).total_seconds()
+
+def __job_intervals(jobs, now):
+    # Returns the cluster and the (start, end, cpus) intervals of sacct jobs.
+    cluster = None
+    intervals = []
+    for job in jobs:
+        start = parse_timestamp(job['start'])
+        if start is None or not job['alloc_cpus']:
+            continue
+        end = parse_timestamp(job['end'])
+        intervals.append((__seconds(start), __seconds(end) if end is not None else now, int(job['alloc_cpus'])))
+        cluster = cluster if cluster else job['cluster']
+    return cluster, intervals
+
+def query_job_utilization(begin_date, end_date, freq='day', time_unit='min', cpus=None, now=None, clusters=None):
+    # Utilization computed from sacct job intervals instead of sreport, in
+    # the same units. All spans are filled from one sacct query, so short
+    # spans such as 'hour' cost no extra Slurm calls. Capacity is `cpus`,
+    # by default the CPUs of the nodes in `scontrol show node`; unlike
+    # sreport, down and reserved nodes are counted as idle. Running jobs are
+    # counted up to `now`. With clusters, the sacct and scontrol queries of
+    # every cluster run concurrently and each span has a row per cluster.
+    if freq and freq not in ['hour', 'day', 'week', 'month', 'year']:
+        raise ValueError('Invalid freq value')
+
+    if time_unit not in TIME_UNIT_SECONDS:
+        raise ValueError('Invalid time_unit value')
+
+    from .nodes import cluster_cpus
+
+    now = __seconds(now if now else datetime.now())
+    spans = utilization_spans(begin_date, end_date, freq)
+    span_seconds = [(__seconds(d.start), __seconds(d.end)) for d in spans]
+
+    if not clusters:
+        cluster, intervals = __job_intervals(stream_sacct(begin_date, end_date, fields=JOB_UTILIZATION_FIELDS), now)
+        results = [(cluster, cpus if cpus is not None else cluster_cpus(), intervals)]
+    else:
+        command_pool = CommandPool(len(clusters))
+
+        def query_cluster(cluster):
+            sacct_output = command_pool.check_output(sacct_command(begin_date, end_date, fields=JOB_UTILIZATION_FIELDS, clusters=[cluster]))
+            with stage('parse'):
+                jobs = SlurmParser.parse_output(sacct_output, convert_key=to_snake_case)
+            add('parse', rows=len(jobs))
+            return cluster, cpus if cpus is not None else cluster_cpus(cluster=cluster), __job_intervals(jobs, now)[1]
+
+        results = [result for _, result in command_pool.imap(query_cluster, clusters)]
 
-        if len(sreport_results) > 0:
-            utilization = sreport_results[0]
-            utilization['StartDate'] = d.start.strftime('%Y-%m-%d')
-            utilization['EndDate'] = d.end.strftime('%Y-%m-%d')
-            utilization['Utilization'] = utilization['Allocated'] / float(utilization['Reported'])
-            utilization['Unit'] = time_unit
+    with stage('sweep'):
+        allocated = [allocated_cpu_seconds(intervals, span_seconds) for _, _, intervals in results]
+    add('sweep', rows=sum(len(intervals) for _, _, intervals in results))
 
-            yield utilization
\ No newline at end of file
+    unit = float(TIME_UNIT_SECONDS[time_unit])
+    date_format = '%Y-%m-%dT%H:%M:%S' if freq == 'hour' else '%Y-%m-%d'
+    for n, (d, (start, end)) in enumerate(zip(spans, span_seconds)):
+        for (cluster, cluster_cpu_count, _), cluster_allocated in zip(results, allocated):
+            reported = int(round(cluster_cpu_count * (end - start) / unit))
+            allocated_time = int(round(cluster_allocated[n] / unit))
+            yield {
+                'Cluster': cluster,
+                'Allocated': allocated_time,
+                'Idle': reported - allocated_time,
+                'Reported': reported,
+                'StartDate': d.start.strftime(date_format),
+                'EndDate': d.end.strftime(date_format),
+                'Utilization': allocated_time / float(reported) if reported else 0.0,
+                'Unit': time_unit
+            }
@@ -0,0 +1,141 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# NumPy implementation of the group-by aggregation in query_group_usage.
+from __future__ import print_function
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ..slurm.table import INT, FLOAT, INT_TYPES
+
+def is_available():
+    return np is not None
+
+def __dtype(values):
+    # Typecode of an array, or format of a memoryview, e.g. the mapped
+    # columns of a JobArchive.
+    return values.typecode if hasattr(values, 'typecode') else values.format
+
+def __row_array(rows):
+    if len(rows) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.frombuffer(rows, dtype=rows.typecode).astype(np.int64)
+
+def __field_values(job_table, field, rows):
+    # Returns (values, is_int) for a numeric field. Raises TypeError for
+    # fields that cannot be summed as numbers, e.g. TRES dicts.
+    kind = job_table.column_type(field)
+    column = job_table.column(field)
+
+    if kind == INT:
+        values = np.frombuffer(column.values, dtype=__dtype(column.values))[rows]
+        return values, np.ones(len(rows), dtype=bool)
+
+    if kind == FLOAT:
+        values = np.frombuffer(column.values, dtype=np.float64)[rows]
+        is_int = np.frombuffer(column.is_int, dtype=np.uint8)[rows].astype(bool)
+        return values, is_int
+
+    values = [column[r] for r in rows]
+    # Python 2 sums of large integers are longs. bool is not summed.
+    if not all(type(v) in INT_TYPES or type(v) is float for v in values):
+        raise TypeError('field {} is not numeric'.format(field))
+    is_int = np.array([type(v) in INT_TYPES for v in values], dtype=bool)
+    if not is_int.all():
+        return np.array(values, dtype=np.float64), is_int
+
+    # Integers too large for a float64 are kept exact, up to int64.
+    try:
+        return np.array(values, dtype=np.int64), is_int
+    except OverflowError:
+        raise TypeError('field {} does not fit in int64'.format(field))
+
+def __tres_seconds(job_table, tres, rows):
+    # Integer TRES count times ElapsedRaw of rows, see tres_seconds. Raises
+    # TypeError when a count is not an integer.
+    if 'alloc_tres' not in job_table.fields:
+        return np.zeros(len(rows), dtype=np.int64)
+
+    codes, labels = job_table.factorize('alloc_tres')
+    counts = [(label.get(tres, 0) if tres else 1) if label else 0 for label in labels]
+    if not all(type(c) in INT_TYPES for c in counts):
+        raise TypeError('TRES {} has non-integer counts'.format(tres))
+
+    elapsed, is_int = __field_values(job_table, 'elapsed_raw', rows)
+    if not is_int.all():
+        raise TypeError('field elapsed_raw is not an integer')
+
+    codes = np.frombuffer(codes, dtype=__dtype(codes)).astype(np.int64)[rows]
+    return np.array(counts, dtype=np.int64)[codes] * elapsed.astype(np.int64)
+
+def aggregate_groups(job_table, buckets, groups_by, groups_by_fields, exact_sums=None):
+    """Sums groups_by_fields per groups_by key for every bucket of rows.
+
+    Returns one nested result dict per bucket, as built by the row-by-row
+    loop in query_group_usage. Sums are accumulated in row order so float
+    results are identical. exact_sums maps fields to the TRES whose integer
+    seconds are summed instead of the field, see EXACT_SUM_FIELDS.
+    """
+    exact_sums = exact_sums if exact_sums else {}
+    if np is None:
+        raise ImportError('numpy is required for the numpy engine')
+
+    results = [{} for _ in buckets]
+    rows = np.concatenate([__row_array(b) for b in buckets]) if buckets else np.zeros(0, dtype=np.int64)
+    if len(rows) == 0:
+        return results
+
+    spans = np.repeat(np.arange(len(buckets), dtype=np.int64), [len(b) for b in buckets])
+
+    # Combine the span index and the codes of every groups_by field into one
+    # key per row, then number the distinct keys.
+    keys = spans
+    key_codes = []
+    key_labels = []
+    for field in groups_by:
+        codes, labels = job_table.factorize(field)
+        codes = np.frombuffer(codes, dtype=__dtype(codes)).astype(np.int64)[rows]
+        keys = keys * max(len(labels), 1) + codes
+        key_codes.append(codes)
+        key_labels.append(labels)
+
+    _, first, groups = np.unique(keys, return_index=True, return_inverse=True)
+    groups = groups.reshape(-1)
+    group_count = len(first)
+
+    sums = {}
+    for field in groups_by_fields:
+        if field == 'count':
+            sums[field] = np.bincount(groups, minlength=group_count).tolist()
+            continue
+
+        if field in exact_sums:
+            values = __tres_seconds(job_table, exact_sums[field], rows)
+            is_int = np.ones(len(rows), dtype=bool)
+        else:
+            values, is_int = __field_values(job_table, field, rows)
+
+        if is_int.all():
+            total = np.zeros(group_count, dtype=np.int64)
+            np.add.at(total, groups, values.astype(np.int64))
+            sums[field] = total.tolist()
+        else:
+            total = np.bincount(groups, weights=values.astype(np.float64), minlength=group_count).tolist()
+            float_count = np.bincount(groups, weights=~is_int, minlength=group_count).tolist()
+            sums[field] = [float(v) if c else int(v) for v, c in zip(total, float_count)]
+
+    # Insert groups in order of their first row, like the row-by-row loop.
+    group_spans = spans[first].tolist()
+    group_keys = [[labels[c] for c in codes[first].tolist()] for codes, labels in zip(key_codes, key_labels)]
+    group_sums = [sums[field] for field in groups_by_fields]
+
+    for g in np.argsort(first, kind='mergesort').tolist():
+        output_ptr = results[group_spans[g]]
+        for keys in group_keys:
+            output_ptr = output_ptr.setdefault(keys[g], {})
+        for field, total in zip(groups_by_fields, group_sums):
+            output_ptr[field] = total[g]
+
+    return results
@@ -0,0 +1,221 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+import os
+import sys
+import json
+import socket
+import threading
+import subprocess
+
+from datetime import datetime
+
+try:
+    from socketserver import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+except ImportError:
+    from SocketServer import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+
+from .config import SERVER_SOCKET_PATH, SERVER_REFRESH_INTERVAL
+from .utils.string import to_native_str
+from .utils.profile import stage, add
+
+# Format of the start and end dates in a query request.
+REQUEST_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+class DaemonUnavailable(Exception):
+    pass
+
+def run_query(request, store=None, cache=None, jobs=1, shard=None, engine='python', workers=1, archive=None):
+    # Runs a query request, a dict with 'type', 'start', 'end' and the query
+    # options. Both the CLI and the daemon answer requests through here.
+    # Only the query module of the requested type is imported.
+    begin_date = datetime.strptime(request['start'], REQUEST_DATETIME_FORMAT)
+    end_date = datetime.strptime(request['end'], REQUEST_DATETIME_FORMAT)
+    clusters = request.get('clusters')
+
+    if request['type'] == 'utilization' and request.get('source') == 'sacct':
+        from .query.utilization import query_job_utilization
+        return query_job_utilization(
+            begin_date,
+            end_date,
+            freq=request.get('freq'),
+            time_unit=request.get('time_unit', 'min'),
+            clusters=clusters
+        )
+    elif request['type'] == 'utilization':
+        from .query.utilization import query_utilization
+        return query_utilization(
+            begin_date,
+            end_date,
+            freq=request.get('freq'),
+            time_unit=request.get('time_unit', 'min'),
+            jobs=jobs,
+            cache=cache,
+            clusters=clusters
+        )
+    elif request['type'] == 'usage':
+        from .query.usage import query_usage, query_group_usage
+        if request.get('groups_by'):
+            return query_group_usage(
+                begin_date,
+                end_date,
+                account_list=request.get('account_list'),
+                groups_by=request['groups_by'],
+                groups_by_fields=request.get('groups_by_fields'),
+                freq=request.get('freq'),
+                engine=engine,
+                store=store,
+                shard=shard,
+                jobs=jobs,
+                clusters=clusters,
+                workers=workers,
+                archive=archive,
+                filters=request.get('filters')
+            )
+        # Job stores keep sacct records fetched with --noconvert, so job
+        # reports, which show sacct values as they are, are read from sacct.
+        return query_usage(
+            begin_date,
+            end_date,
+            account_list=request.get('account_list'),
+            fields=request.get('fields'),
+            freq=request.get('freq'),
+            shard=shard,
+            jobs=jobs,
+            clusters=clusters,
+            workers=workers,
+            archive=archive,
+            filters=request.get('filters')
+        )
+
+    raise ValueError('Invalid query type')
+
+def request_query(request, path=None):
+    # Sends a query request to the daemon listening on path and returns the
+    # output. Raises DaemonUnavailable if no daemon is listening.
+    path = path if path else SERVER_SOCKET_PATH
+    if not os.path.exists(path):
+        raise DaemonUnavailable('no socket at {}'.format(path))
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except socket.error as e:
+            raise DaemonUnavailable(str(e))
+
+        with stage('daemon'):
+            sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+            response = sock.makefile('rb').readline()
+        add('daemon', bytes=len(response))
+    finally:
+        sock.close()
+
+    if not response:
+        raise DaemonUnavailable('connection closed by daemon')
+
+    response = to_native_str(json.loads(response.decode('utf-8')))
+    if response['status'] != 'ok':
+        raise RuntimeError('smonitor daemon: {}'.format(response['error']))
+
+    return response['output']
+
+class QueryHandler(StreamRequestHandler):
+    # One request per connection: a JSON line in, a JSON line out.
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        try:
+            request = to_native_str(json.loads(line.decode('utf-8')))
+            output = list(run_query(request, store=self.server.job_cache, cache=self.server.sreport_cache))
+            response = {'status': 'ok', 'output': output}
+        except Exception as e:
+            response = {'status': 'error', 'error': '{}: {}'.format(type(e).__name__, e)}
+
+        self.wfile.write((json.dumps(response, default=str) + '\n').encode('utf-8'))
+
+class SmonitorServer(ThreadingMixIn, UnixStreamServer):
+    """Resident smonitor daemon.
+
+    Keeps parsed sacct jobs and sreport output in memory and answers query
+    requests from the CLI over a Unix domain socket. A background thread
+    syncs new jobs and re-queries open sreport spans every refresh_interval
+    seconds.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, refresh_interval=SERVER_REFRESH_INTERVAL):
+        from .store.jobs import JobCache
+        from .store.cache import MemorySreportCache
+
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.job_cache = JobCache()
+        self.sreport_cache = MemorySreportCache()
+        self._stopped = threading.Event()
+
+        # SocketServer classes are old-style on Python 2, so super() is not used.
+        UnixStreamServer.__init__(self, path, QueryHandler)
+        os.chmod(path, 0o600)
+
+    def refresh(self):
+        try:
+            self.job_cache.sync()
+            self.sreport_cache.refresh()
+        except (OSError, subprocess.CalledProcessError) as e:
+            print('smonitor: refresh failed: {}'.format(e), file=sys.stderr)
+
+    def __refresh_loop(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self.refresh()
+
+    def start_refresh(self):
+        thread = threading.Thread(target=self.__refresh_loop)
+        thread.daemon = True
+        thread.start()
+
+    def server_close(self):
+        self._stopped.set()
+        UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+def __remove_stale_socket(path):
+    if not os.path.exists(path):
+        return
+
+    try:
+        request_query({'type': None}, path)
+    except DaemonUnavailable:
+        os.remove(path)
+        return
+    except RuntimeError:
+        pass
+
+    raise RuntimeError('smonitor daemon is already running at {}'.format(path))
+
+def serve(path=None, refresh_interval=SERVER_REFRESH_INTERVAL):
+    path = path if path else SERVER_SOCKET_PATH
+
+    socket_dir = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(socket_dir):
+        os.makedirs(socket_dir)
+
+    __remove_stale_socket(path)
+
+    server = SmonitorServer(path, refresh_interval=refresh_interval)
+    try:
+        server.refresh()
+        server.start_refresh()
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
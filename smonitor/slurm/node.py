@@ -2,11 +2,72 @@
 #
 from __future__ import print_function
 
+import re
+
+from collections import OrderedDict
+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(x):
+        return bin(x).count('1')
+
+hostlist_regex = re.compile(r'^([^\[]*)\[([^\]]*)\](.*)$')
+
+def parse_cpu_ids(cpu_ids):
+    # Converts a CPU ID list, e.g. '0-3,8,10-12' from `scontrol show job -d`,
+    # to a bitmask with bit n set for CPU n.
+    if cpu_ids is None or cpu_ids == '':
+        return 0
+    if isinstance(cpu_ids, int):
+        return 1 << cpu_ids
+
+    mask = 0
+    for cpu_range in str(cpu_ids).split(','):
+        begin, _, end = cpu_range.partition('-')
+        begin = int(begin)
+        end = int(end) if end else begin
+        mask |= ((1 << (end - begin + 1)) - 1) << begin
+    return mask
+
+def __split_hostlist(hostlist):
+    # Splits at commas outside of brackets.
+    depth = 0
+    start = 0
+    for n, c in enumerate(hostlist):
+        if c == '[':
+            depth += 1
+        elif c == ']':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            yield hostlist[start:n]
+            start = n + 1
+    yield hostlist[start:]
+
+def expand_hostlist(hostlist):
+    # Expands a Slurm hostlist, e.g. 'tara-c-[001-003,005],tara-m-001', to a
+    # list of node names.
+    names = []
+    for host in __split_hostlist(hostlist):
+        match = hostlist_regex.match(host)
+        if not match:
+            if host:
+                names.append(host)
+            continue
+
+        prefix, ranges, suffix = match.groups()
+        for host_range in ranges.split(','):
+            begin, _, end = host_range.partition('-')
+            width = len(begin)
+            for n in range(int(begin), int(end if end else begin) + 1):
+                names += expand_hostlist('{}{:0{width}d}{}'.format(prefix, n, suffix, width=width))
+    return names
+
 class NodeSpecification(object):
     def __init__(self, sockets, cpus_per_socket):
         self.sockets = sockets
         self.cpus_per_socket = cpus_per_socket
-    
+
     @property
     def cpus(self):
         return self.sockets * self.cpus_per_socket
@@ -15,14 +76,14 @@ class NodeInformation(object):
     def __init__(self, spec):
         if type(spec) is not NodeSpecification:
             raise TypeError('spec must be a NodeSpecification instance')
-        
+
         self._spec = spec
-        self._cpu_set = [0x0]*self._spec.sockets
-    
+        self._cpu_usage = [0x0]*self._spec.sockets
+
     @property
     def specification(self):
         return self._spec
-    
+
     @property
     def cpus_per_socket(self):
         return self._spec.cpus_per_socket
@@ -32,44 +93,25 @@ class NodeInformation(object):
         return self._spec.sockets
 
     @specification.setter
-    def specification(self, val):
+    def specification(self, spec):
         if type(spec) is not NodeSpecification:
             raise TypeError('specification must be a NodeSpecification instance')
         self._spec = spec
 
-    def set_cpus(self, cpu_range):
-        self._cpu_usage = [0x0]*self._spec.sockets
-
-        if type(cpu_range) is str:
-            cpu_range = [int(x) for x in cpu_range.split('-')]
-
-        if len(cpu_range) == 1:
-            cpu_range = [cpu_range[0], cpu_range[0]]
-
-        for socket in range(self.specification.sockets):
-            if cpu_range[0] >= (socket+1) * self.cpus_per_socket:
-                # the CPU range belongs to other sockets
-                continue
-
-            if cpu_range[1] < socket * self.cpus_per_socket:
-                # the CPU range belongs to other sockets
-                break
-            
-            begin = max(cpu_range[0], socket * self.cpus_per_socket)
-            end = min(cpu_range[1], (socket+1) * self.cpus_per_socket - 1)
-
-            cpu_init_id = socket * self.cpus_per_socket
+    def set_cpus(self, cpu_ids):
+        # cpu_ids: a CPU ID list, e.g. '0-3,8,10-12', or a [begin, end] range.
+        if type(cpu_ids) in [list, tuple]:
+            cpu_ids = '-'.join(str(x) for x in cpu_ids)
+        self.set_bitmask(parse_cpu_ids(cpu_ids))
 
-            begin_mask = (1 << (begin - cpu_init_id)) - 1
-            end_mask = (1 << (end - cpu_init_id+ 1)) - 1
-
-            cpus_mask = end_mask ^ begin_mask
-
-            self._cpu_usage[socket] = cpus_mask
+    def set_bitmask(self, mask):
+        # Splits a node bitmask into one bitmask per socket.
+        socket_mask = (1 << self.cpus_per_socket) - 1
+        self._cpu_usage = [(mask >> (socket * self.cpus_per_socket)) & socket_mask for socket in range(self.sockets)]
 
     def __str__(self):
         return ' '.join(["{:0{length}b}".format(x, length=self.cpus_per_socket)[::-1] for x in self._cpu_usage])
-        
+
     def __repr__(self):
         return str(self)
 
@@ -77,4 +119,111 @@ class NodeInformation(object):
         if self.cpus_per_socket * self.sockets <= max_length:
             return delimiter.join(["{:0{length}b}".format(x, length=self.cpus_per_socket)[::-1] for x in self._cpu_usage])
         else:
-            return delimiter.join(["{:0{length}X}".format(x, length=self.cpus_per_socket/4)[::-1] for x in self._cpu_usage])
+            return delimiter.join(["{:0{length}X}".format(x, length=(self.cpus_per_socket + 3)//4)[::-1] for x in self._cpu_usage])
+
+class ClusterBitmap(object):
+    """Allocated CPUs of every node of a cluster, one bitset row per node.
+
+    A row is an int with bit n set when CPU n of the node is allocated, so
+    occupancy of a socket or a node is a popcount of its bits. Node types are
+    looked up in `specifications`, e.g. config.NODE_SPECIFICATIONS, by node
+    name prefix.
+    """
+
+    def __init__(self, specifications):
+        self.specifications = specifications
+        self.names = []
+        self.node_types = []
+        self.specs = []
+        self.states = []
+        self.rows = []
+        self._index = {}
+
+    def node_type(self, name):
+        for node_type in self.specifications:
+            if name.startswith(node_type + '-'):
+                return node_type
+        return None
+
+    def add_node(self, name, spec=None, state=None):
+        # spec is used for nodes of an unknown type.
+        if name in self._index:
+            return self._index[name]
+
+        node_type = self.node_type(name)
+        if node_type is not None:
+            spec = self.specifications[node_type]
+        elif spec is None:
+            raise ValueError("unknown node type of '{}'".format(name))
+
+        self._index[name] = len(self.rows)
+        self.names.append(name)
+        self.node_types.append(node_type if node_type is not None else 'other')
+        self.specs.append(spec)
+        self.states.append(state)
+        self.rows.append(0)
+        return self._index[name]
+
+    def set_cpus(self, name, cpu_ids):
+        n = self._index[name] if name in self._index else self.add_node(name)
+        self.rows[n] |= parse_cpu_ids(cpu_ids)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def node_information(self, name):
+        n = self._index[name]
+        node = NodeInformation(self.specs[n])
+        node.set_bitmask(self.rows[n])
+        return node
+
+    def socket_usage(self, n):
+        # Allocated CPUs of each socket of row n.
+        spec = self.specs[n]
+        socket_mask = (1 << spec.cpus_per_socket) - 1
+        row = self.rows[n]
+        return [popcount((row >> (socket * spec.cpus_per_socket)) & socket_mask) for socket in range(spec.sockets)]
+
+    def summary(self, available=None):
+        # Returns per node type occupancy. available(state) tells whether a
+        # node can run jobs; free CPUs of other nodes, e.g. DOWN or DRAIN
+        # nodes, are not counted as free. Fragmentation is the share of free
+        # CPUs on sockets that are partly allocated.
+        types = OrderedDict()
+        for n, row in enumerate(self.rows):
+            node_type = self.node_types[n]
+            spec = self.specs[n]
+            result = types.get(node_type)
+            if result is None:
+                result = types[node_type] = OrderedDict([
+                    ('node_type', node_type), ('nodes', 0), ('cpus', 0), ('alloc_cpus', 0), ('free_cpus', 0),
+                    ('idle_nodes', 0), ('mixed_nodes', 0), ('full_nodes', 0), ('unavailable_nodes', 0),
+                    ('free_sockets', 0), ('fragmented_cpus', 0)])
+
+            alloc = popcount(row)
+            result['nodes'] += 1
+            result['cpus'] += spec.cpus
+            result['alloc_cpus'] += alloc
+
+            if available is not None and not available(self.states[n]):
+                result['unavailable_nodes'] += 1
+                continue
+
+            result['free_cpus'] += spec.cpus - alloc
+            if alloc == 0:
+                result['idle_nodes'] += 1
+                result['free_sockets'] += spec.sockets
+            elif alloc == spec.cpus:
+                result['full_nodes'] += 1
+            else:
+                result['mixed_nodes'] += 1
+                for used in self.socket_usage(n):
+                    if used == 0:
+                        result['free_sockets'] += 1
+                    elif used < spec.cpus_per_socket:
+                        result['fragmented_cpus'] += spec.cpus_per_socket - used
+
+        for result in types.values():
+            result['occupancy'] = result['alloc_cpus'] / float(result['cpus']) if result['cpus'] else 0.0
+            result['fragmentation'] = result['fragmented_cpus'] / float(result['free_cpus']) if result['free_cpus'] else 0.0
+        return list(types.values())
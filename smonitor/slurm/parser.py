@@ -5,10 +5,119 @@ from __future__ import print_function
 
 import re
 import json
+import itertools
 
 from pprint import pprint
 from collections import OrderedDict
 
+class LazyRecord(dict):
+    """scontrol record whose values are converted, e.g. '40' to 40 and
+    'cpu=4,mem=18400M' to a dict, when they are first read.
+
+    Reading a key converts only that value; items(), values(), comparisons
+    and copies convert every remaining value first. Copies are plain dicts.
+    """
+
+    def __init__(self, fields=None, raw=None):
+        dict.__init__(self, fields or {})
+        # Strings of the values not converted yet.
+        self._nested = raw if raw is not None else {}
+
+    def __missing__(self, key):
+        value = SlurmParser.parse_value(self._nested.pop(key))
+        dict.__setitem__(self, key, value)
+        return value
+
+    def materialize(self):
+        # Converts every value not converted yet.
+        if self._nested:
+            parse_value = SlurmParser.parse_value
+            dict.update(self, [(k, parse_value(v)) for k, v in self._nested.items()])
+            self._nested = {}
+        return self
+
+    def __setitem__(self, key, value):
+        self._nested.pop(key, None)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if key in self._nested:
+            del self._nested[key]
+        else:
+            dict.__delitem__(self, key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self._nested
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._nested)
+
+    def __iter__(self):
+        return itertools.chain(dict.__iter__(self), list(self._nested))
+
+    def get(self, key, default=None):
+        if key in self._nested:
+            return self[key]
+        return dict.get(self, key, default)
+
+    def keys(self):
+        self.materialize()
+        return dict.keys(self)
+
+    def values(self):
+        self.materialize()
+        return dict.values(self)
+
+    def items(self):
+        self.materialize()
+        return dict.items(self)
+
+    if hasattr(dict, 'iteritems'):
+        def iterkeys(self):
+            return iter(self)
+
+        def itervalues(self):
+            return dict.itervalues(self.materialize())
+
+        def iteritems(self):
+            return dict.iteritems(self.materialize())
+
+        def has_key(self, key):
+            return key in self
+
+    def pop(self, key, *default):
+        if key in self._nested:
+            self[key]
+        return dict.pop(self, key, *default)
+
+    def setdefault(self, key, default=None):
+        if key in self._nested:
+            return self[key]
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def copy(self):
+        return dict(self.materialize())
+
+    def __eq__(self, other):
+        if isinstance(other, LazyRecord):
+            other.materialize()
+        return dict.__eq__(self.materialize(), other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return dict.__repr__(self.materialize())
+
+    def __reduce__(self):
+        return (dict, (dict(self.materialize()),))
+
 class SlurmParser(object):
     APPEND = 'APPEND'
     FIRST = 'FIRST'
@@ -30,10 +139,72 @@ class SlurmParser(object):
         return v.strip() 
 
     @staticmethod
-    def parse_job_info(slurm_output, key=None):
+    def parse_subentries(value):
+        # Parses a nested value such as 'cpu=4,mem=18400M,node=1' into a
+        # dict, or returns value unchanged if it has no subentries.
+        subentry_list = SlurmParser.subentry_regex.findall(value)
+        if len(subentry_list) > 0:
+            return {y[0]:(SlurmParser.__conv(y[1]) if y[1] else None) for y in subentry_list}
+        return value
+
+    @staticmethod
+    def parse_value(value):
+        # Converts a value of `scontrol show` output as parse_job_info does.
+        value = SlurmParser.__conv(value) if value else None
+        if value and not isinstance(value, int):
+            value = SlurmParser.parse_subentries(value)
+        return value
+
+    @staticmethod
+    def __parse_repeated(pairs):
+        # Converts the values of a record with repeated keys, e.g. the Nodes
+        # and CPU_IDs of each node in `scontrol -d show job`, collecting them
+        # into lists as parse_job_info does.
+        entry = {}
+        for p, value in pairs:
+            value = SlurmParser.parse_value(value)
+            if p in entry and entry[p] is not None:
+                if type(entry[p]) is list:
+                    entry[p].append(value)
+                else:
+                    entry[p] = [entry[p], value]
+            else:
+                entry[p] = value
+        return entry
+
+    @staticmethod
+    def iter_job_info(slurm_output):
+        # Yields a LazyRecord per line of `scontrol --oneliner show ...`
+        # output. KEY=VALUE pairs are found by a single regex pass over the
+        # line and values are only converted when they are read. Records are
+        # the same as those of parse_job_info.
         if type(slurm_output) is str:
             slurm_output = slurm_output.splitlines()
 
+        findall = SlurmParser.entry_regex.findall
+        for line in slurm_output:
+            pairs = findall(line)
+            if not pairs:
+                continue
+
+            raw = dict(pairs)
+            if len(raw) == len(pairs):
+                yield LazyRecord(raw=raw)
+            else:
+                yield LazyRecord(SlurmParser.__parse_repeated(pairs))
+
+    @staticmethod
+    def parse_job_info(slurm_output, key=None, oneliner=False):
+        # oneliner: slurm_output is `scontrol --oneliner` output, parsed by
+        # iter_job_info.
+        if type(slurm_output) is str:
+            slurm_output = slurm_output.splitlines()
+
+        if oneliner:
+            if key:
+                return {entry[key]:entry for entry in SlurmParser.iter_job_info(slurm_output)}
+            return list(SlurmParser.iter_job_info(slurm_output))
+
         if key: 
             output = {}
         else:
@@ -61,11 +232,12 @@ class SlurmParser(object):
             params_list = SlurmParser.entry_regex.findall(line)
             params = {y[0]:(SlurmParser.__conv(y[1]) if y[1] else None) for y in params_list}
             for p in params:
-                if params[p]:
-                    subentry_list = SlurmParser.subentry_regex.findall(params[p])
-                    if len(subentry_list) > 0:
-                        params[p] = {y[0]:(SlurmParser.__conv(y[1]) if y[1] else None) for y in subentry_list}
-                if entry.get(p, None):
+                # Numbers were already converted and have no subentries.
+                if params[p] and not isinstance(params[p], int):
+                    params[p] = SlurmParser.parse_subentries(params[p])
+                # Repeated keys, e.g. the Nodes and CPU_IDs of each node in
+                # `scontrol show job -d`, are collected into a list.
+                if p in entry and entry[p] is not None:
                     if type(entry[p]) is list:
                         entry[p].append(params[p])
                     else:
@@ -82,13 +254,11 @@ class SlurmParser(object):
         return output
 
     @staticmethod
-    def parse_output(slurm_output, headers=None, key=None, key_conflict=APPEND, convert_key=None):
-        # convert_key: a function for converting headers string, e.g. converting 
-        # from CamelCast to snake_case
-
-        if type(slurm_output) is str:
-            slurm_output = slurm_output.splitlines()
-
+    def iter_output(slurm_output, headers=None, convert_key=None):
+        # Generator version of parse_output. slurm_output can be any iterable
+        # of lines, e.g. a subprocess pipe, and records are yielded as soon as
+        # their line is read.
+        #
         # Remove sreport information sections between two horizontal lines.
         #
         # Example:
@@ -99,27 +269,52 @@ class SlurmParser(object):
         # Cluster|Allocated|Down|PLND Down|Idle|Reserved|Reported
         # tara|3084213|0|0|2047833|1203954|6336000
         #
+
+        if type(slurm_output) is str:
+            slurm_output = slurm_output.splitlines()
+
+        lines = iter(slurm_output)
         
-        if SlurmParser.sreport_comment_regex.match(slurm_output[0]):
-            slurm_output.pop(0)
-            while not SlurmParser.sreport_comment_regex.match(slurm_output[0]):
-                slurm_output.pop(0)
-            slurm_output.pop(0)
+        for line in lines:
+            if SlurmParser.sreport_comment_regex.match(line):
+                for line in lines:
+                    if SlurmParser.sreport_comment_regex.match(line):
+                        break
+                line = next(lines, None)
+            break
+        else:
+            return
+
+        if line is None:
+            return
 
         if not headers:
-            headers = map(lambda x: x.strip(), slurm_output.pop(0).split('|'))
+            headers = [x.strip() for x in line.split('|')]
+        else:
+            # The first line is already a record
+            lines = itertools.chain([line], lines)
 
         if convert_key:
-            headers = map(convert_key, headers)
+            headers = [convert_key(x) for x in headers]
+
+        headers = [x.strip() for x in headers]
+
+        for line in lines:
+            yield {k:SlurmParser.__conv(v) for k,v in zip(headers, line.split('|'))}
+
+    @staticmethod
+    def parse_output(slurm_output, headers=None, key=None, key_conflict=APPEND, convert_key=None):
+        # convert_key: a function for converting headers string, e.g. converting 
+        # from CamelCast to snake_case
 
-        output_map = [zip(headers,line.split('|')) for line in slurm_output]
+        records = SlurmParser.iter_output(slurm_output, headers=headers, convert_key=convert_key)
 
         if not key:            
-            return [{k.strip():SlurmParser.__conv(v) for k,v in record} for record in output_map]
+            return list(records)
 
         if key: 
             ret = {}
-            for d in ([{k.strip():SlurmParser.__conv(v) for k,v in record} for record in output_map]):
+            for d in records:
                 if ret.get(d[key], None):
                     if key_conflict == SlurmParser.APPEND:
                         if type(ret[d[key]]) is dict: 
@@ -0,0 +1,218 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+from ..utils.string import to_snake_case
+from ..utils.time import date_range, TimeSpan
+from ..utils.process import stream_lines, CommandPool
+from ..utils.profile import stage, add, profile_iter
+from .parser import SlurmParser
+
+SACCT_FIELDS=[
+    'Account',
+    'AdminComment',
+    'AllocCPUS',
+    'AllocGRES',
+    'AllocNodes',
+    'AllocTRES',
+    'AssocID',
+    'AveCPU',
+    'AveCPUFreq',
+    'AveDiskRead',
+    'AveDiskWrite',
+    'AvePages',
+    'AveRSS',
+    'AveVMSize',
+    'BlockID',
+    'Cluster',
+    'Comment',
+    'ConsumedEnergy',
+    'ConsumedEnergyRaw',
+    'CPUTime',
+    'CPUTimeRAW',
+    'DerivedExitCode',
+    'Elapsed',
+    'ElapsedRaw',
+    'Eligible',
+    'End',
+    'ExitCode',
+    'GID',
+    'Group',
+    'JobID',
+    'JobIDRaw',
+    'JobName',
+    'Layout',
+    'MaxDiskRead',
+    'MaxDiskReadNode',
+    'MaxDiskReadTask',
+    'MaxDiskWrite',
+    'MaxDiskWriteNode',
+    'MaxDiskWriteTask',
+    'MaxPages',
+    'MaxPagesNode',
+    'MaxPagesTask',
+    'MaxRSS',
+    'MaxRSSNode',
+    'MaxRSSTask',
+    'MaxVMSize',
+    'MaxVMSizeNode',
+    'MaxVMSizeTask',
+    'McsLabel',
+    'MinCPU',
+    'MinCPUNode',
+    'MinCPUTask',
+    'NCPUS',
+    'NNodes',
+    'NodeList',
+    'NTasks',
+    'Priority',
+    'Partition',
+    'QOS',
+    'QOSRAW',
+    'ReqCPUFreq',
+    'ReqCPUFreqMin',
+    'ReqCPUFreqMax',
+    'ReqCPUFreqGov',
+    'ReqCPUS',
+    'ReqGRES',
+    'ReqMem',
+    'ReqNodes',
+    'ReqTRES',
+    'Reservation',
+    'ReservationId',
+    'Reserved',
+    'ResvCPU',
+    'ResvCPURAW',
+    'Start',
+    'State',
+    'Submit',
+    'Suspended',
+    'SystemCPU',
+    'SystemComment',
+    'Timelimit',
+    'TimelimitRaw',
+    'TotalCPU',
+    'TRESUsageInAve',
+    'TRESUsageInMax',
+    'TRESUsageInMaxNode',
+    'TRESUsageInMaxTask',
+    'TRESUsageInMin',
+    'TRESUsageInMinNode',
+    'TRESUsageInMinTask',
+    'TRESUsageInTot',
+    'TRESUsageOutAve',
+    'TRESUsageOutMax',
+    'TRESUsageOutMaxNode',
+    'TRESUsageOutMaxTask',
+    'TRESUsageOutMin',
+    'TRESUsageOutMinNode',
+    'TRESUsageOutMinTask',
+    'TRESUsageOutTot',
+    'UID',
+    'User',
+    'UserCPU',
+    'WCKey',
+    'WCKeyID',
+    'WorkDir'
+]
+
+SACCT_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+# sacct options of the job filters of query/filters.py
+SACCT_FILTER_OPTIONS = [
+    ('users', '-u'),
+    ('partitions', '-r'),
+    ('states', '-s'),
+    ('qos', '-q'),
+    ('nodelist', '-N'),
+]
+
+def sacct_command(begin_date, end_date, fields=SACCT_FIELDS, account_list=None, job_list=None, noconvert=False, clusters=None, filters=None):
+    # filters: {name: values} of SACCT_FILTER_OPTIONS, see plan_job_filters.
+    filters = filters if filters else {}
+
+    # -u replaces the jobs of all users (-a) with the jobs of its users.
+    sacct_command = ['sacct', '-P', '-X' if filters.get('users') else '-aX']
+    if noconvert:
+        sacct_command.append('--noconvert')
+    if clusters:
+        sacct_command += ['-M', ','.join(clusters)]
+
+    sacct_command += [
+        '--format={}'.format(','.join(fields)),
+        '--start={}'.format(begin_date.strftime(SACCT_DATETIME_FORMAT)),
+        '--end={}'.format(end_date.strftime(SACCT_DATETIME_FORMAT))
+    ]
+
+    if account_list:
+        sacct_command += ['-A', ','.join(account_list)]
+    if job_list:
+        sacct_command += ['-j', ','.join(job_list)]
+    for name, option in SACCT_FILTER_OPTIONS:
+        if filters.get(name):
+            sacct_command += [option, ','.join(filters[name])]
+
+    return sacct_command
+
+def stream_sacct(begin_date, end_date, fields=SACCT_FIELDS, account_list=None, job_list=None, noconvert=False, filters=None):
+    # Yields parsed sacct records while sacct is still writing its output.
+    command = sacct_command(begin_date, end_date, fields=fields, account_list=account_list, job_list=job_list, noconvert=noconvert, filters=filters)
+
+    return profile_iter('parse', SlurmParser.iter_output(stream_lines(command), convert_key=to_snake_case))
+
+def query_sacct(begin_date, end_date, fields=SACCT_FIELDS, account_list=None, job_list=None, noconvert=False):
+    return list(stream_sacct(begin_date, end_date, fields=fields, account_list=account_list, job_list=job_list, noconvert=noconvert))
+
+def __job_order(job):
+    try:
+        return (0, int(job['job_id_raw']))
+    except (TypeError, ValueError):
+        return (1, str(job['job_id_raw']))
+
+def shard_range(begin_date, end_date, shard='month'):
+    # Splits [begin_date, end_date] into consecutive shards covering the whole
+    # period, including a partial last day for daily shards.
+    shards = list(date_range(begin_date, end_date, freq=shard))
+    if not shards:
+        return [TimeSpan(begin_date, end_date)]
+    if shards[-1].end < end_date:
+        shards.append(TimeSpan(shards[-1].end, end_date))
+    return shards
+
+def query_sharded_sacct(begin_date, end_date, shard='month', workers=1, fields=SACCT_FIELDS, account_list=None, noconvert=False, clusters=None, filters=None):
+    # Runs one sacct command per shard, up to `workers` at a time, and merges
+    # the results. Jobs running across a shard boundary are returned by every
+    # shard they overlap and are deduplicated by JobIDRaw. For requeued jobs
+    # sacct reports the latest run inside each window, so the record from the
+    # latest shard is kept, as it is in a single sacct call over the period.
+    # Jobs are returned in JobIDRaw order like the unsharded sacct output.
+    #
+    # clusters: query every shard (the whole period if shard is None) of each
+    # cluster with its own sacct command. Job IDs are only unique within a
+    # cluster, so jobs are deduplicated per cluster and returned cluster by
+    # cluster, each with its 'cluster' field.
+    required = ['JobIDRaw', 'Cluster'] if clusters else ['JobIDRaw']
+    if any(f not in fields for f in required):
+        fields = [f for f in SACCT_FIELDS if f in fields or f in required]
+
+    command_pool = CommandPool(workers)
+
+    def sacct(item):
+        cluster, d = item
+        command = sacct_command(d.start, d.end, fields=fields, account_list=account_list, noconvert=noconvert, clusters=[cluster] if cluster else None, filters=filters)
+        sacct_output = command_pool.check_output(command)
+        with stage('parse'):
+            results = SlurmParser.parse_output(sacct_output, convert_key=to_snake_case)
+        add('parse', rows=len(results))
+        return results
+
+    clusters = clusters if clusters else [None]
+    shards = [(cluster, d) for cluster in clusters for d in shard_range(begin_date, end_date, shard=shard)]
+
+    jobs = {}
+    for (cluster, _), shard_results in command_pool.imap(sacct, shards):
+        for job in shard_results:
+            jobs[(cluster, job['job_id_raw'])] = job
+
+    cluster_order = {cluster:n for n, cluster in enumerate(clusters)}
+    return [job for _, job in sorted(jobs.items(), key=lambda item: (cluster_order[item[0][0]], __job_order(item[1])))]
@@ -0,0 +1,26 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+from ..utils.process import stream_lines
+from ..utils.profile import stage, add
+from .parser import SlurmParser
+
+def scontrol_command(entity, details=False, oneliner=False, cluster=None):
+    scontrol_command = ['scontrol']
+    if cluster:
+        scontrol_command += ['-M', cluster]
+    if details:
+        scontrol_command.append('-d')
+    if oneliner:
+        scontrol_command.append('-o')
+    return scontrol_command + ['show', entity]
+
+def query_scontrol(entity, details=False, oneliner=False, cluster=None):
+    # Returns the parsed `scontrol show ENTITY` records, e.g. 'job' or 'node'.
+    # With oneliner, records are LazyRecords from the single-pass parser.
+    lines = list(stream_lines(scontrol_command(entity, details=details, oneliner=oneliner, cluster=cluster)))
+    with stage('parse'):
+        results = SlurmParser.parse_job_info(lines, oneliner=oneliner)
+    add('parse', rows=len(results))
+    return results
@@ -0,0 +1,35 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+from ..utils.string import to_snake_case
+from ..utils.process import stream_lines
+from ..utils.profile import profile_iter
+from .parser import SlurmParser
+
+# Columns and squeue format specifiers. Fields that change on every poll,
+# e.g. the run time, are left out so unchanged jobs stay unchanged; %R is the
+# node list of running jobs or the reason pending jobs are waiting.
+SQUEUE_FIELDS = [
+    ('JobID', '%i'),
+    ('Partition', '%P'),
+    ('Name', '%j'),
+    ('User', '%u'),
+    ('Account', '%a'),
+    ('State', '%T'),
+    ('StartTime', '%S'),
+    ('Nodes', '%D'),
+    ('Cpus', '%C'),
+    ('NodeList', '%R'),
+]
+
+def squeue_command(fields=SQUEUE_FIELDS, account_list=None):
+    squeue_command = ['squeue', '-h', '-a', '-o', '|'.join(f for _, f in fields)]
+    if account_list:
+        squeue_command += ['-A', ','.join(account_list)]
+    return squeue_command
+
+def stream_squeue(fields=SQUEUE_FIELDS, account_list=None):
+    # Yields parsed squeue records, one per job.
+    command = squeue_command(fields=fields, account_list=account_list)
+    return profile_iter('parse', SlurmParser.iter_output(stream_lines(command), headers=[h for h, _ in fields], convert_key=to_snake_case))
@@ -0,0 +1,14 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+SREPORT_DATE_FORMAT = '%Y-%m-%d'
+
+def sreport_command(begin_date, end_date, time_unit='min', cluster=None):
+    # cluster: report this cluster instead of the default one.
+    return 'sreport -P -t {}{} cluster utilization start={} end={}'.format(
+        time_unit,
+        ' -M {}'.format(cluster) if cluster else '',
+        begin_date.strftime(SREPORT_DATE_FORMAT),
+        end_date.strftime(SREPORT_DATE_FORMAT)
+    ).split(' ')
@@ -0,0 +1,304 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+from array import array
+from datetime import datetime, timedelta
+
+try:
+    INT_TYPES = (int, long)
+except NameError:
+    INT_TYPES = (int,)
+
+EPOCH = datetime(1970, 1, 1)
+
+OBJECT = 'object'
+INT = 'int'
+FLOAT = 'float'
+TIME = 'time'
+CATEGORY = 'category'
+
+# Storage type of known job fields. Fields not listed here are kept as Python
+# objects. A typed column is converted to an object column when it receives
+# a value it cannot store, so unexpected sacct output is never lost.
+JOB_COLUMN_TYPES = {
+    'account': CATEGORY,
+    'alloc_tres': CATEGORY,
+    'cluster': CATEGORY,
+    'group': CATEGORY,
+    'partition': CATEGORY,
+    'qos': CATEGORY,
+    'req_tres': CATEGORY,
+    'state': CATEGORY,
+    'user': CATEGORY,
+    'wc_key': CATEGORY,
+    '__processed': CATEGORY,
+    'alloc_cpus': INT,
+    'alloc_nodes': INT,
+    'cpu_time_raw': INT,
+    'elapsed_raw': INT,
+    'gid': INT,
+    'job_id_raw': INT,
+    'n_nodes': INT,
+    'ncpus': INT,
+    'priority': INT,
+    'req_cpus': INT,
+    'timelimit_raw': INT,
+    'uid': INT,
+    'core_hour': FLOAT,
+    'elasped_mins': FLOAT,
+    'reserved': FLOAT,
+    'su_usage': FLOAT,
+    'end': TIME,
+}
+
+class ColumnTypeError(TypeError):
+    pass
+
+class _ObjectColumn(object):
+    __slots__ = ('values',)
+    kind = OBJECT
+
+    def __init__(self, values=None):
+        self.values = list(values) if values else []
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, n):
+        return self.values[n]
+
+    def append(self, val):
+        self.values.append(val)
+
+class _IntColumn(_ObjectColumn):
+    kind = INT
+
+    def __init__(self):
+        self.values = array('l')
+
+    def append(self, val):
+        if type(val) not in INT_TYPES:
+            raise ColumnTypeError()
+        try:
+            self.values.append(val)
+        except OverflowError:
+            raise ColumnTypeError()
+
+class _FloatColumn(_ObjectColumn):
+    # Integer values (e.g. su_usage of a job without allocation) are returned
+    # as int so the output is the same as for a dict record.
+    __slots__ = ('values', 'is_int')
+    kind = FLOAT
+
+    def __init__(self):
+        self.values = array('d')
+        self.is_int = bytearray()
+
+    def __iter__(self):
+        return (self[n] for n in range(len(self.values)))
+
+    def __getitem__(self, n):
+        if self.is_int[n]:
+            return int(self.values[n])
+        return self.values[n]
+
+    def append(self, val):
+        if type(val) is float:
+            self.is_int.append(0)
+        elif type(val) in INT_TYPES and abs(val) < 2**53:
+            self.is_int.append(1)
+        else:
+            raise ColumnTypeError()
+        self.values.append(val)
+
+class _TimeColumn(_ObjectColumn):
+    # datetime values stored as seconds since EPOCH, NaN for None.
+    kind = TIME
+
+    def __init__(self):
+        self.values = array('d')
+
+    def __iter__(self):
+        return (self[n] for n in range(len(self.values)))
+
+    def __getitem__(self, n):
+        val = self.values[n]
+        if val != val:
+            return None
+        return EPOCH + timedelta(seconds=val)
+
+    def append(self, val):
+        if val is None:
+            self.values.append(float('nan'))
+        elif type(val) is datetime and val.tzinfo is None:
+            self.values.append((val - EPOCH).total_seconds())
+        else:
+            raise ColumnTypeError()
+
+class _CategoryColumn(_ObjectColumn):
+    # Each distinct value is stored once. Dict values such as parsed TRES
+    # are shared between rows and must not be modified by the caller.
+    __slots__ = ('values', 'categories', '_codes')
+    kind = CATEGORY
+
+    def __init__(self):
+        self.values = array('i')
+        self.categories = []
+        self._codes = {}
+
+    def __iter__(self):
+        return (self.categories[c] for c in self.values)
+
+    def __getitem__(self, n):
+        return self.categories[self.values[n]]
+
+    def append(self, val):
+        key = tuple(sorted(val.items())) if isinstance(val, dict) else val
+        try:
+            code = self._codes.get(key)
+        except TypeError:
+            raise ColumnTypeError()
+        if code is None:
+            code = len(self.categories)
+            self._codes[key] = code
+            self.categories.append(val)
+        self.values.append(code)
+
+COLUMN_CLASSES = {
+    OBJECT: _ObjectColumn,
+    INT: _IntColumn,
+    FLOAT: _FloatColumn,
+    TIME: _TimeColumn,
+    CATEGORY: _CategoryColumn,
+}
+
+class JobRecord(object):
+    """Read-only dict-like view of one row of a JobTable."""
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._table._columns[key][self._row]
+
+    def __contains__(self, key):
+        return key in self._table._columns
+
+    def __iter__(self):
+        return iter(self._table.fields)
+
+    def __len__(self):
+        return len(self._table.fields)
+
+    def get(self, key, default=None):
+        column = self._table._columns.get(key)
+        return column[self._row] if column is not None else default
+
+    def keys(self):
+        return list(self._table.fields)
+
+    def values(self):
+        return [self[k] for k in self._table.fields]
+
+    def items(self):
+        return [(k, self[k]) for k in self._table.fields]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+class JobTable(object):
+    """Column-oriented container for job records.
+
+    Records are appended as dicts and read back as JobRecord views with the
+    same field names. Values are stored in typed arrays according to
+    `column_types`, which takes a fraction of the memory of one dict per job.
+    """
+
+    def __init__(self, column_types=JOB_COLUMN_TYPES):
+        self.fields = []
+        self._columns = {}
+        self._column_types = column_types
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, row):
+        if row < 0:
+            row = row + self._length
+        if not 0 <= row < self._length:
+            raise IndexError('row index out of range')
+        return JobRecord(self, row)
+
+    def __iter__(self):
+        return (JobRecord(self, n) for n in range(self._length))
+
+    def column_type(self, field):
+        # Storage type of field, OBJECT if its column fell back to objects.
+        return self._columns[field].kind
+
+    def factorize(self, field):
+        # Returns (codes, labels) where labels[codes[n]] is the value of field
+        # in row n. Category columns return their stored codes without a copy.
+        column = self._columns[field]
+        if column.kind == CATEGORY:
+            return column.values, column.categories
+
+        codes = array('i')
+        labels = []
+        label_codes = {}
+        for val in column:
+            code = label_codes.get(val)
+            if code is None:
+                code = len(labels)
+                label_codes[val] = code
+                labels.append(val)
+            codes.append(code)
+        return codes, labels
+
+    def rows(self, indices):
+        return (JobRecord(self, n) for n in indices)
+
+    def column(self, field):
+        # Decoded values of a single field, in row order.
+        return self._columns[field]
+
+    def __add_column(self, field):
+        self.fields.append(field)
+        self._columns[field] = COLUMN_CLASSES[self._column_types.get(field, OBJECT)]()
+        for _ in range(self._length):
+            self.__append_value(field, None)
+
+    def __append_value(self, field, val):
+        column = self._columns[field]
+        try:
+            column.append(val)
+        except ColumnTypeError:
+            column = _ObjectColumn(column)
+            column.append(val)
+            self._columns[field] = column
+
+    def append(self, record):
+        # Returns the row index of the new record.
+        for field in record:
+            if field not in self._columns:
+                self.__add_column(field)
+
+        for field in self.fields:
+            self.__append_value(field, record.get(field))
+
+        self._length = self._length + 1
+        return self._length - 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
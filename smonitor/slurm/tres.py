@@ -0,0 +1,64 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+# Maximum number of distinct TRES strings kept by parse_tres. The cache is
+# emptied when it is full.
+TRES_CACHE_SIZE = 65536
+
+_tres_cache = {}
+
+class TresDict(dict):
+    """Read-only dict of TRES counts, e.g. {'billing': 40, 'cpu': 40}.
+
+    parse_tres returns the same TresDict for every job with the same TRES
+    string, so it must not be modified. Copies are plain dicts.
+    """
+
+    def __readonly(self, *args, **kwargs):
+        raise TypeError('TresDict is shared between jobs and cannot be modified')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return dict(self)
+
+    def __reduce__(self):
+        return (TresDict, (dict(self),))
+
+def __tres_value(val):
+    try:
+        val = float(val)
+        if val.is_integer():
+            return int(val)
+        return val
+    except ValueError:
+        return val
+
+def parse_tres(val):
+    # Parses a sacct TRES string such as 'billing=40,cpu=40,mem=180G,node=1'.
+    # Numbers are converted to int or float, other values, e.g. '180G', are
+    # kept as strings. Returns None for an empty string.
+    if not val:
+        return None
+
+    tres = _tres_cache.get(val)
+    if tres is None:
+        tres = TresDict((k, __tres_value(v)) for k, v in (x.split('=') for x in val.strip().split(',')))
+        if len(_tres_cache) >= TRES_CACHE_SIZE:
+            _tres_cache.clear()
+        _tres_cache[val] = tres
+    return tres
+
+def tres_seconds(job, tres):
+    # Returns the allocated count of tres times the elapsed seconds of a job
+    # with a parsed alloc_tres, e.g. its billing seconds, or with tres None
+    # its elapsed seconds. Products of integer counts are exact, unlike the
+    # float usage fields of a job. Jobs without an allocation return 0.
+    alloc_tres = job.get('alloc_tres')
+    if not alloc_tres:
+        return 0
+    return (alloc_tres.get(tres, 0) if tres else 1) * int(job['elapsed_raw'])
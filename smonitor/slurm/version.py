@@ -0,0 +1,57 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+import os
+import subprocess
+
+from ..config import SLURM_VERSION_CACHE_PATH
+
+_slurm_version = None
+
+def __find_executable(name):
+    for path in os.environ.get('PATH', '').split(os.pathsep):
+        executable = os.path.join(path, name)
+        if os.path.isfile(executable) and os.access(executable, os.X_OK):
+            return os.path.realpath(executable)
+    return None
+
+def __read_cache(path, key):
+    try:
+        with open(path) as f:
+            cached_key, version = f.read().split('\n')[:2]
+    except (IOError, OSError, ValueError):
+        return None
+    return version if cached_key == key else None
+
+def __write_cache(path, key, version):
+    try:
+        cache_dir = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with open(path, 'w') as f:
+            f.write('{}\n{}\n'.format(key, version))
+    except (IOError, OSError):
+        pass
+
+def slurm_version(cache_path=SLURM_VERSION_CACHE_PATH):
+    # Returns the `sinfo --version` output, e.g. 'slurm 19.05.3-2'. The result
+    # is cached on disk, keyed by the sinfo path and modification time, so
+    # sinfo only runs again after Slurm is upgraded.
+    global _slurm_version
+    if _slurm_version:
+        return _slurm_version
+
+    sinfo = __find_executable('sinfo')
+    if not sinfo:
+        return 'unknown Slurm version'
+
+    key = '{}:{}'.format(sinfo, os.path.getmtime(sinfo))
+    version = __read_cache(cache_path, key) if cache_path else None
+    if not version:
+        version = subprocess.check_output([sinfo, '--version'], universal_newlines=True).strip()
+        if cache_path:
+            __write_cache(cache_path, key, version)
+
+    _slurm_version = version
+    return version
@@ -3,33 +3,49 @@
 #
 from __future__ import print_function
 
-import json
 import argparse
-import subprocess
 import sys
 
-from pprint import pprint
 from datetime import datetime
 
-from .config import __version__, SERVICE_BEGIN_DATE
+from .config import __version__, SERVICE_BEGIN_DATE, JOB_STORE_PATH, JOB_ARCHIVE_PATH, SERVER_SOCKET_PATH, SERVER_REFRESH_INTERVAL, WATCH_INTERVAL, WATCH_MAX_INTERVAL
 
-from .utils.io import generate_output
-from .utils.data import flattern_nested_dict
-from .query.utilization import query_utilization
-from .query.usage import query_usage, query_group_usage
+# Modules used by a single subcommand, e.g. the query modules, are imported
+# when the subcommand runs so `--help` and other subcommands start quickly.
+
+class VersionAction(argparse.Action):
+    # Like argparse's 'version' action, but only asks Slurm for its version
+    # when -V is given.
+
+    def __init__(self, option_strings, dest=argparse.SUPPRESS, default=argparse.SUPPRESS, help="show program's version number and exit"):
+        super(VersionAction, self).__init__(option_strings=option_strings, dest=dest, default=default, nargs=0, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        from .slurm.version import slurm_version
+        print('smonitor v.{} with {}'.format(__version__, slurm_version()))
+        parser.exit()
 
 def parse_args():
     def list_str(values):
         return values.split(',')
 
-    slurm_version = str(subprocess.check_output(['sinfo', '--version']))
-    version = 'smonitor v.{} with {}'.format(__version__, slurm_version)
-
     parser = argparse.ArgumentParser(prog='smonitor', description='Slurm monitoring tools')
     parser.add_argument(
-        'type', action='store', nargs='?', help="Monitoring metric. Valid values: 'utilization', 'usage'")
+        'type', action='store', nargs='?', help="Monitoring metric. Valid values: 'utilization', 'usage', 'nodes'. 'watch' shows the queue or nodes live, 'serve' starts the smonitor daemon, 'export' writes the jobs of the period to a job archive and 'import' writes the jobs of saved `sacct -P` output to one")
     parser.add_argument(
         '-A','--account', default=None, dest='account_list', action='store', type=list_str, help="a comma separated list of account to be displayed")
+    parser.add_argument(
+        '--users', default=None, action='store', type=list_str, help="a comma separated list of users whose 'usage' is reported")
+    parser.add_argument(
+        '--partitions', default=None, action='store', type=list_str, help="a comma separated list of partitions whose 'usage' is reported")
+    parser.add_argument(
+        '--states', default=None, action='store', type=list_str, help="a comma separated list of final job states, e.g. 'COMPLETED,TIMEOUT' or 'CD,TO', whose 'usage' is reported")
+    parser.add_argument(
+        '--qos', default=None, action='store', type=list_str, help="a comma separated list of QOS whose 'usage' is reported")
+    parser.add_argument(
+        '--nodelist', default=None, action='store', help="report the 'usage' of jobs which ran on any node of this hostlist, e.g. 'tara-c-[001-004]'")
+    parser.add_argument(
+        '-M', '--clusters', default=None, action='store', type=list_str, help="a comma separated list of clusters to report, queried concurrently. Rows have a 'cluster' field, usable in --groups_by. Default: the local cluster")
     parser.add_argument(
         '--fields', default=None, action='store', type=list_str, help="a comma separated list of fields.")
     parser.add_argument(
@@ -37,39 +53,147 @@ def parse_args():
     parser.add_argument(
         '--groups_by_fields', default=None, action='store', type=list_str, help="a comma separated list of fields to be displayed after grouping.")
     parser.add_argument(
-        '--format', action='store', help="Output format. Valid values: 'json'")
+        '--format', action='store', help="Output format. Valid values: 'table', 'json', 'jsonl', 'csv'. Default: 'table'")
     parser.add_argument(
         '--start', action='store', help="Period start for report. Supported format: YYYY-MM-DD.")
     parser.add_argument(
         '--end', action='store', help="Period ending for report. Supported format: YYYY-MM-DD.")
     parser.add_argument(
-        '--freq', action='store', default=None, help="Report frequency. Valid values: 'day', 'week', 'month', 'year'. Default: 'day'")
+        '--freq', action='store', default=None, help="Report frequency. Valid values: 'hour', 'day', 'week', 'month', 'year'. 'hour' is not supported by sreport. Default: 'day'")
     parser.add_argument(
         '-t', '--time-unit', dest='unit', action='store', default='min', help="Report unit. Valid values: 'sec', 'min', 'hour'. Default: 'min'")
+    parser.add_argument(
+        '--source', action='store', default='sreport', help="where utilization is computed from. Valid values: 'sreport', 'sacct' (allocated CPU time of jobs). Default: 'sreport'")
+    parser.add_argument(
+        '-j', '--jobs', default=1, action='store', type=int, help="maximum number of Slurm commands run concurrently. Default: 1")
+    parser.add_argument(
+        '-w', '--workers', default=1, action='store', type=int, help="number of processes parsing and aggregating the sacct output of 'usage'. Not supported with --store, --shard or -M/--clusters. Default: 1")
+    parser.add_argument(
+        '--engine', action='store', default='python', help="aggregation engine for --groups_by. Valid values: 'python', 'numpy'. Default: 'python'")
+    parser.add_argument(
+        '--shard', action='store', default=None, help="split the sacct query for usage into shards of this length, run concurrently with --jobs. Valid values: 'day', 'week', 'month', 'year'")
+    parser.add_argument(
+        '--store', nargs='?', const=JOB_STORE_PATH, default=None, action='store', help="read the jobs of group usage reports (--groups_by) from a local job store, syncing new jobs from sacct first. Default path: '{}'".format(JOB_STORE_PATH))
+    parser.add_argument(
+        '--archive', nargs='?', const=JOB_ARCHIVE_PATH, default=None, action='store', help="job archive read by 'usage' and written by 'export' and 'import'. --start and --end of 'usage' default to the archived period. Default path: '{}'".format(JOB_ARCHIVE_PATH))
+    parser.add_argument(
+        '--input', action='store', default='-', help="`sacct -P` output read by 'import', with its header line. Default: STDIN")
+    parser.add_argument(
+        '--refresh', action='store_true', help="re-run sreport for every 'utilization' span instead of reading ended spans from the sreport cache, and update the cache")
+    parser.add_argument(
+        '--per-node', dest='per_node', action='store_true', help="report 'nodes' occupancy of each node and socket instead of each node type")
+    parser.add_argument(
+        '--view', action='store', default='jobs', help="what 'watch' shows. Valid values: 'jobs', 'nodes'. Default: 'jobs'")
+    parser.add_argument(
+        '--interval', action='store', default=WATCH_INTERVAL, type=int, help="seconds between polls of 'watch'. Default: {}".format(WATCH_INTERVAL))
+    parser.add_argument(
+        '--max-interval', dest='max_interval', action='store', default=WATCH_MAX_INTERVAL, type=int, help="longest interval 'watch' backs off to while nothing changes. Default: {}".format(WATCH_MAX_INTERVAL))
+    parser.add_argument(
+        '--socket', action='store', default=SERVER_SOCKET_PATH, help="socket of the smonitor daemon. Default: '{}'".format(SERVER_SOCKET_PATH))
+    parser.add_argument(
+        '--refresh-interval', dest='refresh_interval', default=SERVER_REFRESH_INTERVAL, action='store', type=int, help="seconds between job and sreport refreshes of 'serve'. Default: {}".format(SERVER_REFRESH_INTERVAL))
+    parser.add_argument(
+        '--no-daemon', dest='no_daemon', action='store_true', help="run the query directly even if the smonitor daemon is running")
+    parser.add_argument(
+        '--profile', action='store_true', help="print time, rows, bytes and peak memory of each stage to STDERR")
+    parser.add_argument(
+        '--trace', action='store', default=None, metavar='FILE', help="write the --profile data and every Slurm command with its latency to FILE as JSON")
     parser.add_argument(
         '-o','--output', action='store', help="output file")
     parser.add_argument(
-        '-V', '--version', action='version', version=version)
+        '-V', '--version', action=VersionAction)
     parser.add_argument(
         '-v', '--verbose', action='count', help="verbose mode (multiple -v's increase verbosity)")
 
     return parser
 
 def validate_args(args, parser):
-    supported_format = ['json', 'table', 'csv']
+    supported_format = ['json', 'jsonl', 'table', 'csv']
     supported_freq = ['day', 'week', 'month', 'year']
+    supported_source = ['sreport', 'sacct']
     supported_unit = ['sec', 'min', 'hour']
+    supported_engine = ['python', 'numpy']
 
     if args.format:
         if args.format not in supported_format:
             parser.error("argument --format: invalid value '{}'. valid values: {}".format(args.format, ', '.join(map(lambda x: "'{}'".format(x), supported_format))))
 
-    if args.freq and args.freq not in supported_freq:
-        parser.error("argument --freq: invalid value '{}'. valid values: {}".format(args.freq, ', '.join(map(lambda x: "'{}'".format(x), supported_freq))))
+    if args.source not in supported_source:
+        parser.error("argument --source: invalid value '{}'. valid values: {}".format(args.source, ', '.join(map(lambda x: "'{}'".format(x), supported_source))))
+
+    if args.freq and args.freq not in ['hour'] + supported_freq:
+        parser.error("argument --freq: invalid value '{}'. valid values: {}".format(args.freq, ', '.join(map(lambda x: "'{}'".format(x), ['hour'] + supported_freq))))
+
+    if args.freq == 'hour' and args.type == 'utilization' and args.source == 'sreport':
+        parser.error("argument --freq: 'hour' utilization requires --source sacct")
     
+    if args.engine not in supported_engine:
+        parser.error("argument --engine: invalid value '{}'. valid values: {}".format(args.engine, ', '.join(map(lambda x: "'{}'".format(x), supported_engine))))
+
+    if args.engine == 'numpy':
+        from .query import vectorized
+        if not vectorized.is_available():
+            parser.error("argument --engine: 'numpy' engine requires numpy")
+
+    if args.shard and args.shard not in supported_freq:
+        parser.error("argument --shard: invalid value '{}'. valid values: {}".format(args.shard, ', '.join(map(lambda x: "'{}'".format(x), supported_freq))))
+
     if args.unit not in supported_unit:
         parser.error("argument --unit: invalid value '{}'. valid values: {}".format(args.unit, ', '.join(map(lambda x: "'{}'".format(x), supported_unit))))
 
+    if args.view not in ['jobs', 'nodes']:
+        parser.error("argument --view: invalid value '{}'. valid values: 'jobs', 'nodes'".format(args.view))
+
+    if args.interval < 1:
+        parser.error("argument --interval: invalid value '{}'. must be at least 1".format(args.interval))
+
+    if args.max_interval < args.interval:
+        parser.error("argument --max-interval: invalid value '{}'. must be at least --interval".format(args.max_interval))
+
+    if args.refresh_interval < 1:
+        parser.error("argument --refresh-interval: invalid value '{}'. must be at least 1".format(args.refresh_interval))
+
+    if args.clusters and args.store:
+        parser.error("argument -M/--clusters: not supported with --store")
+
+    if args.clusters and args.type == 'watch':
+        parser.error("argument -M/--clusters: not supported by 'watch'")
+
+    if args.jobs < 1:
+        parser.error("argument -j/--jobs: invalid value '{}'. must be at least 1".format(args.jobs))
+
+    if args.archive and args.type not in ['usage', 'export', 'import']:
+        parser.error("argument --archive: only supported by 'usage', 'export' and 'import'")
+
+    if args.archive and args.type == 'usage' and (args.store or args.shard or args.clusters or args.workers > 1):
+        parser.error("argument --archive: not supported with --store, --shard, -M/--clusters or -w/--workers")
+
+    if args.type == 'import' and (args.store or args.shard or args.clusters):
+        parser.error("argument --input: 'import' does not support --store, --shard or -M/--clusters")
+
+    # Job filters of 'usage', passed to sacct when it can apply them.
+    args.filters = {}
+    for name in ['users', 'partitions', 'states', 'qos']:
+        if getattr(args, name):
+            args.filters[name] = getattr(args, name)
+    if args.nodelist:
+        args.filters['nodelist'] = [args.nodelist]
+
+    if args.filters and args.type != 'usage':
+        parser.error("arguments --users, --partitions, --states, --qos and --nodelist: only supported by 'usage'")
+
+    if args.states:
+        from .query.filters import JOB_STATES
+        for state in args.states:
+            if state.upper() not in JOB_STATES and state.upper() not in JOB_STATES.values():
+                parser.error("argument --states: invalid value '{}'. valid values: {}".format(state, ', '.join(map(lambda x: "'{}'".format(x), sorted(JOB_STATES.values())))))
+
+    if args.workers < 1:
+        parser.error("argument -w/--workers: invalid value '{}'. must be at least 1".format(args.workers))
+
+    if args.workers > 1 and (args.store or args.shard or args.clusters):
+        parser.error("argument -w/--workers: not supported with --store, --shard or -M/--clusters")
+
     if args.start:
         try:
             args.start = datetime.strptime(args.start, '%Y-%m-%d')
@@ -88,46 +212,136 @@ def main():
     validate_args(args, parser)
 
     if args.verbose:
+        from pprint import pprint
+
         def verbose_print(*a, **k):
             if k.pop('level', 0) <= args.verbose:
                 pprint(*a, **k)
     else:
         verbose_print = lambda *a, **k: None
 
-    if args.type == 'utilization':
-        begin_date = args.start if args.start else datetime.strptime(SERVICE_BEGIN_DATE, '%Y-%m-%d')
-        end_date = args.end if args.end else datetime.now()
-        
-        output = query_utilization(begin_date, end_date, freq=args.freq, time_unit=args.unit)
-        generate_output(output, args.format, args.output)
-    elif args.type == 'usage':
+    if args.profile or args.trace:
+        from .utils import profile
+        profile.profiler.enable()
+
+    try:
+        run(args, parser, verbose_print)
+    finally:
+        if args.profile:
+            profile.profiler.report(sys.stderr)
+        if args.trace:
+            profile.profiler.write_trace(args.trace)
+
+def run(args, parser, verbose_print):
+    if args.type == 'serve':
+        from .server import serve
+        try:
+            serve(args.socket, refresh_interval=args.refresh_interval)
+        except RuntimeError as e:
+            parser.exit(1, 'smonitor: {}\n'.format(e))
+    elif args.type in ['utilization', 'usage']:
+        from .server import run_query, request_query, DaemonUnavailable, REQUEST_DATETIME_FORMAT
+        from .utils.io import generate_output
+        from .utils.data import flattern_nested_dict
+        from .utils.profile import stage, profile_iter
+
+        # The default period of an archive report is the archived period.
+        archive = None
+        if args.archive:
+            from .store.archive import JobArchive
+            try:
+                archive = JobArchive(args.archive)
+            except (IOError, OSError, ValueError) as e:
+                parser.exit(1, 'smonitor: {}\n'.format(e))
+            args.start = args.start if args.start else archive.begin_date
+            args.end = args.end if args.end else archive.end_date
+
+            # e.g. archives imported from sacct output without those fields
+            from .query.filters import JOB_FILTERS, JOB_FILTER_FIELDS
+            for name in JOB_FILTERS:
+                if name in args.filters and JOB_FILTER_FIELDS[name] not in archive.table.fields:
+                    parser.error("argument --{}: jobs of archive {} have no {} field".format(name, args.archive, JOB_FILTER_FIELDS[name]))
+
         begin_date = args.start if args.start else datetime.strptime(SERVICE_BEGIN_DATE, '%Y-%m-%d')
         end_date = args.end if args.end else datetime.now()
 
-        if args.groups_by:
-            output = query_group_usage(
-                begin_date, 
-                end_date, 
-                account_list=args.account_list, 
-                groups_by=args.groups_by,
-                groups_by_fields=args.groups_by_fields,
-                freq=args.freq
-            )
-        else:
-            output = query_usage(
-                begin_date, 
-                end_date, 
-                account_list=args.account_list,
-                fields=args.fields,
-                freq=args.freq
-            )
-        
-        if args.format != 'json':
-            flatten_output = [] 
-            for o in output:
-                flatten_output += flattern_nested_dict(o)
-            generate_output(flatten_output, args.format, args.output)
+        request = {
+            'type': args.type,
+            'start': begin_date.strftime(REQUEST_DATETIME_FORMAT),
+            'end': end_date.strftime(REQUEST_DATETIME_FORMAT),
+            'freq': args.freq,
+            'time_unit': args.unit,
+            'source': args.source,
+            'clusters': args.clusters,
+            'account_list': args.account_list,
+            'fields': args.fields,
+            'groups_by': args.groups_by,
+            'groups_by_fields': args.groups_by_fields,
+            'filters': args.filters
+        }
+
+        # The daemon only keeps the jobs and sreport output of the local
+        # cluster, and answers from its own job cache with the default engine,
+        # so options choosing how jobs are read or aggregated bypass it. Job
+        # reports are read from sacct, not from the job cache, see run_query.
+        plain_usage = args.type == 'usage' and not args.groups_by
+        use_daemon = not (args.no_daemon or args.clusters or args.refresh or archive or args.store or args.shard or args.engine != 'python' or args.workers > 1 or plain_usage)
+        output = None
+        if use_daemon:
+            try:
+                output = request_query(request, args.socket)
+                verbose_print('Query answered by smonitor daemon at {}'.format(args.socket))
+            except DaemonUnavailable:
+                output = None
+
+        # sreport output of ended spans is kept in a persistent cache.
+        cache = None
+        if output is None and args.type == 'utilization' and args.source == 'sreport':
+            from .store.cache import DiskSreportCache
+            cache = DiskSreportCache(refresh=args.refresh)
+
+        if output is None:
+            output = run_query(request, store=args.store, cache=cache, jobs=args.jobs, shard=args.shard, engine=args.engine, workers=args.workers, archive=archive)
+
+        # Time spent in the query generators outside of their own stages,
+        # e.g. building the output records, is counted as 'query'.
+        output = profile_iter('query', output)
+
+        if args.type == 'usage' and args.format not in ['json', 'jsonl']:
+            output = profile_iter('flatten', (row for o in output for row in flattern_nested_dict(o)))
+
+        try:
+            with stage('output'):
+                generate_output(output, args.format, args.output)
+        finally:
+            if cache is not None:
+                cache.close()
+    elif args.type in ['export', 'import']:
+        from .query.usage import export_jobs
+
+        path = args.archive if args.archive else JOB_ARCHIVE_PATH
+        if args.type == 'export':
+            begin_date = args.start if args.start else datetime.strptime(SERVICE_BEGIN_DATE, '%Y-%m-%d')
+            end_date = args.end if args.end else datetime.now()
+            count = export_jobs(path, begin_date, end_date, account_list=args.account_list, store=args.store, shard=args.shard, jobs=args.jobs, clusters=args.clusters)
         else:
+            sacct_output = sys.stdin if args.input == '-' else open(args.input)
+            try:
+                count = export_jobs(path, args.start, args.end, account_list=args.account_list, sacct_output=(line.rstrip('\n') for line in sacct_output))
+            finally:
+                if sacct_output is not sys.stdin:
+                    sacct_output.close()
+        print('{} jobs written to {}'.format(count, path))
+    elif args.type == 'watch':
+        from .watch import watch
+        watch(view=args.view, account_list=args.account_list, interval=args.interval, max_interval=args.max_interval)
+    elif args.type == 'nodes':
+        from .query.nodes import query_nodes
+        from .utils.io import generate_output
+        from .utils.profile import stage
+
+        output = query_nodes(per_node=args.per_node, clusters=args.clusters)
+        with stage('output'):
             generate_output(output, args.format, args.output)
     else:
         parser.print_help()
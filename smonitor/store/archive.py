@@ -0,0 +1,261 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+import os
+import sys
+import json
+import mmap
+import struct
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+from ..slurm.table import JobTable, COLUMN_CLASSES, EPOCH, OBJECT, INT, FLOAT, TIME, CATEGORY, ColumnTypeError, _CategoryColumn
+from ..slurm.tres import TresDict
+from ..utils.string import to_native_str
+from ..utils.time import parse_timestamp
+
+ARCHIVE_MAGIC = b'SMONARC1'
+ARCHIVE_VERSION = 2
+ARCHIVE_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+# Blocks are aligned so typed arrays can be mapped in place.
+ARCHIVE_ALIGNMENT = 8
+
+# Arrays of numeric columns by kind, as (name, typecode). Category and object
+# columns are dictionary-encoded: their codes are stored in the smallest of
+# CATEGORY_TYPECODES that holds them, and their distinct values as JSON.
+ARCHIVE_ARRAYS = {
+    INT: [('values', 'l')],
+    FLOAT: [('values', 'd'), ('is_int', 'B')],
+    TIME: [('values', 'd')],
+}
+CATEGORY_TYPECODES = [('B', 2**8), ('H', 2**16), ('i', 2**31)]
+
+def _seconds(date):
+    return (date - EPOCH).total_seconds()
+
+def _start_seconds(val):
+    if not isinstance(val, datetime):
+        val = parse_timestamp(val)
+    return _seconds(val) if val is not None else float('-inf')
+
+def _tobytes(values):
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+def _categories(val):
+    # Dict categories are parsed TRES, see parse_tres.
+    val = to_native_str(val)
+    return [TresDict(c) if isinstance(c, dict) else c for c in val]
+
+class _Lazy(object):
+    # Reads a column array from the archive on first access and keeps it in
+    # the column, so later accesses are plain attribute lookups.
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, column, owner):
+        if column is None:
+            return self
+        val = column.__dict__[self.name] = column._archive._read(column._blocks[self.name])
+        return val
+
+class _MappedColumn(object):
+    # Read-only column of a JobArchive. Combined with the JobTable column
+    # class of its kind, see _MAPPED_COLUMN_CLASSES.
+    values = _Lazy('values')
+    is_int = _Lazy('is_int')
+    categories = _Lazy('categories')
+
+    def __init__(self, archive, blocks):
+        self._archive = archive
+        self._blocks = blocks
+
+    def append(self, val):
+        raise TypeError('archived jobs cannot be modified')
+
+_MAPPED_COLUMN_CLASSES = dict((kind, type('_Mapped' + COLUMN_CLASSES[kind].__name__, (_MappedColumn, COLUMN_CLASSES[kind]), {})) for kind in [INT, FLOAT, TIME, CATEGORY])
+
+class JobArchive(object):
+    """Read-only columnar archive of preprocessed jobs, see write_archive.
+
+    The file is memory-mapped and columns are only read when they are
+    accessed. On Python 3 typed columns are views of the mapping; Python 2
+    copies each column it reads. `table` is a JobTable of every archived job
+    in the order they were written, and `rows` locates jobs by end time
+    with the index of the archive.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        size = len(self._mmap)
+        if size < 2 * len(ARCHIVE_MAGIC) + 8 or self._mmap[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC or self._mmap[-len(ARCHIVE_MAGIC):] != ARCHIVE_MAGIC:
+            raise ValueError('{} is not a smonitor job archive'.format(path))
+
+        footer = size - len(ARCHIVE_MAGIC) - 8
+        header_size = struct.unpack('<Q', self._mmap[footer:footer + 8])[0]
+        header = json.loads(self._mmap[footer - header_size:footer].decode('utf-8'))
+        if header['version'] != ARCHIVE_VERSION:
+            raise ValueError('{}: unsupported archive version {}'.format(path, header['version']))
+
+        # Arrays are stored in the native layout of the machine that wrote them.
+        if header['byteorder'] != sys.byteorder or any(array(str(t)).itemsize != n for t, n in header['itemsizes'].items()):
+            raise ValueError('{}: archive was written on a machine with another byte order or integer size'.format(path))
+
+        self.begin_date = datetime.strptime(header['begin'], ARCHIVE_DATETIME_FORMAT)
+        self.end_date = datetime.strptime(header['end'], ARCHIVE_DATETIME_FORMAT)
+        self._index = header['index']
+
+        self.table = JobTable()
+        self.table._length = header['rows']
+        for field, column in header['columns']:
+            field = to_native_str(field)
+            self.table.fields.append(field)
+            self.table._columns[field] = _MAPPED_COLUMN_CLASSES[column['kind']](self, column['blocks'])
+
+    def __len__(self):
+        return len(self.table)
+
+    def _read(self, block):
+        offset, length, typecode = block
+        if typecode == 'json':
+            return _categories(json.loads(self._mmap[offset:offset + length].decode('utf-8')))
+
+        typecode = str(typecode)
+        if hasattr(memoryview, 'cast'):
+            return memoryview(self._mmap)[offset:offset + length].cast(typecode)
+
+        values = array(typecode)
+        values.fromstring(self._mmap[offset:offset + length])
+        return values
+
+    def __index(self, name):
+        val = self.__dict__.get(name)
+        if val is None:
+            val = self.__dict__[name] = self._read(self._index[name])
+        return val
+
+    def rows(self, begin_date, end_date):
+        # Returns the rows of jobs which ended in [begin_date, end_date), in
+        # row order.
+        ends = self.__index('end_sorted')
+        lo = bisect_left(ends, _seconds(begin_date))
+        hi = bisect_left(ends, _seconds(end_date))
+        return array('l', sorted(self.__index('end_order')[lo:hi]))
+
+    def running_rows(self, end_date=None):
+        # Returns the rows of jobs that were RUNNING when the archive was
+        # written and started before end_date, in row order.
+        rows = self.__index('running')
+        if end_date is not None:
+            rows = rows[:bisect_left(self.__index('running_start'), _seconds(end_date))]
+        return array('l', sorted(rows))
+
+    def category_codes(self, field, match):
+        # Returns the codes of the values of a dictionary-encoded field for
+        # which match(value) is true.
+        if field not in self.table.fields:
+            raise ValueError('{}: archived jobs have no {} field'.format(self.path, field))
+        column = self.table.column(field)
+        if column.kind != CATEGORY:
+            raise ValueError('{}: field {} is not dictionary-encoded'.format(self.path, field))
+        return set(code for code, val in enumerate(column.categories) if match(val))
+
+def __encode(column):
+    # Returns the kind and arrays of a JobTable column as stored in an archive.
+    if column.kind == OBJECT:
+        encoded = _CategoryColumn()
+        for val in column:
+            encoded.append(val)
+        column = encoded
+
+    if column.kind != CATEGORY:
+        return column.kind, [(name, getattr(column, name), typecode) for name, typecode in ARCHIVE_ARRAYS[column.kind]]
+
+    typecode = next(t for t, n in CATEGORY_TYPECODES if len(column.categories) <= n)
+    return CATEGORY, [('values', array(typecode, column.values), typecode), ('categories', column.categories, 'json')]
+
+def write_archive(path, job_table, begin_date, end_date):
+    """Writes the jobs of job_table, preprocessed as in query/usage.py, to a
+    JobArchive at path.
+
+    Arrays of every column are written as 8-byte aligned blocks, followed by
+    an index of the rows by end time and a JSON header describing the blocks.
+    begin_date and end_date record the period the jobs were queried for. The
+    file is replaced atomically.
+    """
+    if len(job_table) and job_table.column_type('end') != TIME:
+        raise ValueError('jobs must be preprocessed before they are archived')
+
+    tmp_path = path + '.tmp'
+    archive_dir = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(archive_dir):
+        os.makedirs(archive_dir)
+
+    def write_block(f, values, typecode):
+        if typecode == 'json':
+            data = json.dumps(values).encode('utf-8')
+        else:
+            data = _tobytes(values if isinstance(values, array) else array(typecode, values))
+        offset = f.tell()
+        f.write(data)
+        f.write(b'\0' * (-f.tell() % ARCHIVE_ALIGNMENT))
+        return [offset, len(data), typecode]
+
+    columns = []
+    with open(tmp_path, 'wb') as f:
+        f.write(ARCHIVE_MAGIC)
+
+        for field in job_table.fields:
+            try:
+                kind, arrays = __encode(job_table.column(field))
+            except ColumnTypeError:
+                raise ValueError('field {} has values that cannot be archived'.format(field))
+
+            blocks = {}
+            for name, values, typecode in arrays:
+                try:
+                    blocks[name] = write_block(f, values, typecode)
+                except TypeError:
+                    raise ValueError('field {} has values that cannot be archived'.format(field))
+            columns.append([field, {'kind': kind, 'blocks': blocks}])
+
+        # Rows of ended jobs sorted by end time, and of running jobs sorted
+        # by start time. Jobs without an end time in other states are never
+        # reported. Running jobs without a start time, e.g. imported without
+        # the Start field, sort first.
+        ends = job_table.column('end').values if len(job_table) else array('d')
+        states = job_table.column('state') if len(job_table) else []
+        starts = job_table.column('start') if len(job_table) and 'start' in job_table.fields else None
+        end_order = sorted((n for n in range(len(job_table)) if ends[n] == ends[n]), key=ends.__getitem__)
+        running = [n for n in range(len(job_table)) if ends[n] != ends[n] and states[n] == 'RUNNING']
+        running_starts = dict((n, _start_seconds(starts[n] if starts is not None else None)) for n in running)
+        running.sort(key=running_starts.__getitem__)
+        index = {
+            'end_order': write_block(f, end_order, 'l'),
+            'end_sorted': write_block(f, [ends[n] for n in end_order], 'd'),
+            'running': write_block(f, running, 'l'),
+            'running_start': write_block(f, [running_starts[n] for n in running], 'd'),
+        }
+
+        header = json.dumps({
+            'version': ARCHIVE_VERSION,
+            'rows': len(job_table),
+            'begin': begin_date.strftime(ARCHIVE_DATETIME_FORMAT),
+            'end': end_date.strftime(ARCHIVE_DATETIME_FORMAT),
+            'byteorder': sys.byteorder,
+            'itemsizes': dict((t, array(t).itemsize) for t in 'lidBH'),
+            'columns': columns,
+            'index': index,
+        }).encode('utf-8')
+        f.write(header)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(ARCHIVE_MAGIC)
+
+    os.rename(tmp_path, path)
@@ -0,0 +1,158 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+import os
+import time
+import sqlite3
+import threading
+import subprocess
+
+from datetime import datetime
+from collections import OrderedDict
+
+from ..config import SREPORT_CACHE_PATH, SREPORT_CACHE_DELAY, SREPORT_CACHE_SIZE
+from ..slurm.sreport import sreport_command
+
+SREPORT_CACHE_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+class MemorySreportCache(object):
+    """In-memory cache of sreport output keyed by span, time unit and cluster.
+
+    Output fetched SREPORT_CACHE_DELAY or more after its span ended never
+    changes. Output of spans that had not ended then is re-queried by
+    `refresh` until it is final. Spans that had only just ended, e.g. spans
+    ending at the "now" of a request, are not cached. The least recently
+    used entries are evicted beyond max_entries.
+    """
+
+    def __init__(self, max_entries=SREPORT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, span, time_unit, cluster=None):
+        key = (span.start, span.end, time_unit, cluster)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._entries[key] = entry
+        return entry[1]
+
+    def set(self, span, time_unit, output, fetched=None, cluster=None):
+        fetched = fetched if fetched else datetime.now()
+        if span.end <= fetched < span.end + SREPORT_CACHE_DELAY:
+            return
+
+        key = (span.start, span.end, time_unit, cluster)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (fetched, output)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self):
+        with self._lock:
+            open_entries = [key for key, (fetched, _) in self._entries.items() if fetched < key[1] + SREPORT_CACHE_DELAY]
+
+        for key in open_entries:
+            start, end, time_unit, cluster = key
+            fetched = datetime.now()
+            output = subprocess.check_output(sreport_command(start, end, time_unit, cluster=cluster), universal_newlines=True)
+            with self._lock:
+                # Entries evicted meanwhile are not added back.
+                if key in self._entries:
+                    self._entries[key] = (fetched, output)
+
+class DiskSreportCache(object):
+    """Persistent cache of sreport output in SQLite, keyed by cluster, time
+    unit and span.
+
+    Only output fetched SREPORT_CACHE_DELAY or more after its span ended is
+    kept and served; spans that are open, or ended too recently for slurmdbd
+    to have rolled them up, are re-queried every time. The least recently
+    read entries are evicted beyond max_entries. With refresh, cached output
+    is not used but is replaced by the new output.
+    """
+
+    def __init__(self, path=None, max_entries=SREPORT_CACHE_SIZE, refresh=False):
+        self.path = path if path else SREPORT_CACHE_PATH
+        self.max_entries = max_entries
+        self.refresh = refresh
+
+        cache_dir = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        # query_utilization calls get and set from its worker threads.
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS sreport (
+                cluster TEXT,
+                time_unit TEXT,
+                start_time TEXT,
+                end_time TEXT,
+                fetched TEXT,
+                accessed INTEGER,
+                output TEXT,
+                PRIMARY KEY (cluster, time_unit, start_time, end_time)
+            );
+            CREATE INDEX IF NOT EXISTS sreport_accessed ON sreport (accessed);
+        ''')
+
+        # Entries are ordered for eviction by a counter of reads and writes.
+        self._count, self._clock = self._conn.execute('SELECT COUNT(*), MAX(accessed) FROM sreport').fetchone()
+        self._clock = self._clock if self._clock else 0
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    @staticmethod
+    def __key(span, time_unit, cluster):
+        # NULL is not equal to NULL in a primary key, so the local cluster is ''.
+        return [cluster if cluster else '', time_unit, span.start.strftime(SREPORT_CACHE_DATETIME_FORMAT), span.end.strftime(SREPORT_CACHE_DATETIME_FORMAT)]
+
+    def get(self, span, time_unit, cluster=None):
+        if self.refresh:
+            return None
+
+        key = DiskSreportCache.__key(span, time_unit, cluster)
+        with self._lock:
+            row = self._conn.execute('SELECT output FROM sreport WHERE cluster = ? AND time_unit = ? AND start_time = ? AND end_time = ?', key).fetchone()
+            if row is None:
+                return None
+
+            # Committed with the next set or on close.
+            self._clock += 1
+            self._conn.execute('UPDATE sreport SET accessed = ? WHERE cluster = ? AND time_unit = ? AND start_time = ? AND end_time = ?', [self._clock] + key)
+        return row[0]
+
+    def set(self, span, time_unit, output, fetched=None, cluster=None):
+        fetched = fetched if fetched else datetime.now()
+        if fetched < span.end + SREPORT_CACHE_DELAY:
+            return
+
+        key = DiskSreportCache.__key(span, time_unit, cluster)
+        with self._lock:
+            with self._conn:
+                self._clock += 1
+                replaced = self._conn.execute('DELETE FROM sreport WHERE cluster = ? AND time_unit = ? AND start_time = ? AND end_time = ?', key).rowcount
+                self._conn.execute('INSERT INTO sreport VALUES (?, ?, ?, ?, ?, ?, ?)', key + [fetched.strftime(SREPORT_CACHE_DATETIME_FORMAT), self._clock, output])
+                self._count += 1 - replaced
+
+                if self._count > self.max_entries:
+                    evicted = self._conn.execute(
+                        'DELETE FROM sreport WHERE rowid IN (SELECT rowid FROM sreport ORDER BY accessed LIMIT ?)',
+                        [self._count - self.max_entries]
+                    ).rowcount
+                    self._count -= evicted
@@ -0,0 +1,240 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+import os
+import json
+import sqlite3
+import threading
+
+from datetime import datetime
+
+from ..config import SERVICE_BEGIN_DATE, JOB_STORE_PATH, JOB_STORE_SYNC_OVERLAP
+from ..slurm.sacct import query_sacct, SACCT_DATETIME_FORMAT
+from ..utils.string import to_native_str
+
+# Jobs in these states can still change, so they are re-fetched on every sync.
+OPEN_STATES = ['PENDING', 'RUNNING', 'SUSPENDED', 'REQUEUED']
+
+# Maximum number of job IDs passed to a single `sacct -j` call.
+SYNC_JOB_CHUNK = 500
+
+def _timestamp(val):
+    try:
+        return datetime.strptime(val, SACCT_DATETIME_FORMAT).strftime(SACCT_DATETIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+def _job_order(job_id):
+    try:
+        return (0, int(job_id))
+    except ValueError:
+        return (1, job_id)
+
+class JobSource(object):
+    """Local copy of sacct job records keyed by JobIDRaw.
+
+    `sync` only asks sacct for jobs that ended after the newest end time
+    already stored, plus jobs that were still open at the last sync.
+    Subclasses implement the storage.
+    """
+
+    def high_water_mark(self):
+        raise NotImplementedError()
+
+    def open_jobs(self):
+        raise NotImplementedError()
+
+    def update(self, jobs):
+        raise NotImplementedError()
+
+    def jobs(self, begin_date, end_date, account_list=None):
+        # Yields jobs which ended in [begin_date, end_date) and jobs without
+        # an end time that started before end_date, in JobIDRaw order.
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def sync(self, now=None):
+        now = now if now else datetime.now()
+
+        service_begin_date = datetime.strptime(SERVICE_BEGIN_DATE, '%Y-%m-%d')
+
+        high_water_mark = self.high_water_mark()
+        if high_water_mark:
+            begin_date = high_water_mark - JOB_STORE_SYNC_OVERLAP
+        else:
+            begin_date = service_begin_date
+
+        open_jobs = self.open_jobs()
+
+        delta = query_sacct(begin_date, now, noconvert=True)
+        self.update(delta)
+
+        # Jobs which were open at the last sync but did not show up in the
+        # delta window, e.g. pending jobs cancelled before they became eligible.
+        fetched = set(str(job['job_id_raw']) for job in delta)
+        open_jobs = [job_id for job_id in open_jobs if job_id not in fetched]
+        for n in range(0, len(open_jobs), SYNC_JOB_CHUNK):
+            self.update(query_sacct(service_begin_date, now, job_list=open_jobs[n:n+SYNC_JOB_CHUNK], noconvert=True))
+
+class JobStore(JobSource):
+    """Persistent local copy of sacct job records keyed by JobIDRaw.
+
+    Records are stored in SQLite as returned by sacct with --noconvert.
+    """
+
+    def __init__(self, path=None):
+        self.path = path if path else JOB_STORE_PATH
+
+        store_dir = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id_raw TEXT PRIMARY KEY,
+                account TEXT,
+                state TEXT,
+                start_time TEXT,
+                end_time TEXT,
+                record TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_end_time ON jobs (end_time);
+            CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+        ''')
+
+    @property
+    def connection(self):
+        # SQLite connection of the store, shared with DailyRollup.
+        return self._conn
+
+    def close(self):
+        self._conn.close()
+
+    def high_water_mark(self):
+        row = self._conn.execute('SELECT MAX(end_time) FROM jobs').fetchone()
+        if row[0]:
+            return datetime.strptime(row[0], SACCT_DATETIME_FORMAT)
+        return None
+
+    def open_jobs(self):
+        rows = self._conn.execute(
+            'SELECT job_id_raw FROM jobs WHERE state IN ({})'.format(','.join('?'*len(OPEN_STATES))),
+            OPEN_STATES
+        )
+        return [str(r[0]) for r in rows]
+
+    def update(self, jobs):
+        rows = ((
+            str(job['job_id_raw']),
+            job['account'],
+            job['state'],
+            _timestamp(job['start']),
+            _timestamp(job['end']),
+            json.dumps(job)
+        ) for job in jobs)
+
+        with self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def jobs(self, begin_date, end_date, account_list=None):
+        query = 'SELECT record FROM jobs WHERE ((end_time >= ? AND end_time < ?) OR (end_time IS NULL AND start_time < ?))'
+        params = [
+            begin_date.strftime(SACCT_DATETIME_FORMAT),
+            end_date.strftime(SACCT_DATETIME_FORMAT),
+            end_date.strftime(SACCT_DATETIME_FORMAT)
+        ]
+
+        if account_list:
+            query = query + ' AND account IN ({})'.format(','.join('?'*len(account_list)))
+            params += account_list
+
+        # Keep sacct ordering so aggregated values are summed in the same order.
+        query = query + ' ORDER BY CAST(job_id_raw AS INTEGER)'
+
+        for row in self._conn.execute(query, params):
+            # json returns unicode on Python 2 while sacct records hold str values.
+            yield to_native_str(json.loads(row[0]))
+
+    def unfinished_jobs(self, end_date, account_list=None):
+        # Yields jobs without an end time that started before end_date.
+        query = 'SELECT record FROM jobs WHERE end_time IS NULL AND start_time < ?'
+        params = [end_date.strftime(SACCT_DATETIME_FORMAT)]
+
+        if account_list:
+            query = query + ' AND account IN ({})'.format(','.join('?'*len(account_list)))
+            params += account_list
+
+        query = query + ' ORDER BY CAST(job_id_raw AS INTEGER)'
+
+        for row in self._conn.execute(query, params):
+            yield to_native_str(json.loads(row[0]))
+
+class JobCache(JobSource):
+    """In-memory copy of sacct job records, used by the smonitor daemon.
+
+    Records are parsed once and `jobs` returns copies, so callers may modify
+    them. All methods are safe to call from several threads.
+    """
+
+    def __init__(self):
+        self._records = {}
+        self._end_times = {}
+        self._order = []
+        self._high_water_mark = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def high_water_mark(self):
+        if self._high_water_mark:
+            return datetime.strptime(self._high_water_mark, SACCT_DATETIME_FORMAT)
+        return None
+
+    def open_jobs(self):
+        with self._lock:
+            return [job_id for job_id, job in self._records.items() if job['state'] in OPEN_STATES]
+
+    def update(self, jobs):
+        jobs = list(jobs)
+        with self._lock:
+            for job in jobs:
+                job_id = str(job['job_id_raw'])
+                if job_id not in self._records:
+                    self._order = None
+                self._records[job_id] = job
+                self._end_times[job_id] = _timestamp(job['end'])
+                if self._end_times[job_id] and self._end_times[job_id] > (self._high_water_mark or ''):
+                    self._high_water_mark = self._end_times[job_id]
+
+    def jobs(self, begin_date, end_date, account_list=None):
+        begin_time = begin_date.strftime(SACCT_DATETIME_FORMAT)
+        end_time = end_date.strftime(SACCT_DATETIME_FORMAT)
+
+        with self._lock:
+            if self._order is None:
+                self._order = sorted(self._records, key=_job_order)
+
+            jobs = []
+            for job_id in self._order:
+                job = self._records[job_id]
+                job_end_time = self._end_times[job_id]
+
+                if job_end_time:
+                    if not begin_time <= job_end_time < end_time:
+                        continue
+                else:
+                    job_start_time = _timestamp(job['start'])
+                    if not job_start_time or job_start_time >= end_time:
+                        continue
+
+                if account_list and job['account'] not in account_list:
+                    continue
+
+                jobs.append(dict(job))
+
+        return jobs
@@ -0,0 +1,142 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function
+
+from datetime import datetime, timedelta
+
+from ..config import JOB_STORE_SYNC_OVERLAP
+from ..utils.string import to_native_str
+from ..slurm.tres import tres_seconds
+
+# Dimensions and metrics kept per day. Group usage reports grouped by a
+# subset of ROLLUP_DIMENSIONS and summing a subset of ROLLUP_METRICS can be
+# answered from the rollups. su_usage and core_hour are kept as exact billing
+# and CPU seconds, see EXACT_SUM_FIELDS in query/usage.py. Each group also
+# keeps the smallest JobIDRaw it counted, so that reports list groups in the
+# order of their first job, as reports from the job store do.
+ROLLUP_DIMENSIONS = ['account', 'user', 'partition']
+ROLLUP_METRICS = ['su_usage', 'core_hour', 'elapsed_raw', 'count']
+
+ROLLUP_DAY_FORMAT = '%Y-%m-%d'
+
+def _day(date):
+    return datetime(date.year, date.month, date.day)
+
+class DailyRollup(object):
+    """Daily usage totals per (account, user, partition) of the jobs in a
+    JobStore, kept in the same SQLite database.
+
+    Jobs are counted on the day they ended. A day is closed once it ended
+    more than JOB_STORE_SYNC_OVERLAP before a refresh, i.e. once a sync can
+    no longer add jobs to it; closed days are never rebuilt. `refresh`
+    rebuilds the days that are still open, normally only today.
+    """
+
+    def __init__(self, job_store):
+        self.job_store = job_store
+        self._conn = job_store.connection
+
+        # Rollups written by older versions, e.g. of float usage, are rebuilt.
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(daily_usage)')]
+        if columns and 'first_job' not in columns:
+            self._conn.executescript('''
+                DROP TABLE daily_usage;
+                DROP TABLE IF EXISTS daily_usage_days;
+            ''')
+
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS daily_usage (
+                day TEXT,
+                account TEXT,
+                user TEXT,
+                partition TEXT,
+                billing_seconds INTEGER,
+                cpu_seconds INTEGER,
+                elapsed_raw INTEGER,
+                count INTEGER,
+                first_job INTEGER,
+                PRIMARY KEY (day, account, user, partition)
+            );
+            CREATE TABLE IF NOT EXISTS daily_usage_days (
+                day TEXT PRIMARY KEY,
+                closed INTEGER
+            );
+        ''')
+
+    def refreshed(self):
+        # Returns the end of the last day built, or None.
+        row = self._conn.execute('SELECT MAX(day) FROM daily_usage_days').fetchone()
+        if row[0]:
+            return datetime.strptime(row[0], ROLLUP_DAY_FORMAT) + timedelta(days=1)
+        return None
+
+    def __first_open_day(self, begin_date):
+        row = self._conn.execute('SELECT MIN(day) FROM daily_usage_days WHERE closed = 0').fetchone()
+        if row[0]:
+            return datetime.strptime(row[0], ROLLUP_DAY_FORMAT)
+
+        row = self._conn.execute('SELECT MAX(day) FROM daily_usage_days').fetchone()
+        if row[0]:
+            return datetime.strptime(row[0], ROLLUP_DAY_FORMAT) + timedelta(days=1)
+        return _day(begin_date)
+
+    def refresh(self, preprocess, begin_date, now=None):
+        # Builds the rollups of every open day up to today from the jobs in
+        # the store. preprocess(job) adds the derived metrics to a job, see
+        # __preprocess_job in query/usage.py. begin_date is the first day
+        # of the first refresh.
+        now = now if now else datetime.now()
+        first_day = self.__first_open_day(begin_date)
+        end_day = _day(now) + timedelta(days=1)
+        if first_day >= end_day:
+            return
+
+        totals = {}
+        for job in self.job_store.jobs(first_day, end_day):
+            job = preprocess(job)
+            if not job['end']:
+                continue
+
+            key = (_day(job['end']).strftime(ROLLUP_DAY_FORMAT),) + tuple(job.get(d) for d in ROLLUP_DIMENSIONS)
+            total = totals.get(key)
+            if total is None:
+                total = totals[key] = [0, 0, 0, 0, int(job['job_id_raw'])]
+            total[0] += tres_seconds(job, 'billing')
+            total[1] += tres_seconds(job, 'cpu')
+            total[2] += int(job['elapsed_raw'] or 0)
+            total[3] += 1
+            total[4] = min(total[4], int(job['job_id_raw']))
+
+        closed_until = now - JOB_STORE_SYNC_OVERLAP
+        days = []
+        day = first_day
+        while day < end_day:
+            days.append((day.strftime(ROLLUP_DAY_FORMAT), 1 if day + timedelta(days=1) <= closed_until else 0))
+            day += timedelta(days=1)
+
+        with self._conn:
+            self._conn.execute('DELETE FROM daily_usage WHERE day >= ?', [first_day.strftime(ROLLUP_DAY_FORMAT)])
+            self._conn.executemany('INSERT INTO daily_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (key + tuple(total) for key, total in totals.items()))
+            self._conn.executemany('INSERT OR REPLACE INTO daily_usage_days VALUES (?, ?)', days)
+
+    def rows(self, begin_date, end_date, groups_by, account_list=None):
+        # Yields (day, group key values, (billing seconds, CPU seconds,
+        # elapsed_raw, count), first JobIDRaw) summed per day and groups_by
+        # values, in the order of ROLLUP_METRICS, for the days from
+        # begin_date up to the day containing end_date, in day order.
+        end_day = _day(end_date) if end_date == _day(end_date) else _day(end_date) + timedelta(days=1)
+
+        columns = ', '.join(groups_by)
+        query = 'SELECT day, {}, SUM(billing_seconds), SUM(cpu_seconds), SUM(elapsed_raw), SUM(count), MIN(first_job) FROM daily_usage WHERE day >= ? AND day < ?'.format(columns)
+        params = [begin_date.strftime(ROLLUP_DAY_FORMAT), end_day.strftime(ROLLUP_DAY_FORMAT)]
+
+        if account_list:
+            query = query + ' AND account IN ({})'.format(','.join('?'*len(account_list)))
+            params += account_list
+
+        query = query + ' GROUP BY day, {} ORDER BY day'.format(columns)
+
+        for row in self._conn.execute(query, params):
+            # sqlite returns unicode on Python 2 while sacct records hold str values.
+            n = 1 + len(groups_by)
+            yield datetime.strptime(row[0], ROLLUP_DAY_FORMAT), to_native_str(list(row[1:n])), row[n:n + len(ROLLUP_METRICS)], row[-1]
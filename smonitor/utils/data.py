@@ -4,32 +4,33 @@ from __future__ import print_function
 
 from pprint import pprint
 
-def flattern_nested_dict(d, outer_fields=[], outer_data=[], field_name_key='fields'):
-    if field_name_key in d:
-        field_name = d[field_name_key]
-        inner_field = []
-        inner_data = []
+def __flatten_groups(result, fields, row):
+    # Rows of the groups nested under result, one level per field.
+    if not fields:
+        return [dict(row + list(result.items()))]
 
-        output = []
+    output = []
+    for key, value in result.items():
+        output += __flatten_groups(value, fields[1:], row + [(fields[0], key)])
+    return output
 
-        for key in d:
-            if key == field_name_key:
-                continue
-            if not isinstance(d[key], dict):
-                inner_field.append(key)
-                inner_data.append(d[key])
+def flattern_nested_dict(d, field_name_key='fields'):
+    # Flattens a usage record into rows. The groups of group reports, named
+    # by the list under field_name_key, give a row each, as do the jobs of a
+    # list of records. Other values are repeated on every row.
+    fields = d.get(field_name_key)
+    if fields is not None and not isinstance(fields, list):
+        fields = [fields]
 
-        for key in d:
-            if isinstance(d[key], dict):
-                output +=   flattern_nested_dict(
-                                d[key], 
-                                outer_fields= outer_fields + inner_field + [field_name],
-                                outer_data= outer_data + inner_data + [key]
-                            )
-        return output
+    row = [(k, v) for k, v in d.items() if k != field_name_key and not isinstance(v, (dict, list))]
+    output = []
+    nested = False
+    for key, value in d.items():
+        if isinstance(value, dict) and fields is not None:
+            nested = True
+            output += __flatten_groups(value, fields, row)
+        elif isinstance(value, list) and key != field_name_key:
+            nested = True
+            output += [dict(row + list(v.items())) for v in value]
 
-    else:
-        output_fields = outer_fields + d.keys()
-        output_data = outer_data + d.values()
-    
-        return [{k:v for k,v in zip(output_fields, output_data)}]
\ No newline at end of file
+    return output if nested else [dict(row)]
@@ -3,81 +3,139 @@
 from __future__ import print_function
 
 import json
-import types
 import csv
 import sys
+import tempfile
+import itertools
 
-from pprint import pprint
+from contextlib import contextmanager
+
+from .string import to_native_str
+
+# Minimum width of table columns.
+TABLE_MIN_WIDTH = 12
+
+@contextmanager
+def __open_output(output_file=None, csv_mode=False):
+    # Yields output_file opened for writing, or STDOUT.
+    if not output_file:
+        yield sys.stdout
+    elif csv_mode and sys.version_info[0] < 3:
+        with open(output_file, 'wb') as f:
+            yield f
+    elif csv_mode:
+        with open(output_file, 'w', newline='') as f:
+            yield f
+    else:
+        with open(output_file, 'wt') as f:
+            yield f
 
 def generate_output(data, format='table', output_file=None, indent_size=4):
+    # Writes data, a list or a generator of records, as records arrive.
+    # Nothing but the current record is kept in memory, except for tables
+    # which need every row to size their columns, see __write_table.
     if format == 'json':
-        if output_file:
-            with open(output_file, 'wt') as f:
-                if isinstance(data, types.GeneratorType):
-                    data = list(data)
-                json.dump(data, f, indent=indent_size, sort_keys=True, default=str)
-        else:
-            # Print output to STDOUT
-            if isinstance(data, types.GeneratorType):
-                data = list(data)
-            print(json.dumps(data, indent=indent_size, sort_keys=True, default=str))
+        with __open_output(output_file) as f:
+            __write_json(data, f, indent_size)
+            if not output_file:
+                f.write('\n')
+    elif format == 'jsonl':
+        with __open_output(output_file) as f:
+            __write_jsonl(data, f)
     elif format == 'csv':
-        if output_file:
-            with open(output_file, 'wb') as f:
-                writer = csv.DictWriter(f, fieldnames=data[0].keys())
-                writer.writeheader()
-                for d in data:
-                    writer.writerow(d)
-        else:
-            writer = csv.DictWriter(sys.stdout, fieldnames=data[0].keys())
+        with __open_output(output_file, csv_mode=True) as f:
+            __write_csv(data, f)
+    else:
+        with __open_output(output_file) as f:
+            __write_table(data, f)
+
+def __write_json(data, f, indent_size=4):
+    # Writes the same text as json.dump(list(data), f, indent=indent_size,
+    # sort_keys=True, default=str), one element at a time.
+    encoder = json.JSONEncoder(indent=indent_size, sort_keys=True, default=str)
+    indent = '\n' + ' '*indent_size
+
+    empty = True
+    for record in data:
+        f.write(('[' if empty else encoder.item_separator) + indent)
+        # JSON strings never contain a raw newline, so every newline in the
+        # encoded record starts a line to be indented one level deeper.
+        f.write(encoder.encode(record).replace('\n', indent))
+        empty = False
+
+    f.write('[]' if empty else '\n]')
+
+def __write_jsonl(data, f):
+    # JSON Lines: one compact record per line.
+    for record in data:
+        f.write(json.dumps(record, sort_keys=True, default=str))
+        f.write('\n')
+
+def __write_csv(data, f):
+    # Columns are the keys of the first record.
+    writer = None
+    for record in data:
+        if writer is None:
+            writer = csv.DictWriter(f, fieldnames=list(record.keys()))
             writer.writeheader()
-            for d in data:
-                writer.writerow(d)
+        writer.writerow(record)
 
+def format_table_cells(record, headers):
+    return [str(record.get(h, '')) for h in headers]
+
+def table_widths(headers):
+    # Initial column widths, widened by measure_table_cells.
+    return [max(len(h), TABLE_MIN_WIDTH) for h in headers]
+
+def measure_table_cells(cells, widths):
+    for n, cell in enumerate(cells):
+        if len(cell) > widths[n]:
+            widths[n] = len(cell)
+    return cells
+
+def format_table_line(cells, widths):
+    return '|' + ''.join(' {:>{width}.{width}s} |'.format(cell, width=width) for cell, width in zip(cells, widths)) + '\n'
+
+def format_table_separator(widths):
+    return '+' + ''.join('-'*(width+2) + '+' for width in widths) + '\n'
+
+def __write_table(data, f):
+    # Columns are sized to their widest value, which needs two passes over
+    # the rows. Rows of a list are formatted twice; rows of a generator are
+    # formatted once and spilled to a temporary file in the first pass, so
+    # memory does not grow with the number of rows.
+    rows = iter(data)
+    first = next(rows, None)
+    if first is None:
+        return
+    if not isinstance(first, dict):
+        raise NotImplementedError()
+
+    headers = list(first.keys())
+    widths = table_widths(headers)
+
+    if isinstance(data, list):
+        for record in data:
+            measure_table_cells(format_table_cells(record, headers), widths)
+        formatted_rows = (format_table_cells(record, headers) for record in data)
+        spill = None
     else:
-        if isinstance(data, types.GeneratorType) or isinstance(data, list):
-            __print_table_from_list(data, indent_size)
-        else:
-            raise NotImplementedError()
-
-def __print_table_from_list(data, indent_size=4):
-    headers = None
-    if isinstance(data, types.GeneratorType):
-        d = data.next()
-        if isinstance(d, dict):
-            headers = d.keys()
-    elif isinstance(data, list):
-        d = data[0]
-        if isinstance(d, dict):
-            headers = d.keys()
-    
-    data_width = [len(str(x)) if len(str(x)) > 12 else 12 for x in [d[y] for y in headers]]
-    header_width = [len(x) for x in headers]
-    
-    col_width = [max(x,y) for x,y in zip(data_width, header_width)]
-    columns = zip(headers, col_width)
-    
-    line = '|'
-    separator = '+'
-    for c in columns: 
-        line = line + ' {:>{width}.{width}s} |'.format(c[0], width=c[1])
-        separator = separator + '-'*(c[1]+2) + '+'
-
-    print(separator)
-    print(line)
-    print(separator)
-
-    line = '|'
-
-    if isinstance(data, types.GeneratorType):
-        for c in columns: 
-            line = line + ' {:>{width}.{width}s} |'.format(str(d[c[0]]), width=c[1])
-        print(line)
-
-    for d in data:
-        line = '|'
-        for c in columns: 
-            line = line + ' {:>{width}.{width}s} |'.format(str(d[c[0]]), width=c[1])
-        print(line)
-    
-    print(separator)    
+        spill = tempfile.TemporaryFile('w+')
+        for record in itertools.chain([first], rows):
+            spill.write(json.dumps(measure_table_cells(format_table_cells(record, headers), widths)))
+            spill.write('\n')
+        spill.seek(0)
+        formatted_rows = (to_native_str(json.loads(line)) for line in spill)
+
+    separator = format_table_separator(widths)
+
+    try:
+        f.write(separator)
+        f.write(format_table_line(headers, widths))
+        f.write(separator)
+        for cells in formatted_rows:
+            f.write(format_table_line(cells, widths))
+        f.write(separator)
+    finally:
+        if spill is not None:
+            spill.close()
@@ -0,0 +1,137 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+from __future__ import print_function, absolute_import
+
+import os
+import time
+import subprocess
+import threading
+
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+from .profile import profiler, profile_iter
+
+def stream_lines(command):
+    # Yields the output of command line by line while the process is running.
+    # Raises CalledProcessError after the last line if the command failed.
+    # With --profile, time spent waiting for output is counted in a stage
+    # named after the command, e.g. 'sacct'.
+    start = time.time()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+
+    finished = False
+    read_bytes = 0
+    read_lines = 0
+    try:
+        for line in profile_iter(os.path.basename(command[0]), iter(process.stdout.readline, '')):
+            read_bytes += len(line)
+            read_lines += 1
+            yield line.rstrip('\r\n')
+        finished = True
+    finally:
+        process.stdout.close()
+        if not finished and process.poll() is None:
+            # Consumer stopped early, e.g. generator closed or KeyboardInterrupt
+            process.kill()
+        retcode = process.wait()
+
+        if profiler.enabled:
+            profiler.add(os.path.basename(command[0]), bytes=read_bytes)
+            profiler.record_command(command, start, time.time() - start, read_bytes, lines=read_lines, returncode=retcode)
+
+    if retcode:
+        raise subprocess.CalledProcessError(retcode, command)
+
+class CommandPool(object):
+    """Runs functions that call external commands on a bounded thread pool.
+
+    Commands started through `check_output` are killed if the consumer of
+    `imap` stops early, e.g. on KeyboardInterrupt.
+    """
+
+    # Seconds between checks for a finished result. Waiting with a timeout
+    # keeps the main thread responsive to Ctrl-C on Python 2.
+    WAIT_INTERVAL = 0.5
+
+    def __init__(self, workers=1):
+        if workers < 1:
+            raise ValueError('workers must be at least 1')
+
+        self.workers = workers
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._cancelled = False
+
+    def check_output(self, command):
+        start = time.time()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+
+        with self._lock:
+            if self._cancelled:
+                process.kill()
+            self._processes.add(process)
+
+        try:
+            output, _ = process.communicate()
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+        if profiler.enabled:
+            # Commands run concurrently, so their latency is only recorded per
+            # command and not as stage time.
+            profiler.add(os.path.basename(command[0]), calls=1, bytes=len(output or ''))
+            profiler.record_command(command, start, time.time() - start, len(output or ''), lines=(output or '').count('\n'), returncode=process.returncode)
+
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command, output)
+
+        return output
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            for process in self._processes:
+                if process.poll() is None:
+                    process.kill()
+
+    def imap(self, func, iterable):
+        # Yields (item, func(item)) in the order of iterable while up to
+        # `workers` calls are running concurrently.
+        pool = ThreadPool(self.workers)
+        finished = False
+
+        try:
+            tasks = [(item, pool.apply_async(func, (item,))) for item in iterable]
+            for item, task in tasks:
+                while not task.ready():
+                    task.wait(CommandPool.WAIT_INTERVAL)
+                yield item, task.get()
+            finished = True
+        finally:
+            if finished:
+                pool.close()
+            else:
+                self.cancel()
+                pool.terminate()
+            pool.join()
+
+# Seconds process_map waits for its results. Waiting with a timeout keeps the
+# main process responsive to Ctrl-C on Python 2.
+PROCESS_MAP_TIMEOUT = 365*24*3600
+
+def process_map(func, items, workers=1):
+    # Returns [func(item) for item in items] computed by `workers` worker
+    # processes. func must be a module-level function, and items and results
+    # are pickled, so they should be compact, e.g. strings and arrays.
+    pool = Pool(workers)
+    try:
+        results = pool.map_async(func, items, chunksize=1).get(PROCESS_MAP_TIMEOUT)
+        pool.close()
+        return results
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
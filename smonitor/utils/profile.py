@@ -0,0 +1,233 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# Pipeline instrumentation for --profile and --trace.
+#
+# Stages are timed with `stage` around a block or `profile_iter` around the
+# lazy iterators the pipeline is built from, e.g. sacct lines -> parsed
+# records -> preprocessed jobs. Time is attributed to the innermost stage, so
+# the time of a stage excludes the stages it consumes. Instrumentation is a
+# no-op until `profiler.enable()` is called.
+from __future__ import print_function, absolute_import
+
+import os
+import sys
+import json
+import time
+import resource
+import threading
+
+from collections import OrderedDict
+
+def _cpu_time():
+    # User and system CPU time of the process, including all threads.
+    t = os.times()
+    return t[0] + t[1]
+
+def _max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# Fields of the per-stage counters.
+CALLS, ROWS, BYTES, WALL, CPU, MAX_RSS_KB = range(6)
+
+class _NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _Stage(object):
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.state = self.profiler.thread_state()
+        self.counters = self.state.counters(self.name)
+        self.counters[CALLS] += 1
+        self.state.enter()
+        return self
+
+    def __exit__(self, *exc):
+        self.state.exit(self.counters)
+        self.counters[MAX_RSS_KB] = max(self.counters[MAX_RSS_KB], _max_rss_kb())
+        return False
+
+class _ThreadState(object):
+    # Stage counters and the stack of running stages of one thread. Each
+    # frame holds the start wall and CPU time and the wall and CPU time of
+    # nested stages.
+
+    def __init__(self):
+        self.stack = []
+        self.stages = OrderedDict()
+
+    def counters(self, name):
+        if name not in self.stages:
+            self.stages[name] = [0, 0, 0, 0.0, 0.0, 0]
+        return self.stages[name]
+
+    def enter(self):
+        self.stack.append([time.time(), _cpu_time(), 0.0, 0.0])
+
+    def exit(self, counters, rows=0):
+        frame = self.stack.pop()
+        wall = time.time() - frame[0]
+        cpu = _cpu_time() - frame[1]
+
+        if self.stack:
+            parent = self.stack[-1]
+            parent[2] += wall
+            parent[3] += cpu
+
+        counters[ROWS] += rows
+        counters[WALL] += wall - frame[2]
+        counters[CPU] += cpu - frame[3]
+
+class Profiler(object):
+    """Collects wall and CPU time, rows, bytes and peak RSS per stage, and
+    every external command run with its latency.
+
+    Wall and CPU time of a stage are self times: time spent in nested stages
+    is counted in those stages only. Counters are kept per thread and merged
+    by `summary`. CPU time is process-wide, so stages running in worker
+    threads share it.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.start_time = None
+        self.start_cpu_time = None
+        self.commands = []
+        self._states = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self):
+        self.enabled = True
+        self.start_time = time.time()
+        self.start_cpu_time = _cpu_time()
+
+    def thread_state(self):
+        state = getattr(self._local, 'state', None)
+        if state is None:
+            state = self._local.state = _ThreadState()
+            with self._lock:
+                self._states.append(state)
+        return state
+
+    def add(self, name, calls=0, rows=0, bytes=0):
+        counters = self.thread_state().counters(name)
+        counters[CALLS] += calls
+        counters[ROWS] += rows
+        counters[BYTES] += bytes
+
+    def record_command(self, command, start, latency, bytes, lines=None, returncode=None):
+        with self._lock:
+            self.commands.append({
+                'command': list(command),
+                'start': start - self.start_time,
+                'latency': latency,
+                'bytes': bytes,
+                'lines': lines,
+                'returncode': returncode
+            })
+
+    def stages(self):
+        stages = OrderedDict()
+        with self._lock:
+            states = list(self._states)
+
+        for state in states:
+            for name, counters in list(state.stages.items()):
+                stage = stages.setdefault(name, {'name': name, 'calls': 0, 'rows': 0, 'bytes': 0, 'wall': 0.0, 'cpu': 0.0, 'max_rss_kb': 0})
+                stage['calls'] += counters[CALLS]
+                stage['rows'] += counters[ROWS]
+                stage['bytes'] += counters[BYTES]
+                stage['wall'] += counters[WALL]
+                stage['cpu'] += counters[CPU]
+                stage['max_rss_kb'] = max(stage['max_rss_kb'], counters[MAX_RSS_KB])
+
+        return list(stages.values())
+
+    def summary(self):
+        with self._lock:
+            commands = sorted(self.commands, key=lambda c: c['start'])
+
+        return {
+            'wall': time.time() - self.start_time,
+            'cpu': _cpu_time() - self.start_cpu_time,
+            'max_rss_kb': _max_rss_kb(),
+            'stages': self.stages(),
+            'commands': commands
+        }
+
+    def report(self, file=sys.stderr):
+        summary = self.summary()
+
+        print('{:>12} {:>7} {:>10} {:>12} {:>9} {:>9} {:>11}'.format('stage', 'calls', 'rows', 'bytes', 'wall(s)', 'cpu(s)', 'maxrss(MB)'), file=file)
+        for stage in summary['stages']:
+            print('{:>12} {:>7} {:>10} {:>12} {:>9.3f} {:>9.3f} {:>11}'.format(
+                stage['name'],
+                stage['calls'],
+                stage['rows'],
+                stage['bytes'],
+                stage['wall'],
+                stage['cpu'],
+                '{:.1f}'.format(stage['max_rss_kb'] / 1024.0) if stage['max_rss_kb'] else '-'
+            ), file=file)
+        print('{:>12} {:>7} {:>10} {:>12} {:>9.3f} {:>9.3f} {:>11.1f}'.format('total', '', '', '', summary['wall'], summary['cpu'], summary['max_rss_kb'] / 1024.0), file=file)
+
+        commands = summary['commands']
+        if commands:
+            slowest = max(commands, key=lambda c: c['latency'])
+            print('{} commands, {:.3f} s total latency, slowest {:.3f} s: {}'.format(
+                len(commands), sum(c['latency'] for c in commands), slowest['latency'], ' '.join(slowest['command'])), file=file)
+
+    def write_trace(self, path, argv=None):
+        trace = self.summary()
+        trace['argv'] = argv if argv is not None else sys.argv
+        with open(path, 'w') as f:
+            json.dump(trace, f, indent=4, sort_keys=True)
+
+profiler = Profiler()
+
+def stage(name):
+    # Context manager timing a block as stage `name`.
+    if not profiler.enabled:
+        return _NullStage()
+    return _Stage(profiler, name)
+
+def add(name, calls=0, rows=0, bytes=0):
+    if profiler.enabled:
+        profiler.add(name, calls=calls, rows=rows, bytes=bytes)
+
+def __profile_iter(name, iterable):
+    # The iterator must be consumed by the thread that started it.
+    state = profiler.thread_state()
+    counters = state.counters(name)
+    counters[CALLS] += 1
+
+    iterator = iter(iterable)
+    try:
+        while True:
+            state.enter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                state.exit(counters)
+                return
+            except BaseException:
+                state.exit(counters)
+                raise
+            state.exit(counters, rows=1)
+            yield item
+    finally:
+        counters[MAX_RSS_KB] = max(counters[MAX_RSS_KB], _max_rss_kb())
+
+def profile_iter(name, iterable):
+    # Times the items of iterable as stage `name`, one row per item. Returns
+    # iterable unchanged when profiling is disabled.
+    if not profiler.enabled:
+        return iterable
+    return __profile_iter(name, iterable)
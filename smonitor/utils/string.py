@@ -4,9 +4,27 @@ from __future__ import print_function
 
 import re
 
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
+
 first_cap_re = re.compile('(.)([A-Z][a-z]+)')
 all_cap_re = re.compile('([a-z0-9])([A-Z])')
 
 def to_snake_case(val):
     s1 = first_cap_re.sub(r'\1_\2', val)
     return all_cap_re.sub(r'\1_\2', s1).lower()
+
+def to_native_str(val):
+    # Converts unicode strings returned by json on Python 2 to str, including
+    # strings inside dicts and lists. Values are returned unchanged on Python 3.
+    if text_type is str:
+        return val
+    if isinstance(val, text_type):
+        return val.encode('utf-8')
+    if isinstance(val, dict):
+        return {to_native_str(k):to_native_str(v) for k,v in val.items()}
+    if isinstance(val, list):
+        return [to_native_str(v) for v in val]
+    return val
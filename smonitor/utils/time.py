@@ -2,12 +2,69 @@
 #
 from __future__ import print_function
 
+import re
+
+from bisect import bisect_right
 from collections import namedtuple
 from datetime import datetime, timedelta
 
 
 TimeSpan = namedtuple('TimeSpan', ['start','end'])
 
+duration_regex = re.compile(r'((?P<day>\d+)-)?(?P<hr>\d+):(?P<min>\d+):(?P<sec>\d+)')
+
+def parse_timestamp(val):
+    # Parses a sacct timestamp 'YYYY-MM-DDTHH:MM:SS'. Returns None for other
+    # values such as 'Unknown'. Timestamps in the fixed format are sliced
+    # instead of going through strptime.
+    try:
+        if len(val) == 19 and val[4] == '-' and val[7] == '-' and val[10] == 'T' and val[13] == ':' and val[16] == ':':
+            return datetime(int(val[0:4]), int(val[5:7]), int(val[8:10]), int(val[11:13]), int(val[14:16]), int(val[17:19]))
+        return datetime.strptime(val, '%Y-%m-%dT%H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+
+def parse_duration(val):
+    # Returns the seconds of a sacct duration '[D-]HH:MM:SS' as a float, or
+    # 0.0 if val is not a duration.
+    try:
+        days, _, hms = val.rpartition('-')
+        hours, minutes, seconds = hms.split(':')
+        return float((int(days) if days else 0)*86400 + int(hours)*3600 + int(minutes)*60 + int(seconds))
+    except (AttributeError, ValueError):
+        pass
+
+    # Slower path for durations with a suffix, e.g. fractions of seconds.
+    match = duration_regex.match(val) if isinstance(val, str) else None
+    if not match:
+        return 0.0
+    return timedelta(
+        days = int(match.group('day')) if match.group('day') else 0,
+        hours = int(match.group('hr')),
+        minutes = int(match.group('min')),
+        seconds = int(match.group('sec'))
+    ).total_seconds()
+
+class SpanIndex(object):
+    """Finds the span containing a timestamp by binary search over span starts.
+
+    Spans must be sorted and non-overlapping, as generated by `date_range`.
+    """
+
+    def __init__(self, spans):
+        self.spans = list(spans)
+        self._starts = [s.start for s in self.spans]
+
+    def __len__(self):
+        return len(self.spans)
+
+    def find(self, date):
+        # Returns the index of the span where start <= date < end, or None.
+        n = bisect_right(self._starts, date) - 1
+        if n >= 0 and date < self.spans[n].end:
+            return n
+        return None
+
 def date_range(start_date, end_date, freq='day'):
     
     # Factor for timedelta in days
@@ -17,6 +74,10 @@ def date_range(start_date, end_date, freq='day'):
     if freq == None:
         yield TimeSpan(start_date, end_date)
 
+    elif freq == 'hour':
+        for n in range(int((end_date - start_date).total_seconds() // 3600)):
+            yield TimeSpan(start_date + timedelta(hours=n), start_date + timedelta(hours=n+1))
+
     elif freq == 'day':
         for n in range(int((end_date - start_date).days)):
             yield TimeSpan(start_date + timedelta(days=n*delta_factor), start_date + timedelta(days=(n+1)*delta_factor))
@@ -24,7 +85,7 @@ def date_range(start_date, end_date, freq='day'):
     elif freq == 'week':
         week_begin = start_date - timedelta(days=start_date.weekday())
         week_end = end_date - timedelta(days=end_date.weekday()) + timedelta(days=7)
-        week_count = (week_end - week_begin).days / 7
+        week_count = (week_end - week_begin).days // 7
 
         for n in range(week_count):
             if n == 0:
@@ -52,7 +113,7 @@ def date_range(start_date, end_date, freq='day'):
 
         for n in range(month_count):
             c_month =  ((month_begin.month + n - 1) % 12) + 1
-            c_year = (month_begin.year) + ((month_begin.month + n - 1) / 12)
+            c_year = (month_begin.year) + ((month_begin.month + n - 1) // 12)
             
             if n == 0:
                 n_year = month_begin.year if month_begin.month < 12 else month_begin.year + 1
@@ -66,7 +127,7 @@ def date_range(start_date, end_date, freq='day'):
                 yield TimeSpan(datetime(year=c_year, month=c_month, day=1), end_date)
             else:
                 n_month =  ((month_begin.month + n) % 12) + 1
-                n_year = (month_begin.year) + ((month_begin.month + n) / 12)
+                n_year = (month_begin.year) + ((month_begin.month + n) // 12)
 
                 yield TimeSpan(datetime(year=c_year, month=c_month, day=1), datetime(year=n_year, month=n_month, day=1))
 
@@ -82,6 +143,6 @@ def date_range(start_date, end_date, freq='day'):
             elif n == year_count-1:
                 yield TimeSpan(datetime(year=start_date.year+n, month=1, day=1), end_date)
             else:
-                yield TimeSpan(datetime(year=start_date.year+n, month=1, day=1), datetime(year=month_begin.year+n+1, month=1, day=1))
+                yield TimeSpan(datetime(year=start_date.year+n, month=1, day=1), datetime(year=start_date.year+n+1, month=1, day=1))
     else:
-        raise ValueError('Invalid span value. Valid values: day, week, month, year')
+        raise ValueError('Invalid span value. Valid values: hour, day, week, month, year')
@@ -0,0 +1,199 @@
+# Copyright (c) 2019 Putt Sakdhnagool <putt.sakdhnagool@nectec.or.th>,
+#
+# `smonitor watch`: polls squeue or scontrol and shows the queue or the nodes
+# as a table that is updated in place.
+#
+# Every poll is diffed against the previous snapshot. On a terminal only the
+# table lines that differ from the lines on screen are redrawn; otherwise,
+# e.g. when piped to a file, only the added, removed and changed rows are
+# written. The poll interval doubles while nothing changes, up to
+# max_interval, so idle watchers put little load on slurmctld.
+from __future__ import print_function
+
+import os
+import sys
+import time
+import random
+import subprocess
+
+from collections import OrderedDict
+from datetime import datetime
+
+from .config import WATCH_INTERVAL, WATCH_MAX_INTERVAL
+from .utils.io import table_widths, measure_table_cells, format_table_line, format_table_separator
+from .utils.string import to_snake_case
+
+JOB_COLUMNS = ['job_id', 'partition', 'name', 'user', 'account', 'state', 'start_time', 'nodes', 'cpus', 'node_list']
+NODE_COLUMNS = ['node_name', 'state', 'cpu_alloc', 'cpu_tot', 'partitions']
+
+# Poll intervals vary by up to this fraction so watchers started together
+# do not poll at the same time.
+WATCH_JITTER = 0.1
+
+CLEAR_SCREEN = '\x1b[H\x1b[2J'
+CLEAR_LINE = '\x1b[K'
+
+def poll_jobs(account_list=None):
+    from .slurm.squeue import stream_squeue
+    return list(stream_squeue(account_list=account_list))
+
+def poll_nodes(account_list=None):
+    from .slurm.scontrol import query_scontrol
+    return [{to_snake_case(k):v for k,v in node.items()} for node in query_scontrol('node', oneliner=True)]
+
+# View name: (columns, key column, poll function)
+VIEWS = {
+    'jobs': (JOB_COLUMNS, 'job_id', poll_jobs),
+    'nodes': (NODE_COLUMNS, 'node_name', poll_nodes),
+}
+
+def __row_order(key):
+    # Numeric job IDs in numeric order, array and het job IDs after them.
+    try:
+        return (0, int(key), '')
+    except (TypeError, ValueError):
+        return (1, 0, str(key))
+
+def take_snapshot(rows, columns, key):
+    # Returns {key: cells} in key order, cells formatted as in table output.
+    snapshot = OrderedDict()
+    for row in sorted(rows, key=lambda row: __row_order(row.get(key))):
+        snapshot[row.get(key)] = tuple('' if row.get(c) is None else str(row.get(c)) for c in columns)
+    return snapshot
+
+def diff_snapshots(previous, current):
+    # Returns the keys of added, removed and changed rows.
+    if previous is None:
+        return list(current), [], []
+
+    added = [k for k in current if k not in previous]
+    removed = [k for k in previous if k not in current]
+    changed = [k for k in current if k in previous and current[k] != previous[k]]
+    return added, removed, changed
+
+def next_interval(interval, base_interval, max_interval, changed):
+    if changed:
+        return base_interval
+    return min(interval * 2, max_interval)
+
+def terminal_size():
+    # Returns (columns, lines) of the terminal.
+    try:
+        from shutil import get_terminal_size
+    except ImportError:
+        return int(os.environ.get('COLUMNS', 80)), int(os.environ.get('LINES', 24))
+    size = get_terminal_size()
+    return size.columns, size.lines
+
+class TerminalView(object):
+    """Table on a terminal, updated in place.
+
+    Keeps the lines on screen and rewrites only the lines that differ, so a
+    poll that changes a few jobs redraws a few lines. Columns only grow; a
+    wider column redraws the whole table once.
+    """
+
+    def __init__(self, out, columns):
+        self.out = out
+        self.columns = columns
+        self.widths = table_widths(columns)
+        self.lines = None
+
+    def __lines(self, status, snapshot):
+        separator = format_table_separator(self.widths)
+        lines = [status, separator, format_table_line(self.columns, self.widths), separator]
+        lines += [format_table_line(cells, self.widths) for cells in snapshot.values()]
+        lines.append(separator)
+
+        width, height = terminal_size()
+        if len(lines) > height - 1:
+            hidden = len(lines) - (height - 2)
+            lines = lines[:height - 2] + ['... {} more rows'.format(hidden)]
+        # Wrapped lines would move every line below them.
+        return [line.rstrip('\n')[:width - 1] for line in lines]
+
+    def update(self, status, snapshot, previous, changed=True):
+        widths = list(self.widths)
+        for cells in snapshot.values():
+            measure_table_cells(cells, widths)
+
+        if self.lines is None or widths != self.widths:
+            self.widths = widths
+            self.lines = []
+            self.out.write(CLEAR_SCREEN)
+
+        lines = self.__lines(status, snapshot)
+        for n, line in enumerate(lines):
+            if n >= len(self.lines) or self.lines[n] != line:
+                self.out.write('\x1b[{};1H{}{}'.format(n + 1, line, CLEAR_LINE))
+        for n in range(len(lines), len(self.lines)):
+            self.out.write('\x1b[{};1H{}'.format(n + 1, CLEAR_LINE))
+        self.out.write('\x1b[{};1H'.format(len(lines) + 1))
+        self.out.flush()
+        self.lines = lines
+
+class DeltaView(object):
+    # Writes the rows of the first snapshot, then only rows added (+),
+    # removed (-) or changed (~) by each poll.
+
+    def __init__(self, out, columns):
+        self.out = out
+        self.columns = columns
+        self.widths = table_widths(columns)
+        self.header = False
+
+    def update(self, status, snapshot, previous, changed=True):
+        # changed: whether the status is worth a line, e.g. a failed poll.
+        added, removed, changed_rows = diff_snapshots(previous, snapshot)
+        for cells in snapshot.values():
+            measure_table_cells(cells, self.widths)
+
+        if not self.header:
+            self.out.write('  ' + format_table_line(self.columns, self.widths))
+            self.header = True
+
+        if changed:
+            self.out.write('# {}\n'.format(status))
+        for k in removed:
+            self.out.write('- ' + format_table_line(previous[k], self.widths))
+        for k in added:
+            self.out.write('+ ' + format_table_line(snapshot[k], self.widths))
+        for k in changed_rows:
+            self.out.write('~ ' + format_table_line(snapshot[k], self.widths))
+        self.out.flush()
+
+def watch(view='jobs', account_list=None, interval=WATCH_INTERVAL, max_interval=WATCH_MAX_INTERVAL, out=None, polls=None):
+    # Polls until interrupted, or `polls` times.
+    out = out if out else sys.stdout
+    columns, key, poll = VIEWS[view]
+    display = TerminalView(out, columns) if out.isatty() else DeltaView(out, columns)
+
+    previous = None
+    delay = interval
+    n = 0
+    try:
+        while polls is None or n < polls:
+            n += 1
+            try:
+                snapshot = take_snapshot(poll(account_list), columns, key)
+                error = None
+            except (OSError, subprocess.CalledProcessError) as e:
+                snapshot = previous if previous is not None else OrderedDict()
+                error = e
+
+            added, removed, changed = diff_snapshots(previous, snapshot)
+            changed_rows = bool(added or removed or changed)
+            delay = next_interval(delay, interval, max_interval, error is None and changed_rows)
+
+            status = '{} {}: {} rows, {} added, {} removed, {} changed, next poll in {} s'.format(
+                datetime.now().strftime('%Y-%m-%dT%H:%M:%S'), view, len(snapshot), len(added) if previous is not None else 0, len(removed), len(changed), delay)
+            if error is not None:
+                status = '{} {}: poll failed: {}, next poll in {} s'.format(datetime.now().strftime('%Y-%m-%dT%H:%M:%S'), view, error, delay)
+
+            display.update(status, snapshot, previous, changed=changed_rows or error is not None)
+            previous = snapshot
+
+            if polls is None or n < polls:
+                time.sleep(delay * random.uniform(1 - WATCH_JITTER, 1 + WATCH_JITTER))
+    except KeyboardInterrupt:
+        pass